@@ -36,3 +36,16 @@ class InconsistentObservation(SensorWarning):
     """Message payload makes no sense: throw away observation"""
 
     pass
+
+
+class MissingAnswer(SensorWarning):
+    """Command not answered before the deadline: throw away observation"""
+
+    pass
+
+
+def read_capture(*args, **kwargs):
+    """Observations from a capture file, as columns, see pms.sensor.capture"""
+    from pms.sensor.capture import read_capture
+
+    return read_capture(*args, **kwargs)
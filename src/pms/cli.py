@@ -1,20 +1,31 @@
 from enum import Enum
-from typing import Optional
+from pathlib import Path
+from typing import List, Optional, Union
 
 from typer import Typer, Context, Option, echo, Exit
 
 from pms import logger, __doc__, __version__
-from pms.sensor import SensorReader
-from pms.sensor.cli import serial, csv
-from pms.service.cli import influxdb, mqtt, bridge
+from pms.pipeline import Pipeline, Stage
+from pms.pipeline.calibration import Calibration
+from pms.pipeline.dedup import Deduplicate
+from pms.pipeline.qc import Action, QualityControl
+from pms.sensor import Sensor, SensorReader, MessageReader
+from pms.sensor.cli import serial, csv, simulate, bus
+from pms.service.cli import influxdb, mqtt, bridge, fanout, benchmark, fleet, http
 
 
 main = Typer(help=__doc__)
 main.command()(serial)
 main.command()(csv)
+main.command()(simulate)
+main.command()(bus)
 main.command()(influxdb)
 main.command()(mqtt)
 main.command()(bridge)
+main.command()(fanout)
+main.command()(benchmark)
+main.command()(fleet)
+main.command()(http)
 
 
 class Supported(str, Enum):
@@ -46,10 +57,31 @@ def callback(
     port: str = Option("/dev/ttyUSB0", "--serial-port", "-s", help="serial port"),
     seconds: int = Option(60, "--interval", "-i", help="seconds to wait between updates"),
     samples: Optional[int] = Option(None, "--samples", "-n", help="stop after N samples"),
+    duty_cycle: bool = Option(False, "--duty-cycle", help="sleep sensor between samples"),
+    follow: Optional[Path] = Option(None, help="decode messages appended to a capture file"),
+    dedup: bool = Option(False, "--dedup", help="drop repeated observations, report gaps"),
+    qc: Optional[Action] = Option(None, "--qc", help="flag or drop suspect observations"),
+    calibration: Optional[Path] = Option(None, help="correct observations, coefficients file"),
+    location: str = Option("", help="sensor location, for calibration", show_default=False),
+    serial: str = Option("", "--serial-number", help="for calibration", show_default=False),
     debug: bool = Option(False, "--debug", help="print DEBUG/logging messages"),
     version: Optional[bool] = Option(None, "--version", callback=version_callback),
 ):
     """Read serial sensor"""
     if debug:  # pragma: no cover
         logger.setLevel("DEBUG")
-    ctx.obj = {"reader": SensorReader(model, port, seconds, samples)}
+    reader: Union[SensorReader, MessageReader]
+    if follow:
+        # resume from the last row read by a previous run
+        checkpoint = follow.with_name(f"{follow.name}.offset")
+        reader = MessageReader(follow, Sensor[model], samples, follow=True, checkpoint=checkpoint)
+    else:
+        reader = SensorReader(model, port, seconds, samples, duty_cycle)
+    stages: List[Stage] = []
+    if dedup:
+        stages.append(Deduplicate(model, location))
+    if qc:
+        stages.append(QualityControl(model, action=qc))
+    if calibration:
+        stages.append(Calibration.load(calibration).stage(model, serial=serial, location=location))
+    ctx.obj = {"reader": Pipeline(reader, *stages) if stages else reader}
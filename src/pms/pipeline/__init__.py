@@ -0,0 +1,65 @@
+"""
+Processing stages for observation streams
+
+A stage takes an observation and returns the processed observation,
+or None to drop it from the stream.
+Pipeline wraps a reader, so the commands see processed observations
+and raw messages pass through untouched.
+"""
+
+from typing import Callable, Generator, Optional, overload
+
+from pms.sensor.base import ObsData
+from pms.sensor.reader import RawData
+
+Stage = Callable[[ObsData], Optional[ObsData]]
+
+
+class Pipeline:
+    """Apply processing stages to the observations from a reader
+
+    >>> with Pipeline(SensorReader(), Calibration.load(path).stage("PMSx003")) as reader:
+    >>>     for obs in reader():
+    >>>         ...
+    """
+
+    def __init__(self, reader, *stages: Stage) -> None:
+        self.reader = reader
+        self.stages = list(stages)
+
+    def __getattr__(self, name: str):
+        """reader attributes, e.g. sensor and samples"""
+        return getattr(self.reader, name)
+
+    def __enter__(self) -> "Pipeline":
+        self.reader.__enter__()
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback) -> None:
+        self.reader.__exit__(exception_type, exception_value, traceback)
+
+    def process(self, obs: ObsData) -> Optional[ObsData]:
+        """apply every stage, stop when a stage drops the observation"""
+        for stage in self.stages:
+            processed = stage(obs)
+            if processed is None:
+                return None
+            obs = processed
+        return obs
+
+    @overload
+    def __call__(self) -> Generator[ObsData, None, None]:
+        pass
+
+    @overload
+    def __call__(self, *, raw: bool) -> Generator[RawData, None, None]:
+        pass
+
+    def __call__(self, *, raw: Optional[bool] = None):
+        if raw:
+            yield from self.reader(raw=True)
+            return
+        for obs in self.reader():
+            processed = self.process(obs)
+            if processed is not None:
+                yield processed
@@ -0,0 +1,211 @@
+"""
+Calibration and humidity correction of PM observations
+
+Coefficients are read from a JSON file with one entry per sensor model,
+serial number or location, e.g.
+
+    [
+        {"sensor": "PMSx003", "pm25": [0, 0.52], "kappa": 0.4},
+        {"sensor": "PMSx003", "location": "roof", "pm25": [-1.1, 0.48, 0.002]},
+        {"sensor": "HPMA115S0", "serial": "A1", "device_cf": 120, "pm25": [0.5, 0.9]}
+    ]
+
+- field: polynomial coefficients, lowest power first, e.g. [offset, slope]
+- kappa: hygroscopic growth parameter for the humidity correction
+- device_cf: Honeywell customer adjustment coefficient set with `write_cf`,
+  the sensor already multiplied its PM measurements by device_cf/100
+
+Entries for a serial number take precedence over entries for a location,
+and those over the entry for the sensor model.
+
+Corrections are applied in order
+1. undo the device adjustment coefficient
+2. humidity correction (Crilley et al., 2018)
+     pm / (1 + kappa/1.65 * aw/(1 - aw)),  aw = rhum/100
+   with the relative humidity [%] from the observation itself (MCU680/PMS5003ST/PMS5003T),
+   or from co-located sensors via Correction.update_humidity
+3. calibration polynomial, fields without coefficients are left as they are
+
+The device adjustment and the humidity correction apply to every PM field of the sensor,
+whether the field has polynomial coefficients or not.
+
+Batches of observations are corrected column-wise, with numpy when available.
+"""
+
+import json
+from copy import copy
+from dataclasses import fields
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+try:
+    import numpy
+except ModuleNotFoundError:  # pragma: no cover
+    numpy = None  # type: ignore
+
+from pms import logger
+from pms.sensor import Sensor
+from pms.sensor.base import ObsData
+
+# largest water activity (rhum/100) for the humidity correction, growth diverges at saturation
+AW_MAX = 0.99
+# density of dry particles [g/cm3]
+DENSITY = 1.65
+# polynomial for fields without calibration coefficients
+IDENTITY = (0.0, 1.0)
+
+
+class Coefficients(NamedTuple):
+    """Correction coefficients for one sensor"""
+
+    fields: Dict[str, Tuple[float, ...]]  # polynomial coefficients, lowest power first
+    kappa: float = 0
+    device_cf: int = 100
+
+    @property
+    def humidity(self) -> bool:
+        """humidity correction needed"""
+        return self.kappa > 0
+
+
+def polynomial(coefficients: Sequence[float], x: Any) -> Any:
+    """evaluate polynomial by Horner's method, x can be a number or a numpy array"""
+    y = 0 * x
+    for c in reversed(coefficients):
+        y = y * x + c
+    return y
+
+
+def growth(kappa: float, rhum: Any) -> Any:
+    """hygroscopic growth factor, rhum can be a number or a numpy array"""
+    if numpy is not None and isinstance(rhum, numpy.ndarray):
+        aw = numpy.clip(rhum / 100, 0, AW_MAX)
+    else:
+        aw = min(max(rhum / 100, 0), AW_MAX)
+    return 1 + kappa / DENSITY * aw / (1 - aw)
+
+
+class Correction:
+    """Correct observations from a single sensor
+
+    >>> correct = Calibration.load(path).stage("PMSx003", location="roof")
+    >>> obs = correct(obs)
+    """
+
+    def __init__(self, coefficients: Coefficients, pm: Sequence[str] = ()) -> None:
+        self.coefficients = coefficients
+        self.scale = 100 / coefficients.device_cf
+        self.rhum: Optional[float] = None  # latest co-located relative humidity [%]
+        # fields to correct: with polynomial coefficients, and the PM fields
+        # when there is a device adjustment or humidity correction
+        names = list(coefficients.fields)
+        if self.scale != 1 or coefficients.humidity:
+            names += [name for name in pm if name not in coefficients.fields]
+        self.names: Tuple[str, ...] = tuple(names)
+
+    def update_humidity(self, obs: ObsData) -> None:
+        """relative humidity from a co-located sensor"""
+        rhum = getattr(obs, "rhum", None)
+        if rhum is not None:
+            self.rhum = rhum
+
+    def _rhum(self, obs: ObsData) -> Optional[float]:
+        return getattr(obs, "rhum", self.rhum)
+
+    def correct(self, name: str, value: Any, rhum: Any = None) -> Any:
+        """corrected field value, value/rhum can be numbers or numpy arrays
+
+        device adjustment and humidity correction apply only to PM fields
+        """
+        coefficients = self.coefficients
+        if name.startswith("pm"):
+            if self.scale != 1:
+                value = value * self.scale
+            if coefficients.humidity and rhum is not None:
+                value = value / growth(coefficients.kappa, rhum)
+        return polynomial(coefficients.fields.get(name, IDENTITY), value)
+
+    def __call__(self, obs: ObsData) -> ObsData:
+        rhum = self._rhum(obs)
+        if rhum is None and self.coefficients.humidity:
+            logger.debug(f"no humidity for {type(obs).__module__} correction")
+        # copy and set, dataclasses.replace would run the unit conversions on __post_init__ again
+        obs = copy(obs)
+        for name in self.names:
+            setattr(obs, name, self.correct(name, getattr(obs, name), rhum))
+        return obs
+
+    def batch(self, observations: Sequence[ObsData]) -> List[ObsData]:
+        """correct many observations at once, column by column"""
+        if not observations:
+            return []
+        rhum = [self._rhum(obs) for obs in observations]
+        humidity = self.coefficients.humidity and None not in rhum
+        columns = {}
+        for name in self.names:
+            column = [getattr(obs, name) for obs in observations]
+            if numpy is not None:
+                x = numpy.asarray(column, dtype=float)
+                r = numpy.asarray(rhum, dtype=float) if humidity else None
+                columns[name] = self.correct(name, x, r).tolist()
+            elif humidity:
+                columns[name] = [self.correct(name, x, r) for x, r in zip(column, rhum)]
+            else:
+                columns[name] = [self.correct(name, x) for x in column]
+
+        corrected = []
+        for n, obs in enumerate(observations):
+            obs = copy(obs)
+            for name, column in columns.items():
+                setattr(obs, name, column[n])
+            corrected.append(obs)
+        return corrected
+
+
+class Calibration:
+    """Coefficient table, keyed by sensor model and serial number or location"""
+
+    def __init__(self, entries: Sequence[Dict[str, Any]]) -> None:
+        self.table: Dict[Tuple[str, str, str], Coefficients] = {}
+        for entry in entries:
+            entry = dict(entry)
+            key = (entry.pop("sensor"), entry.pop("serial", ""), entry.pop("location", ""))
+            assert not (key[1] and key[2]), f"entry for serial and location: {key}"
+            kappa = entry.pop("kappa", 0)
+            device_cf = entry.pop("device_cf", 100)
+            assert 30 <= device_cf <= 200, f"device_cf out of range: 30 <= {device_cf} <= 200"
+            self.table[key] = Coefficients(
+                {name: tuple(coefficients) for name, coefficients in entry.items()},
+                kappa,
+                device_cf,
+            )
+
+    @classmethod
+    def load(cls, path: Path) -> "Calibration":
+        logger.debug(f"calibration coefficients from {path}")
+        with path.open() as f:
+            return cls(json.load(f))
+
+    def coefficients(
+        self, sensor: str, *, serial: str = "", location: str = ""
+    ) -> Optional[Coefficients]:
+        """most specific coefficients for a sensor: by serial number, location or model"""
+        keys = [(sensor, serial, "")] if serial else []
+        if location:
+            keys.append((sensor, "", location))
+        keys.append((sensor, "", ""))
+        for key in keys:
+            if key in self.table:
+                return self.table[key]
+        return None
+
+    def stage(self, sensor: str, *, serial: str = "", location: str = "") -> Correction:
+        """correction stage for a sensor, without coefficients observations pass unchanged"""
+        coefficients = self.coefficients(sensor, serial=serial, location=location)
+        if coefficients is None:
+            logger.warning(f"no calibration coefficients for {sensor}")
+            coefficients = Coefficients({})
+        names = [field.name for field in fields(Sensor[sensor].Data)]
+        unknown = set(coefficients.fields) - set(names)
+        assert not unknown, f"unknown {sensor} fields: {', '.join(sorted(unknown))}"
+        return Correction(coefficients, [name for name in names if name.startswith("pm")])
@@ -0,0 +1,128 @@
+"""
+Drop repeated observations and report gaps in the series
+
+Overlapping captures replayed with `serial --decode`, or retained MQTT messages delivered
+again by the server after a reconnect, repeat observations that were already written.
+- repeats: observations are keyed by series and time, e.g. (sensor, location, time),
+  and the keys of the last `size` observations are kept on a bounded LRU window,
+  so a repeat is dropped in constant time and memory
+- gaps: the expected sampling interval of every series, given or learned as the shortest
+  interval seen so far, and a gap is reported when the next observation comes later than
+  `tolerance` intervals. Late observations, older than the last one, fill holes and do not
+  report gaps.
+
+All fields on an observation share its time, so observation keys are field keys as well.
+Streams with one field per message (the MQTT bridge) add the field to the series, and key
+on the value too, as the bridge times messages on arrival with a 1 s resolution.
+"""
+
+from collections import Counter, OrderedDict, deque
+from typing import Deque, Dict, Hashable, NamedTuple, Optional, Tuple
+
+from pms import logger
+from pms.sensor.base import ObsData
+
+Series = Tuple[str, ...]
+
+
+class Window:
+    """Keys seen lately, the last `size` keys are remembered"""
+
+    def __init__(self, size: int) -> None:
+        assert size > 0, f"window out of range: {size} <= 0"
+        self.size = size
+        self.keys: "OrderedDict[Hashable, None]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def seen(self, key: Hashable) -> bool:
+        """True if the key was seen lately, remember it otherwise"""
+        if key in self.keys:
+            self.keys.move_to_end(key)
+            return True
+        self.keys[key] = None
+        if len(self.keys) > self.size:
+            self.keys.popitem(last=False)
+        return False
+
+
+class Gap(NamedTuple):
+    """Missing observations between start and end"""
+
+    series: Series
+    start: int
+    end: int
+    interval: float
+
+    @property
+    def missing(self) -> int:
+        return max(round((self.end - self.start) / self.interval) - 1, 1)
+
+    def __str__(self) -> str:
+        return (
+            f"{'/'.join(self.series)} gap: {self.missing} missing from {self.start} to {self.end}"
+        )
+
+
+class Gaps:
+    """Gaps in regularly sampled series"""
+
+    def __init__(self, interval: Optional[float] = None, *, tolerance: float = 1.5) -> None:
+        assert interval is None or interval > 0, f"interval out of range: {interval} <= 0"
+        assert tolerance > 1, f"tolerance out of range: {tolerance} <= 1"
+        self.interval = interval
+        self.tolerance = tolerance
+        self.last: Dict[Series, int] = {}  # time of the last observation by series
+        self.intervals: Dict[Series, float] = {}  # learned intervals
+        self.gaps: Deque[Gap] = deque(maxlen=100)  # latest gaps
+        self.counts: Counter = Counter()  # gaps by series, since the start
+
+    def __call__(self, series: Series, time: int) -> Optional[Gap]:
+        """Gap before the observation, if any"""
+        last = self.last.get(series)
+        if last is None or time <= last:
+            if last is None:
+                self.last[series] = time
+            return None
+        self.last[series] = time
+        delta = time - last
+        interval = self.interval or min(self.intervals.get(series, delta), delta)
+        self.intervals[series] = interval
+        if delta <= self.tolerance * interval:
+            return None
+        gap = Gap(series, last, time, interval)
+        self.gaps.append(gap)
+        self.counts[series] += 1
+        logger.warning(gap)
+        return gap
+
+
+class Deduplicate:
+    """Drop repeated observations from a single sensor, and report gaps
+
+    >>> dedup = Deduplicate("PMSx003", location="test", interval=60)
+    >>> obs = dedup(obs)
+    """
+
+    def __init__(
+        self,
+        sensor: str,
+        location: str = "",
+        *,
+        size: int = 1024,
+        interval: Optional[float] = None,
+        tolerance: float = 1.5,
+    ) -> None:
+        self.series: Series = (sensor, location) if location else (sensor,)
+        self.window = Window(size)
+        self.gaps = Gaps(interval, tolerance=tolerance)
+        self.duplicates = 0  # since the start
+
+    def __call__(self, obs: ObsData) -> Optional[ObsData]:
+        if self.window.seen(obs.time):
+            self.duplicates += 1
+            logger.debug(f"drop repeated obs at {obs.time}")
+            return None
+        self.gaps(self.series, obs.time)
+        return obs
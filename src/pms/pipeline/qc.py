@@ -0,0 +1,185 @@
+"""
+Quality control of PM observations
+
+Every measurement field (the fields with metadata) is checked against
+- range: the valid range for the field units, see RANGES
+- spike: more than `threshold` robust standard deviations (1.4826*MAD) away from
+  the rolling median of the last `window` values (Hampel filter)
+- stuck: the same value `stuck` times in a row, except at the bottom of the range,
+  as clean air reads 0 for long periods
+and the observation against
+- size fractions: pm01 <= pm25 <= pm04 <= pm10 <= pm100, for the fractions present
+
+Flagged observations are dropped (Action.drop), or pass with their flags
+on obs.flags (Action.flag), so the sinks can tell them apart from clean observations.
+Every check keeps a fixed-size state per field. The rolling window is kept sorted,
+so each observation costs O(window) per field, an insertion and a pass for the MAD,
+regardless of how many observations came before.
+"""
+
+from bisect import bisect_left, insort
+from collections import Counter, deque
+from copy import copy
+from dataclasses import fields
+from enum import Enum
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
+
+from pms import logger
+from pms.sensor import Sensor
+from pms.sensor.base import ObsData
+
+# valid range by field units
+RANGES: Dict[str, Tuple[float, float]] = {
+    "ug/m3": (0, 1000),
+    "mg/m3": (0, 2),
+    "°C": (-40, 85),
+    "%": (0, 100),
+    "hPa": (300, 1100),
+    "0-500": (0, 500),
+}
+
+# nested size fractions, smallest first
+FRACTIONS = ("pm01", "pm25", "pm04", "pm10", "pm100")
+
+# MAD to standard deviation, for normally distributed values
+MAD_SCALE = 1.4826
+
+
+class Action(str, Enum):
+    flag = "flag"
+    drop = "drop"
+
+
+class Window:
+    """Rolling median and median absolute deviation of the last `size` values"""
+
+    def __init__(self, size: int) -> None:
+        assert size >= 3, f"window out of range: {size} < 3"
+        self.values: Deque[float] = deque(maxlen=size)
+        self.sorted: List[float] = []
+
+    @property
+    def full(self) -> bool:
+        return len(self.values) == self.values.maxlen
+
+    def push(self, value: float) -> None:
+        if self.full:
+            del self.sorted[bisect_left(self.sorted, self.values[0])]
+        self.values.append(value)
+        insort(self.sorted, value)
+
+    @staticmethod
+    def _median(values: Sequence[float]) -> float:
+        n = len(values)
+        return (values[(n - 1) // 2] + values[n // 2]) / 2
+
+    @property
+    def median(self) -> float:
+        return self._median(self.sorted)
+
+    @property
+    def mad(self) -> float:
+        """deviations from the median in order, walking out from the median, no sort"""
+        values, median = self.sorted, self.median
+        n = len(values)
+        low = bisect_left(values, median) - 1
+        high = low + 1
+        deviations: List[float] = []
+        while len(deviations) <= n // 2:
+            if high >= n or (low >= 0 and median - values[low] <= values[high] - median):
+                deviations.append(median - values[low])
+                low -= 1
+            else:
+                deviations.append(values[high] - median)
+                high += 1
+        return (deviations[(n - 1) // 2] + deviations[n // 2]) / 2
+
+
+class Field:
+    """Per-field QC state"""
+
+    def __init__(self, name: str, valid_range: Tuple[float, float], window: int) -> None:
+        self.name = name
+        self.min, self.max = valid_range
+        self.window = Window(window)
+        self.last: Optional[float] = None
+        self.repeats = 0
+
+    def check(self, value: float, threshold: float, stuck: int, mad_floor: float) -> List[str]:
+        """flags for the new value, and update state"""
+        flags = []
+        if not self.min <= value <= self.max:
+            flags.append("range")
+
+        if self.window.full:
+            mad = max(self.window.mad, mad_floor)
+            if abs(value - self.window.median) > threshold * MAD_SCALE * mad:
+                flags.append("spike")
+        self.window.push(value)
+
+        self.repeats = self.repeats + 1 if value == self.last else 1
+        self.last = value
+        if stuck and self.repeats >= stuck and value > self.min:
+            flags.append("stuck")
+        return flags
+
+
+class QualityControl:
+    """Flag or drop suspect observations from a single sensor
+
+    >>> qc = QualityControl("PMSx003", action=Action.drop)
+    >>> obs = qc(obs)
+    """
+
+    def __init__(
+        self,
+        sensor: str,
+        *,
+        action: Action = Action.flag,
+        window: int = 9,
+        threshold: float = 3.5,
+        stuck: int = 20,
+        mad_floor: float = 1.0,
+        ranges: Optional[Dict[str, Sequence[float]]] = None,
+    ) -> None:
+        self.action = Action(action)
+        self.threshold = threshold
+        self.stuck = stuck
+        self.mad_floor = mad_floor  # smallest MAD, so steady readings do not turn noise into spikes
+        ranges = dict(ranges or {})
+        self.fields: Dict[str, Field] = {}
+        for field in fields(Sensor[sensor].Data):
+            if field.name in ranges:
+                low, high = ranges.pop(field.name)
+                self.fields[field.name] = Field(field.name, (low, high), window)
+            elif field.metadata.get("units") in RANGES:
+                self.fields[field.name] = Field(field.name, RANGES[field.metadata["units"]], window)
+        assert not ranges, f"unknown {sensor} fields: {', '.join(sorted(ranges))}"
+        self.fractions = [name for name in FRACTIONS if name in self.fields]
+        self.flags: List[str] = []  # flags for the last observation, e.g. pm25:spike, pm25>pm10
+        self.counts: Counter = Counter()  # flags since the start
+
+    def check(self, obs: ObsData) -> List[str]:
+        """flags for an observation, as field:check or smaller>larger fraction"""
+        flags = []
+        for name, field in self.fields.items():
+            value = getattr(obs, name)
+            for flag in field.check(value, self.threshold, self.stuck, self.mad_floor):
+                flags.append(f"{name}:{flag}")
+        values = [getattr(obs, name) for name in self.fractions]
+        for small, large, a, b in zip(self.fractions, self.fractions[1:], values, values[1:]):
+            if a > b:
+                flags.append(f"{small}>{large}")
+        return flags
+
+    def __call__(self, obs: ObsData) -> Optional[ObsData]:
+        self.flags = self.check(obs)
+        if not self.flags:
+            return obs
+        self.counts.update(self.flags)
+        logger.debug(f"{self.action.value} obs at {obs.time}: {', '.join(self.flags)}")
+        if self.action == Action.drop:
+            return None
+        obs = copy(obs)  # dataclasses.replace would run the unit conversions again
+        obs.flags = tuple(self.flags)  # type: ignore
+        return obs
@@ -1,2 +1,4 @@
 from .sensor import Sensor
 from .reader import SensorReader, MessageReader
+from .bus import BusReader
+from .capture import read_capture
@@ -1,6 +1,9 @@
 from abc import ABCMeta, abstractmethod
-from dataclasses import dataclass, asdict
-from typing import NamedTuple, Tuple, Dict
+from dataclasses import dataclass, asdict, fields
+from functools import lru_cache
+from operator import attrgetter
+from string import Formatter
+from typing import Any, Callable, ClassVar, NamedTuple, Optional, Tuple, Dict
 from datetime import datetime
 from pms import logger, WrongMessageFormat
 
@@ -26,11 +29,23 @@ class Commands(NamedTuple):
 class Message(metaclass=ABCMeta):
     """
     Base class for serial messages from PM sensors
+
+    The message is split into header, payload and checksum once, on creation.
+    Messages can be bytes or memoryview slices of a larger buffer,
+    so the fields are sliced without copying.
     """
 
+    __slots__ = ("message", "header", "payload", "checksum")
+
+    message: bytes
+    header: bytes
+    payload: bytes
+    checksum: int
+
     def __init__(self, message: bytes) -> None:
         logger.debug(f"message hex: {message.hex()}")
         self.message = message
+        self.header, self.payload, self.checksum = self._split(message)
 
     @classmethod
     def unpack(cls, message: bytes, header: bytes, length: int) -> Tuple[float, ...]:
@@ -39,17 +54,38 @@ class Message(metaclass=ABCMeta):
             msg = cls._validate(message, header, length)
         except WrongMessageFormat as e:
             # search last complete message on buffer
-            start = message.rfind(header, 0, 4 - length)
-            if start < 0:  # No match found
+            last = cls._last_message(bytes(message), header, length)
+            if last is None:  # No match found
                 raise
             # validate last complete message
-            msg = cls._validate(message[start : start + length], header, length)
+            msg = cls._validate(last, header, length)
 
         # data: unpacked payload
         payload = cls._unpack(msg.payload)
         logger.debug(f"message payload: {payload}")
         return payload
 
+    @classmethod
+    def _last_message(cls, message: bytes, header: bytes, length: int) -> Optional[bytes]:
+        """last complete message on buffer, None if not found"""
+        start = message.rfind(header, 0, 4 - length)
+        if start < 0:
+            return None
+        return message[start : start + length]
+
+    @classmethod
+    def frame_length(
+        cls, buffer: bytes, start: int, length: int, end: Optional[int] = None
+    ) -> Optional[int]:
+        """length of the answer on buffer[start:end], None if the answer is incomplete"""
+        end = len(buffer) if end is None else end
+        return length if end - start >= length else None
+
+    @staticmethod
+    def answers(command: bytes, answer: bytes) -> bool:
+        """answer belongs to command, for protocols that echo command codes or addresses"""
+        return True
+
     @classmethod
     def decode(cls, message: bytes, command: Cmd) -> Tuple[float, ...]:
         header = command.answer_header
@@ -62,31 +98,39 @@ class Message(metaclass=ABCMeta):
     def data_records(cls) -> slice:  # pragma: no cover
         pass
 
-    @property
+    @staticmethod
     @abstractmethod
-    def header(self) -> bytes:  # pragma: no cover
+    def _split(message: bytes) -> Tuple[bytes, bytes, int]:  # pragma: no cover
+        """header, payload and checksum, safe on short messages"""
         pass
 
-    @property
+    @classmethod
     @abstractmethod
-    def payload(self) -> bytes:  # pragma: no cover
+    def _validate(
+        self, message: bytes, header: bytes, length: int
+    ) -> "Message":  # pragma: no cover
         pass
 
-    @property
+    @staticmethod
     @abstractmethod
-    def checksum(self) -> int:  # pragma: no cover
+    def _unpack(message: bytes) -> Tuple[float, ...]:  # pragma: no cover
         pass
 
+    @classmethod
+    def encode(cls, records: Tuple[float, ...], command: Cmd) -> bytes:
+        """Answer to command with payload records, inverse of unpack"""
+        return cls._encode(command.answer_header, cls._pack(records))
+
     @classmethod
     @abstractmethod
-    def _validate(
-        self, message: bytes, header: bytes, length: int
-    ) -> "Message":  # pragma: no cover
+    def _encode(cls, header: bytes, payload: bytes) -> bytes:  # pragma: no cover
+        """message from header and payload, with checksum and tail"""
         pass
 
     @staticmethod
     @abstractmethod
-    def _unpack(message: bytes) -> Tuple[float, ...]:  # pragma: no cover
+    def _pack(records: Tuple[float, ...]) -> bytes:  # pragma: no cover
+        """payload from records, inverse of _unpack"""
         pass
 
 
@@ -100,6 +144,27 @@ class ObsData(metaclass=ABCMeta):
 
     time: int
 
+    # quality control flags, e.g. ("pm25:spike",), set on flagged observations by pms.pipeline.qc
+    flags: ClassVar[Tuple[str, ...]] = ()
+
+    # csv row as "{0.field:spec}" replacement fields, compiled once per class by csv_formatter
+    csv_format = "{0.time}"
+
+    def __post_init__(self):
+        self._convert()
+
+    def _convert(self) -> None:
+        """Units conversion, in place
+
+        Fields can be numbers, or numpy arrays with one element per observation (pms.capture),
+        so conversions use array-safe operators.
+        """
+        pass
+
+    def _consistent(self) -> Any:
+        """Consistency check, elementwise on numpy arrays"""
+        return True
+
     @property
     def date(self) -> datetime:
         """measurement time as datetime object"""
@@ -122,10 +187,41 @@ class ObsData(metaclass=ABCMeta):
             f"for object of type '{__name__}.{self.__class__.__name__}'"
         )
 
+    @classmethod
+    @lru_cache(maxsize=None)
+    def csv_header(cls) -> str:
+        """header for csv file"""
+        return ", ".join(field.name for field in fields(cls))
+
+    @classmethod
+    @lru_cache(maxsize=None)
+    def csv_formatter(cls) -> Callable[["ObsData"], str]:
+        """precompiled csv row formatter
+
+        attribute lookups are resolved by a single attrgetter,
+        and the row is rendered by a positional-only template
+        """
+        template, names = "", []
+        for text, name, spec, conversion in Formatter().parse(cls.csv_format):
+            template += text.replace("{", "{{").replace("}", "}}")
+            if name is None:
+                continue
+            assert name.startswith("0."), f"wrong csv field {name!r}"
+            assert not conversion, f"wrong csv field conversion {name!r}!{conversion}"
+            names.append(name[2:])
+            template += f"{{:{spec}}}" if spec else "{}"
+        if len(names) == 1:
+            getter = attrgetter(names[0])
+            return lambda obs: template.format(getter(obs))
+        getters = attrgetter(*names)
+        return lambda obs: template.format(*getters(obs))
+
     @abstractmethod
     def __format__(self, spec: str) -> str:
         if spec == "header":  # header for csv file
-            return ", ".join(asdict(self).keys())
+            return self.csv_header()
+        if spec == "csv":
+            return self.csv_formatter()(self)
         raise ValueError(  # pragma: no cover
             f"Unknown format code '{spec}' "
             f"for object of type '{__name__}.{self.__class__.__name__}'"
@@ -135,6 +231,8 @@ class ObsData(metaclass=ABCMeta):
         return self.__format__("pm")
 
 
-def metadata(long_name: str, units: str, topic: str):
-    """For fields(metadata=metadata(...))"""
-    return dict(long_name=long_name, units=units, topic=topic)
+def metadata(long_name: str, units: str, topic: str, *, scale: int = 1):
+    """For fields(metadata=metadata(...)), fields read as value*scale"""
+    if scale == 1:
+        return dict(long_name=long_name, units=units, topic=topic)
+    return dict(long_name=long_name, units=units, topic=topic, scale=scale)
@@ -9,6 +9,7 @@ import struct
 
 from pms import WrongMessageFormat, WrongMessageChecksum, SensorWarmingUp
 from pms.sensor import base
+from pms.sensor.checksum import SUM8
 
 commands = base.Commands(
     passive_read=base.Cmd(b"\xA5\x56\x01\xFC", b"\x5A\x5A\x3F\x0F", 20),
@@ -22,19 +23,13 @@ commands = base.Commands(
 class Message(base.Message):
     """Messages from mcu680 modules with a BME680 sensor"""
 
-    data_records = slice(7)
-
-    @property
-    def header(self) -> bytes:
-        return self.message[:4]
+    __slots__ = ()
 
-    @property
-    def payload(self) -> bytes:
-        return self.message[4:-1]
+    data_records = slice(7)
 
-    @property
-    def checksum(self) -> int:
-        return self.message[-1]
+    @staticmethod
+    def _split(message: bytes) -> Tuple[bytes, bytes, int]:
+        return message[:4], message[4:-1], int.from_bytes(message[-1:], "big")
 
     @classmethod
     def _validate(cls, message: bytes, header: bytes, length: int) -> base.Message:
@@ -51,10 +46,10 @@ class Message(base.Message):
             raise WrongMessageFormat(f"message header: {msg.header!r}")
         if len(message) != length:
             raise WrongMessageFormat(f"message length: {len(message)}")
-        checksum = (sum(msg.header) + sum(msg.payload)) % 0x100
+        checksum = SUM8(message, 0, length - 1)
         if msg.checksum != checksum:
             raise WrongMessageChecksum(f"message checksum {msg.checksum} != {checksum}")
-        if sum(msg.payload) == 0:
+        if not any(msg.payload):
             raise SensorWarmingUp(f"message empty: warming up sensor")
         return msg
 
@@ -62,6 +57,15 @@ class Message(base.Message):
     def _unpack(message: bytes) -> Tuple[int, ...]:
         return struct.unpack(f">hHHBHLh", message)
 
+    @classmethod
+    def _encode(cls, header: bytes, payload: bytes) -> bytes:
+        message = header + payload
+        return message + bytes([SUM8(message)])
+
+    @staticmethod
+    def _pack(records: Tuple[float, ...]) -> bytes:
+        return struct.pack(f">hHHBHLh", *records)
+
 
 @dataclass(frozen=False)
 class ObsData(base.ObsData):
@@ -90,7 +94,12 @@ class ObsData(base.ObsData):
     gas: int = field(metadata=base.metadata("gas resistance", "kΩ", "resistance"))
     alt: int = field(metadata=base.metadata("altitude estimate", "m(a.s.l.)", "elevation"))
 
-    def __post_init__(self):
+    csv_format = (
+        "{0.time}, {0.temp:.1f}, {0.rhum:.1f}, {0.press:.2f}, "
+        "{0.IAQ_acc}, {0.IAQ}, {0.gas:.1f}, {0.alt}"
+    )
+
+    def _convert(self):
         """Units conversion
         temp [°C]    read in [0.01 °C]
         rhum [%]     read in [1/10 000]
@@ -99,13 +108,14 @@ class ObsData(base.ObsData):
         """
         self.temp /= 100
         self.rhum /= 100
-        self.press = (int(self.pres) << 8 | self.IAQ_acc) / 100
+        pres = self.pres.astype(int) if hasattr(self.pres, "astype") else int(self.pres)  # numpy
+        self.press = (pres << 8 | self.IAQ_acc) / 100
         self.IAQ_acc = self.IAQ >> 4
         self.IAQ &= 0x0FFF
-        self.gas /= 1000
+        self.gas = self.gas / 1000  # not in place, gas is read as int
 
     def __format__(self, spec: str) -> str:
-        if spec == "header":
+        if spec in ["header", "csv"]:
             return super().__format__(spec)
         if spec == "atm":
             return f"{self.date:%F %T}: Temp. {self.temp:.1f} °C, Rel.Hum. {self.rhum:.1f} %, Press {self.press:.2f} hPa"
@@ -113,9 +123,6 @@ class ObsData(base.ObsData):
             return f"{self.date:%F %T}: Temp. {self.temp:.1f} °C, Rel.Hum. {self.rhum:.1f} %, Press {self.press:.2f} hPa, {self.gas:.1f} kΩ"
         if spec == "bsec":
             return f"{self.date:%F %T}: Temp. {self.temp:.1f} °C, Rel.Hum. {self.rhum:.1f} %, Press {self.press:.2f} hPa, {self.IAQ} IAQ"
-        if spec == "csv":
-            return f"{self.time}, {self.temp:.1f}, {self.rhum:.1f}, {self.press:.2f}, {self.IAQ_acc}, {self.IAQ}, {self.gas:.1f}, {self.alt}"
-
         raise ValueError(  # pragma: no cover
             f"Unknown format code '{spec}' "
             f"for object of type '{__name__}.{self.__class__.__name__}'"
@@ -0,0 +1,180 @@
+"""
+Read several NovaFitness sensors on a shared serial line (multi-drop RS-485/UART bus)
+
+Every device is addressed by its 16-bit device ID (extra_commands.addressed),
+and answers carry the device ID on bytes 6-7, so the answers are demultiplexed by device.
+Devices are polled round-robin, one passive_read at a time, as devices on a shared line
+would collide if they answered at the same time. Adapters that serialize the answers
+can poll every device at once (pipelined=True).
+
+Observations are tagged with the device ID, and samples counts polling rounds.
+Devices that do not answer the setup are left out of the polling rounds,
+and their setup is retried every `rescan` rounds, so a missing device does not
+cost a timeout on every round.
+"""
+
+import sys
+import time
+from typing import Generator, List, NamedTuple, Optional, Sequence, Union
+
+from serial import Serial
+
+from pms import logger, SensorWarning, MissingAnswer
+from pms.sensor.base import ObsData
+from pms.sensor.novafitness.extra_commands import addressed
+from pms.sensor.reader import RawData
+from pms.sensor.sensor import Sensor
+from pms.sensor.transaction import Transport
+
+# sensors with device ID addressing
+NOVAFITNESS = (Sensor.SDS01x, Sensor.SDS198)
+
+
+class Tagged(NamedTuple):
+    """observation, or raw message, from a device on the bus"""
+
+    device: int
+    data: Union[ObsData, RawData]
+
+    @property
+    def id(self) -> str:
+        """device ID as printed on the sensor label"""
+        return f"{self.device:04X}"
+
+
+class BusReader:
+    """Poll several NovaFitness sensors on one serial port
+
+    >>> with BusReader("SDS01x", "/dev/ttyUSB0", [0xA001, 0xA002], interval=60) as reader:
+    >>>     for tagged in reader():
+    >>>         print(f"{tagged.id}: {tagged.data:pm}")
+    """
+
+    poll_timeout = 1.0  # seconds to wait for each answer
+    poll_retries = 1  # retries for unanswered commands, opt-in as poll_timeout is short
+    warmup_poll = 1.0  # seconds between polls while every device warms up
+    rescan = 10  # polling rounds between setup retries for missing devices, 0 to never retry
+
+    def __init__(
+        self,
+        sensor: str = "SDS01x",
+        port: str = "/dev/ttyUSB0",
+        devices: Sequence[int] = (),
+        interval: Optional[int] = None,
+        samples: Optional[int] = None,
+        *,
+        pipelined: bool = False,
+    ) -> None:
+        """Configure serial port"""
+        self.sensor = Sensor[sensor]
+        assert self.sensor in NOVAFITNESS, f"no device ID on {sensor}"
+        assert devices, "no devices"
+        for device in devices:
+            assert 0 <= device < 0xFFFF, f"device id out of range: 0 <= {device} < 0xFFFF"
+        self.serial = Serial()
+        self.serial.port = port
+        self.serial.baudrate = self.sensor.baud
+        self.serial.timeout = self.poll_timeout
+        self.devices = list(devices)
+        self.active: List[int] = []  # devices found on the setup, polled every round
+        self.interval = interval
+        self.samples = samples
+        self.pipelined = pipelined
+        self.transport = Transport(self.serial, self.sensor, retries=self.poll_retries)
+        logger.debug(
+            f"capture {samples if samples else '?'} {sensor} obs from {len(devices)} devices "
+            f"on {port} every {interval if interval else '?'} secs"
+        )
+
+    def _poll(self, name: str, devices: Sequence[int]) -> List[Optional[bytes]]:
+        """Send command to every device, and return the answers by device"""
+        commands = [addressed(self.sensor.command(name), device) for device in devices]
+        if self.pipelined:
+            return self.transport.pipeline(commands)
+        answers: List[Optional[bytes]] = []
+        for cmd in commands:
+            try:
+                # keep a copy, the next request reuses the receive buffer
+                answers.append(bytes(self.transport.request(cmd)))
+            except MissingAnswer:
+                answers.append(None)
+        return answers
+
+    def __enter__(self) -> "BusReader":
+        """Open serial port and setup every device"""
+        if not self.serial.is_open:
+            logger.debug(f"open {self.serial.port}")
+            self.serial.open()
+        self.transport.serial = self.serial  # the port could have been replaced, e.g. simulator
+        self.transport.reset()
+
+        self.active = []
+        self._setup(self.devices)
+        for device in self.devices:
+            if device not in self.active:
+                logger.warning(f"no {self.sensor.name} with device ID {device:04X}")
+        if not self.active:
+            logger.error(f"No {self.sensor.name} on {self.serial.port}")
+            sys.exit(1)
+        return self
+
+    def _setup(self, devices: Sequence[int]) -> None:
+        """Wake devices and set passive mode, add the devices that answer to the polling rounds"""
+        logger.debug(f"wake {len(devices)} {self.sensor.name}")
+        self._poll("wake", devices)
+        found = {
+            device
+            for device, answer in zip(devices, self._poll("passive_mode", devices))
+            if answer is not None and self.sensor.check(answer, "passive_mode")
+        }
+        for device in found.difference(self.active):
+            logger.debug(f"found {self.sensor.name} with device ID {device:04X}")
+        found.update(self.active)
+        self.active = [device for device in self.devices if device in found]
+
+    def __exit__(self, exception_type, exception_value, traceback) -> None:
+        """Put every device to sleep and close serial port"""
+        logger.debug(f"sleep {len(self.active)} {self.sensor.name}")
+        self._poll("sleep", self.active)
+        logger.debug(f"close {self.serial.port}")
+        self.serial.close()
+
+    def __call__(self, *, raw: Optional[bool] = None) -> Generator[Tagged, None, None]:
+        """Poll every device at regular intervals"""
+        rounds = 0
+        while self.serial.is_open:
+            try:
+                rounds += 1
+                missing = [device for device in self.devices if device not in self.active]
+                if missing and self.rescan and rounds % self.rescan == 0:
+                    self._setup(missing)
+                start = time.time()
+                now = self.sensor.now()
+                valid = False
+                active = self.active
+                for device, answer in zip(active, self._poll("passive_read", active)):
+                    if answer is None:
+                        logger.debug(f"no answer from {device:04X}")
+                        continue
+                    try:
+                        obs = self.sensor.decode(answer, time=now)
+                    except SensorWarning as e:
+                        logger.debug(f"{device:04X}: {e}")
+                        continue
+                    valid = True
+                    yield Tagged(device, RawData(now, bytes(answer)) if raw else obs)
+
+                if not valid:
+                    time.sleep(self.warmup_poll)
+                    continue
+                if self.samples:
+                    self.samples -= 1
+                    if self.samples <= 0:
+                        break
+                if self.interval:
+                    delay = self.interval - (time.time() - start)
+                    if delay > 0:
+                        time.sleep(delay)
+            except KeyboardInterrupt:
+                print()
+                break
@@ -0,0 +1,131 @@
+"""
+Decode captured messages into columns, for analysis
+
+    >>> obs = read_capture(Path("pypms.csv"), "PMSx003")
+    >>> obs["pm25"].mean()
+    >>> df = read_capture(Path("pypms.csv"), "PMSx003", dataframe=True)
+
+Messages from sensors described by a spec.Message are validated and unpacked in one batch,
+other messages one by one, but no ObsData is created per message.
+The records go straight into typed columns, one per ObsData field,
+and the unit conversions from ObsData._convert run once on the whole columns.
+Messages that do not decode, e.g. while the sensor warms up, are skipped,
+as are inconsistent observations.
+
+Compressed capture files are decompressed as they are read.
+numpy is required, and pandas for DataFrames (pip install pypms[analysis]).
+"""
+
+from csv import reader
+from dataclasses import fields
+from io import TextIOWrapper
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+try:
+    import numpy
+except ModuleNotFoundError:  # pragma: no cover
+    numpy = None  # type: ignore
+
+try:
+    import pandas
+except ModuleNotFoundError:  # pragma: no cover
+    pandas = None  # type: ignore
+
+from pms import logger, SensorWarning
+from pms.sensor import spec
+from pms.sensor.compression import Compression
+from pms.sensor.sensor import Sensor
+
+
+def units(sensor: str) -> Dict[str, str]:
+    """column units, from the ObsData field metadata"""
+    units = {"time": "s"}
+    for field in fields(Sensor[sensor].Data):
+        if "units" in field.metadata:
+            units[field.name] = field.metadata["units"]
+    return units
+
+
+def read_capture(
+    path: Path, sensor: str = "PMSx003", *, samples: Optional[int] = None, dataframe: bool = False
+) -> Any:
+    """Observations from a capture file, as a numpy structured array or a pandas DataFrame"""
+    if numpy is None:  # pragma: no cover
+        raise ModuleNotFoundError("read_capture requires numpy")
+    if dataframe and pandas is None:  # pragma: no cover
+        raise ModuleNotFoundError("read_capture(dataframe=True) requires pandas")
+
+    model = Sensor[sensor]
+    Message: Any = model.Message
+    command = model.Commands.passive_read
+    times: List[int] = []
+    messages: List[bytes] = []
+    logger.debug(f"decode {sensor} messages from {path}")
+    with path.open("rb") as raw, TextIOWrapper(Compression.detect(raw).open(raw, "rb")) as f:
+        rows = reader(f, skipinitialspace=True)
+        header = next(rows)
+        time_col, sensor_col, hex_col = (header.index(name) for name in ("time", "sensor", "hex"))
+        for row in rows:
+            if row[sensor_col] != sensor:
+                continue
+            times.append(int(row[time_col]))
+            messages.append(bytes.fromhex(row[hex_col]))
+
+    Data = model.Data
+    data_fields = fields(Data)[1:]
+    columns = numpy.zeros((len(messages), len(data_fields)), dtype="float64")
+    valid = numpy.zeros(len(messages), dtype=bool)
+
+    # complete messages from declarative specs, in one batch
+    single = numpy.arange(len(messages))
+    length = command.answer_length
+    if issubclass(Message, spec.Message):
+        batch = numpy.array([len(message) == length for message in messages], dtype=bool)
+        single = numpy.flatnonzero(~batch)
+        if batch.any():
+            frames = b"".join(message for message in messages if len(message) == length)
+            records = Message.unpack_batch(frames, length)[:, Message.data_records]
+            columns[batch] = records
+            valid[batch] = Message.validate_batch(frames, command.answer_header, length)
+
+    # everything else, one by one
+    for n in single:
+        try:
+            columns[n] = Message.decode(messages[n], command)
+        except SensorWarning:
+            continue
+        valid[n] = True
+
+    if not valid.all():
+        logger.debug(f"skipped {(~valid).sum()} {sensor} messages")
+    index = numpy.flatnonzero(valid)
+
+    # one typed column per field, without running ObsData.__init__
+    obs = object.__new__(Data)  # type: ignore
+    obs.time = numpy.array(times, dtype="int64")[index]
+    columns = columns[index]
+    for n, field in enumerate(data_fields):
+        dtype = "int64" if field.type is int else "float64"
+        setattr(obs, field.name, columns[:, n].astype(dtype))
+    obs._convert()
+
+    # fields, and values derived by _convert, e.g. MCU680 press
+    data = {name: value for name, value in vars(obs).items() if isinstance(value, numpy.ndarray)}
+    consistent = numpy.broadcast_to(obs._consistent(), obs.time.shape)
+    if not consistent.all():
+        logger.debug(f"skipped {(~consistent).sum()} inconsistent {sensor} observations")
+        data = {name: value[consistent] for name, value in data.items()}
+
+    # count samples only after every check, like the streaming reader
+    if samples:
+        data = {name: value[:samples] for name, value in data.items()}
+
+    if dataframe:
+        df = pandas.DataFrame(data)
+        df.attrs["units"] = units(sensor)
+        return df
+    array = numpy.empty(len(data["time"]), dtype=[(name, v.dtype) for name, v in data.items()])
+    for name, value in data.items():
+        array[name] = value
+    return array
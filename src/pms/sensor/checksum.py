@@ -0,0 +1,86 @@
+"""
+Checksum kernels shared by the sensor families
+
+Every family checksums a contiguous range of the frame, and differs only on the last step
+- SUM16: Plantower, header and payload sum, 16b
+- SUM8:  NovaFitness (payload) and MCU680 (header and payload), sum mod 256
+- NEG8:  Honeywell, two's complement of the header and payload sum, 8b
+- INV8:  Senserion SHDLC, one's complement of the frame sum, 8b
+
+Kernels take the whole frame, bytes or memoryview, and the range to sum,
+so callers do not split the frame to checksum it.
+Kernel.batch checksums many fixed-length frames at once, e.g. when replaying captures,
+with numpy when available.
+"""
+
+import struct
+from typing import Any, Dict, List, Optional, Union
+
+try:
+    import numpy
+except ModuleNotFoundError:  # pragma: no cover
+    numpy = None  # type: ignore
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+def total(data: Buffer, start: int = 0, stop: Optional[int] = None) -> int:
+    """sum of data[start:stop]"""
+    if not isinstance(data, memoryview):
+        return sum(data[start:stop])
+    # unpack the range in place, iterating over a memoryview is slow and tobytes copies
+    length = len(data)
+    start = start + length if start < 0 else start
+    stop = length if stop is None else stop + length if stop < 0 else min(stop, length)
+    size = max(stop - start, 0)
+    try:
+        unpack = _unpack[size]
+    except KeyError:
+        unpack = _unpack[size] = struct.Struct(f"{size}B").unpack_from
+    return sum(unpack(data, start))
+
+
+_unpack: Dict[int, Any] = {}  # by range length
+
+
+class Kernel:
+    """Checksum of data[start:stop]"""
+
+    __slots__ = ("name", "mask", "negate", "invert")
+
+    def __init__(self, name: str, mask: int, *, negate: bool = False, invert: bool = False):
+        self.name = name
+        self.mask = mask
+        self.negate = negate
+        self.invert = invert
+
+    def __repr__(self) -> str:
+        return f"Kernel({self.name})"
+
+    def finish(self, value: Any) -> Any:
+        """checksum from the byte sum, value can be a number or a numpy array"""
+        if self.negate:
+            value = -value
+        elif self.invert:
+            value = ~value
+        return value & self.mask
+
+    def __call__(self, data: Buffer, start: int = 0, stop: Optional[int] = None) -> int:
+        return self.finish(total(data, start, stop))
+
+    def batch(self, frames: Buffer, length: int, start: int = 0, stop: Optional[int] = None) -> Any:
+        """checksums of consecutive `length` byte frames, as a numpy array when available"""
+        assert len(frames) % length == 0, f"partial frame: {len(frames)} % {length} != 0"
+        stop = length if stop is None else stop % length if stop < 0 else stop
+        if numpy is not None:
+            rows = numpy.frombuffer(frames, dtype=numpy.uint8).reshape(-1, length)
+            return self.finish(rows[:, start:stop].sum(axis=1, dtype=numpy.int64))
+        data = bytes(frames)
+        totals: List[int] = [sum(data[n + start : n + stop]) for n in range(0, len(data), length)]
+        return [self.finish(total) for total in totals]
+
+
+SUM16 = Kernel("sum16", 0xFFFF)
+SUM8 = Kernel("sum8", 0xFF)
+NEG8 = Kernel("neg8", 0xFF, negate=True)
+INV8 = Kernel("inv8", 0xFF, invert=True)
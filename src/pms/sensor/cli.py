@@ -1,12 +1,19 @@
+import time
+from contextlib import ExitStack
+from copy import deepcopy
 from enum import Enum
 from datetime import datetime
 from pathlib import Path
 
-from typing import Optional
-from typer import Context, Option, Argument, echo
+from typing import List, Optional, Union
+from typer import BadParameter, Context, Option, Argument, echo
 
 from pms import logger
-from pms.sensor import MessageReader
+from pms.pipeline import Pipeline
+from pms.sensor import BusReader, MessageReader
+from pms.sensor.compression import Compression
+from pms.sensor.reader import hexdump
+from pms.service.csvfile import CSVFile, Rotation
 
 
 class Format(str, Enum):
@@ -30,11 +37,13 @@ def serial(
     """Read sensor and print measurements"""
     reader = ctx.obj["reader"]
     if decode:
-        reader = MessageReader(decode, reader.sensor, reader.samples)
+        messages = MessageReader(decode, reader.sensor, reader.samples)
+        reader = Pipeline(messages, *reader.stages) if isinstance(reader, Pipeline) else messages
     with reader:
         if format == "hexdump":
-            for n, raw in enumerate(reader(raw=True)):
-                echo(raw.hexdump(n))
+            # live messages are echoed as they come, captured messages on large blocks
+            for block in hexdump(reader(raw=True), lines=1024 if decode else 1):
+                echo(block, nl=False)
         elif format:
             if format == "csv":
                 obs = next(reader())
@@ -50,27 +59,143 @@ def csv(
     ctx: Context,
     capture: bool = Option(False, "--capture", help="write raw messages instead of observations"),
     overwrite: bool = Option(False, "--overwrite", help="overwrite file, if already exists"),
+    flush_every: int = Option(1, "--flush-every", help="write to file every N rows"),
+    fsync_every: int = Option(0, "--fsync-every", help="force write to disk every N rows"),
+    rotate: Rotation = Option(Rotation.none, "--rotate", help="start new file daily or by size"),
+    max_bytes: int = Option(10_000_000, "--max-bytes", help="file size for --rotate size"),
+    compress: Compression = Option(Compression.none, "--compress", help="compress file"),
+    flags: bool = Option(False, "--flags", help="add a column with the --qc flags"),
     path: Path = Argument(Path(), help="csv formatted file", show_default=False),
 ):
     """Read sensor and print measurements"""
-    if path.is_dir():  # pragma: no cover
+    if path.is_dir() and rotate != Rotation.daily:  # pragma: no cover
         path /= f"{datetime.now():%F}_pypms.csv"
-    mode = "w" if overwrite else "a"
-    logger.debug(f"open {path} on '{mode}' mode")
-    with ctx.obj["reader"] as reader, path.open(mode) as csv:
+    with ctx.obj["reader"] as reader:
         sensor_name = reader.sensor.name
-        if not capture:
-            logger.debug(f"capture {sensor_name} observations to {path}")
-            # add header to new files
-            if path.stat().st_size == 0:
-                obs = next(reader())
-                csv.write(f"{obs:header}\n")
-            for obs in reader():
-                csv.write(f"{obs:csv}\n")
-        else:
-            logger.debug(f"capture {sensor_name} messages to {path}")
-            # add header to new files
-            if path.stat().st_size == 0:
-                csv.write("time,sensor,hex\n")
-            for raw in reader(raw=True):
-                csv.write(f"{raw.time},{sensor_name},{raw.hex}\n")
+        with CSVFile(
+            path,
+            capture=sensor_name if capture else None,
+            overwrite=overwrite,
+            flush_every=flush_every,
+            fsync_every=fsync_every,
+            rotate=rotate,
+            max_bytes=max_bytes,
+            compression=compress,
+            flags=flags,
+        ) as csv:
+            if not capture:
+                logger.debug(f"capture {sensor_name} observations to {path}")
+                # add header to new files
+                if csv.empty:
+                    csv.header(next(reader()))
+                for obs in reader():
+                    csv(obs)
+            else:
+                logger.debug(f"capture {sensor_name} messages to {path}")
+                for raw in reader(raw=True):
+                    csv(raw)
+
+
+def simulate(
+    ctx: Context,
+    count: int = Option(1, "--count", help="number of simulated sensors"),
+    period: float = Option(1.0, help="seconds between active mode messages"),
+    latency: float = Option(0.0, help="seconds before answering a command"),
+    level: float = Option(10.0, help="mean measurement"),
+    noise: float = Option(0.1, help="relative measurement noise"),
+    checksum: float = Option(0.0, help="probability of a wrong checksum"),
+    truncated: float = Option(0.0, help="probability of a truncated message"),
+    warmup: float = Option(0.0, help="probability of an empty message"),
+    capture: Optional[Path] = Option(None, "--replay", help="replay captured messages"),
+    speed: float = Option(1.0, help="replay speed factor"),
+    duration: float = Option(0.0, help="stop after N seconds [default: until interrupted]"),
+    devices: List[str] = Option([], "--device", help="NovaFitness device ID on a shared line"),
+):
+    """Simulate sensors on pseudo-terminals"""
+    # pseudo-terminals are POSIX only, import on demand so `pms` still runs on Windows
+    from pms.sensor.simulator import Fault, PseudoTerminal, SimulatedBus, SimulatedSensor
+
+    sensor = ctx.obj["reader"].sensor
+    faults = {Fault.checksum: checksum, Fault.truncated: truncated, Fault.warmup: warmup}
+    ids: List[Optional[int]] = [None]
+    if devices:
+        ids = list(_device_ids(devices))
+    with ExitStack() as stack:
+        for n in range(count):
+            simulated = [
+                SimulatedSensor(
+                    sensor,
+                    level=level,
+                    noise=noise,
+                    faults={fault: p for fault, p in faults.items() if p > 0},
+                    period=period,
+                    latency=latency,
+                    capture=capture,
+                    speed=speed,
+                    device=device,
+                )
+                for device in ids
+            ]
+            line: Union[SimulatedSensor, SimulatedBus] = simulated[0]
+            if devices:
+                line = SimulatedBus(simulated)
+            pty = stack.enter_context(PseudoTerminal(line))
+            echo(pty.port)
+        try:
+            if duration:
+                time.sleep(duration)
+            else:  # pragma: no cover
+                while True:
+                    time.sleep(1)
+        except KeyboardInterrupt:  # pragma: no cover
+            pass
+
+
+def _device_ids(devices: List[str]) -> List[int]:
+    """device IDs from hex strings, e.g. A001"""
+    try:
+        return [int(device, 16) for device in devices]
+    except ValueError as e:
+        raise BadParameter(f"device ID: {e}")
+
+
+def bus(
+    ctx: Context,
+    devices: List[str] = Option(..., "--device", "-d", help="device ID, e.g. A001"),
+    format: Format = Option(Format.pm, "--format", "-f", help="formatted output"),
+    pipelined: bool = Option(False, "--pipelined", help="poll every device at once"),
+):
+    """Read several NovaFitness sensors on a shared serial line
+
+    --dedup, --qc and --calibration run on every device separately
+    """
+    reader = ctx.obj["reader"]
+    if format == Format.hex:  # pragma: no cover
+        raise BadParameter("hexdump format not supported on bus")
+    stages = reader.stages if isinstance(reader, Pipeline) else []
+    if isinstance(reader, Pipeline):
+        reader = reader.reader
+    if isinstance(reader, MessageReader):
+        raise BadParameter("--follow not supported on bus")
+    ids = _device_ids(devices)
+    # stages keep state, e.g. the QC windows, so every device gets its own copy
+    pipelines = {device: Pipeline(None, *deepcopy(stages)) for device in ids}
+    with BusReader(
+        reader.sensor.name,
+        reader.serial.port,
+        ids,
+        reader.interval,
+        reader.samples,
+        pipelined=pipelined,
+    ) as bus:
+        header = format == Format.csv
+        for tagged in bus():
+            obs = pipelines[tagged.device].process(tagged.data)  # type: ignore
+            if obs is None:
+                continue
+            tagged = tagged._replace(data=obs)
+            if header:
+                echo(f"device, {tagged.data:header}")
+                header = False
+            sep = ", " if format == Format.csv else ": "
+            echo(f"{tagged.id}{sep}{tagged.data:{format}}")
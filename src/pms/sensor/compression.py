@@ -0,0 +1,94 @@
+"""
+Streaming compression for capture and observation files
+
+- gzip, bz2 and xz (lzma) from the standard library
+- zstd and lz4, optional (pip install pypms[compression])
+
+Files are written and read as a stream, never decompressed as a whole.
+Appending to a compressed file adds a new compressed stream (frame) to the file,
+and all formats read concatenated streams as a single file.
+Compressed files are recognised by their magic number on read, whatever their name.
+"""
+
+import bz2
+import gzip
+import io
+import lzma
+from enum import Enum
+from typing import IO, Dict, Tuple
+
+try:
+    import zstandard
+except ModuleNotFoundError:  # pragma: no cover
+    zstandard = None  # type: ignore
+
+try:
+    import lz4.frame as lz4
+except ModuleNotFoundError:  # pragma: no cover
+    lz4 = None  # type: ignore
+
+
+class Compression(str, Enum):
+    none = "none"
+    gzip = "gzip"
+    bz2 = "bz2"
+    xz = "xz"
+    zstd = "zstd"
+    lz4 = "lz4"
+
+    @property
+    def suffix(self) -> str:
+        """file name suffix, e.g. `.gz`"""
+        return SUFFIX[self.value]
+
+    @classmethod
+    def detect(cls, file: IO[bytes]) -> "Compression":
+        """compression from the magic number at the start of a binary file, none for plain files"""
+        start = file.read(6)
+        file.seek(0)
+        for compression, magic in MAGIC:
+            if start.startswith(magic):
+                return compression
+        return cls.none
+
+    def open(self, raw: IO[bytes], mode: str) -> IO[bytes]:
+        """compressed stream over a binary file, mode: rb, wb or ab"""
+        assert mode in ["rb", "wb", "ab"], f"unsupported mode: {mode}"
+        if self is Compression.none:
+            return raw
+        if self is Compression.gzip:
+            return gzip.GzipFile(fileobj=raw, mode=mode)  # type: ignore
+        if self is Compression.bz2:
+            return bz2.BZ2File(raw, mode)  # type: ignore
+        if self is Compression.xz:
+            return lzma.LZMAFile(raw, mode)  # type: ignore
+        if self is Compression.zstd:
+            if zstandard is None:  # pragma: no cover
+                raise ModuleNotFoundError("zstd compression requires zstandard")
+            if mode == "rb":
+                reader = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+                return io.BufferedReader(reader)  # type: ignore
+            return zstandard.ZstdCompressor().stream_writer(raw, closefd=False)  # type: ignore
+        if lz4 is None:  # pragma: no cover
+            raise ModuleNotFoundError("lz4 compression requires lz4")
+        return lz4.LZ4FrameFile(raw, mode)  # type: ignore
+
+    def flush(self, file: IO[bytes]) -> None:
+        """write the rows compressed so far, except for bz2 and xz,
+        which compress whole blocks and write the rows when a block is full or on close
+        """
+        if self is Compression.zstd:
+            file.flush(zstandard.FLUSH_FRAME)  # type: ignore # a complete frame
+        else:
+            file.flush()
+
+
+SUFFIX: Dict[str, str] = dict(none="", gzip=".gz", bz2=".bz2", xz=".xz", zstd=".zst", lz4=".lz4")
+
+MAGIC: Tuple[Tuple[Compression, bytes], ...] = (
+    (Compression.gzip, b"\x1f\x8b"),
+    (Compression.bz2, b"BZh"),
+    (Compression.xz, b"\xfd7zXZ\x00"),
+    (Compression.zstd, b"\x28\xb5\x2f\xfd"),
+    (Compression.lz4, b"\x04\x22\x4d\x18"),
+)
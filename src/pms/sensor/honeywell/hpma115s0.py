@@ -5,11 +5,8 @@ Honeywell HPMA115S0 sensors
 """
 
 from dataclasses import dataclass, field
-from typing import Tuple
-import struct
 
-from pms import WrongMessageFormat, WrongMessageChecksum, SensorWarmingUp
-from pms.sensor import base
+from pms.sensor import base, spec
 
 commands = base.Commands(
     passive_read=base.Cmd(  # Read Particle Measuring Results
@@ -22,51 +19,17 @@ commands = base.Commands(
 )
 
 
-class Message(base.Message):
+class Message(spec.Message):
     """Messages from Honeywell HPMA115S0 sensors"""
 
-    data_records = slice(2)
-
-    @property
-    def header(self) -> bytes:
-        return self.message[:3]
-
-    @property
-    def payload(self) -> bytes:
-        return self.message[3:-1]
-
-    @property
-    def checksum(self) -> int:
-        return self.message[-1]
-
-    @classmethod
-    def _validate(cls, message: bytes, header: bytes, length: int) -> base.Message:
+    __slots__ = ()
 
-        # consistency check: bug in message singnature
-        assert len(header) == 3, f"wrong header length {len(header)}"
-        assert header[:1] == b"\x40", f"wrong header start {header!r}"
-        assert length in [5, 8, 16], f"wrong payload length {length}"
-
-        # validate message: recoverable errors (throw away observation)
-        msg = cls(message)
-        if msg.header != header:
-            raise WrongMessageFormat(f"message header: {msg.header!r}")
-        if len(message) != length:
-            raise WrongMessageFormat(f"message length: {len(message)} != {length}")
-        checksum = (0x10000 - sum(msg.header) - sum(msg.payload)) % 0x100
-        if msg.checksum != checksum:
-            raise WrongMessageChecksum(f"message checksum {msg.checksum} != {checksum}")
-        if sum(msg.payload) == 0:
-            raise SensorWarmingUp(f"message empty: warming up sensor")
-        return msg
-
-    @staticmethod
-    def _unpack(message: bytes) -> Tuple[int, ...]:
-        return struct.unpack(f">{len(message)//2}H", message)
+    protocol = spec.Protocol(b"\x40", 3, (5, 8, 16), spec.Checksum.neg8, record=">H")
+    data_records = slice(2)
 
 
 @dataclass(frozen=False)
-class ObsData(base.ObsData):
+class ObsData(spec.ObsData):
     """Observations from Honeywell HPMA115S0 sensors
 
     time                                    measurement time [seconds since epoch]
@@ -75,15 +38,3 @@ class ObsData(base.ObsData):
 
     pm25: int = field(metadata=base.metadata("PM2.5", "ug/m3", "concentration"))
     pm10: int = field(metadata=base.metadata("PM10", "ug/m3", "concentration"))
-
-    def __format__(self, spec: str) -> str:
-        if spec == "header":
-            return super().__format__(spec)
-        if spec == "pm":
-            return f"{self.date:%F %T}: PM2.5 {self.pm25:.1f}, PM10 {self.pm10:.1f} ug/m3"
-        if spec == "csv":
-            return f"{self.time}, {self.pm25:.1f}, {self.pm10:.1f}"
-        raise ValueError(  # pragma: no cover
-            f"Unknown format code '{spec}' "
-            f"for object of type '{__name__}.{self.__class__.__name__}'"
-        )
@@ -15,12 +15,21 @@ def _msg(cmd: int, payload: str, device: int = 0xFFFF) -> bytes:
     return bytes.fromhex(f"AA{cmd:02X}{payload}{device:04X}{checksum%0x100:02X}AB")
 
 
+def addressed(cmd: Cmd, device: int) -> Cmd:
+    """Address a command, such as sds01x.commands.passive_read, to a single device
+
+    Commands are sent to every device (0xFFFF) by default, devices on a shared bus
+    answer only to commands with their own device ID (or 0xFFFF)
+    """
+    return Cmd(_msg(cmd.command[1], cmd.command[2:15].hex(), device), *cmd[1:])
+
+
 def write_id(new_id: int, device: int = 0xFFFF) -> Cmd:
     """Protocol V1.3, section 3) Set Device ID
 
     The setting is still effective after power off [Factory default has set a unique ID]
     """
-    return Cmd(_msg(0xB4, f"0500000000000000000000{new_id:02X}", device), b"\xAA\xC0", 10)
+    return Cmd(_msg(0xB4, f"0500000000000000000000{new_id:02X}", device), b"\xAA\xC5", 10)
 
 
 def work_period(minutes: int = 0, device: int = 0xFFFF) -> Cmd:
@@ -34,9 +43,9 @@ def work_period(minutes: int = 0, device: int = 0xFFFF) -> Cmd:
     """
 
     assert 0 <= minutes <= 30, f"minutes out of range: 0 <= {minutes} <= 30"
-    return Cmd(_msg(0xB4, f"0801{minutes:02X}00000000000000000000", device), b"\xAA\xC0", 10)
+    return Cmd(_msg(0xB4, f"0801{minutes:02X}00000000000000000000", device), b"\xAA\xC5", 10)
 
 
 def firmware_version(device: int = 0xFFFF) -> Cmd:
     """Protocol V1.3, 6) Check firmware version"""
-    return Cmd(_msg(0xB4, "07000000000000000000000000", device), b"\xAA\xC0", 10)
+    return Cmd(_msg(0xB4, "07000000000000000000000000", device), b"\xAA\xC5", 10)
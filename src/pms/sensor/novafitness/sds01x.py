@@ -4,11 +4,8 @@ NovaFitness SDS011, SDS018 and SDS021 sensors
 """
 
 from dataclasses import dataclass, field
-from typing import Tuple
-import struct
 
-from pms import WrongMessageFormat, WrongMessageChecksum, SensorWarmingUp
-from pms.sensor import base
+from pms.sensor import base, spec
 
 commands = base.Commands(
     passive_read=base.Cmd(
@@ -39,79 +36,34 @@ commands = base.Commands(
 )
 
 
-class Message(base.Message):
+class Message(spec.Message):
     """Messages from NovaFitness SDS011, SDS018 and SDS021 sensors"""
 
-    data_records = slice(2)
-
-    @property
-    def header(self) -> bytes:
-        return self.message[:2]
-
-    @property
-    def payload(self) -> bytes:
-        return self.message[2:-2]
-
-    @property
-    def checksum(self) -> int:
-        return self.message[-2]
-
-    @property
-    def tail(self) -> int:
-        return self.message[-1]
+    __slots__ = ()
 
-    @classmethod
-    def _validate(cls, message: bytes, header: bytes, length: int) -> base.Message:
-
-        # consistency check: bug in message singnature
-        assert len(header) == 2, f"wrong header length {len(header)}"
-        assert header[:1] == b"\xAA", f"wrong header start {header!r}"
-        assert length == 10, f"wrong payload length {length} != 10"
-
-        # validate message: recoverable errors (throw away observation)
-        msg = cls(message)
-        if msg.header != header:
-            raise WrongMessageFormat(f"message header: {msg.header!r}")
-        if msg.tail != 0xAB:
-            raise WrongMessageFormat(f"message tail: {msg.tail:#x}")
-        if len(message) != length:
-            raise WrongMessageFormat(f"message length: {len(message)}")
-        checksum = sum(msg.payload) % 0x100
-        if msg.checksum != checksum:
-            raise WrongMessageChecksum(f"message checksum {msg.checksum} != {checksum}")
-        if sum(msg.payload[:-2]) == 0:
-            raise SensorWarmingUp(f"message empty: warming up sensor")
-        return msg
+    # payload: records and device ID, checksum over the payload
+    protocol = spec.Protocol(
+        b"\xAA", 2, (10,), spec.Checksum.sum8, tail=b"\xAB", record="<H", data=slice(-2)
+    )
+    data_records = slice(2)
 
     @staticmethod
-    def _unpack(message: bytes) -> Tuple[int, ...]:
-        return struct.unpack(f"<{len(message)//2}H", message)
+    def answers(command: bytes, answer: bytes) -> bool:
+        """answers echo the device ID, and acknowledgements (0xC5) echo the command code"""
+        device = command[15:17]
+        if device != b"\xFF\xFF" and answer[6:8] != device:
+            return False
+        return answer[1] != 0xC5 or answer[2] == command[2]
 
 
 @dataclass(frozen=False)
-class ObsData(base.ObsData):
+class ObsData(spec.ObsData):
     """SDS01x observations
 
     time                                    measurement time [seconds since epoch]
-    raw25, raw10                            PM2.5*10, PM10*10 [ug/m3]
+    pm25, pm10                              PM2.5, PM10 [ug/m3]
     """
 
-    pm25: float = field(metadata=base.metadata("PM2.5", "ug/m3", "concentration"))
-    pm10: float = field(metadata=base.metadata("PM10", "ug/m3", "concentration"))
-
-    def __post_init__(self):
-        """Convert from 0.1 ug/m3 to ug/m3"""
-        self.pm25 /= 10
-        self.pm10 /= 10
-
-    def __format__(self, spec: str) -> str:
-        if spec == "header":
-            return super().__format__(spec)
-        if spec == "pm":
-            return f"{self.date:%F %T}: PM2.5 {self.pm25:.1f}, PM10 {self.pm10:.1f} ug/m3"
-        if spec == "csv":
-            return f"{self.time}, {self.pm25:.1f}, {self.pm10:.1f}"
-        raise ValueError(  # pragma: no cover
-            f"Unknown format code '{spec}' "
-            f"for object of type '{__name__}.{self.__class__.__name__}'"
-        )
+    # read as 10*pm25, 10*pm10
+    pm25: float = field(metadata=base.metadata("PM2.5", "ug/m3", "concentration", scale=10))
+    pm10: float = field(metadata=base.metadata("PM10", "ug/m3", "concentration", scale=10))
@@ -6,7 +6,7 @@ NovaFitness SDS198 sensors
 
 from dataclasses import dataclass, field
 
-from pms.sensor import base
+from pms.sensor import base, spec
 from . import sds01x
 
 commands = sds01x.commands._replace(
@@ -21,11 +21,13 @@ commands = sds01x.commands._replace(
 class Message(sds01x.Message):
     """Messages from NovaFitness SDS011, SDS018 and SDS021 sensors"""
 
+    __slots__ = ()
+
     data_records = slice(1, 2)
 
 
 @dataclass(frozen=False)
-class ObsData(base.ObsData):
+class ObsData(spec.ObsData):
 
     """SDS198 observations
 
@@ -34,15 +36,3 @@ class ObsData(base.ObsData):
     """
 
     pm100: int = field(metadata=base.metadata("PM100", "ug/m3", "concentration"))
-
-    def __format__(self, spec: str) -> str:
-        if spec == "header":
-            return super().__format__(spec)
-        if spec == "pm":
-            return f"{self.date:%F %T}: PM100 {self.pm100:.1f} ug/m3"
-        if spec == "csv":
-            return f"{self.time}, {self.pm100:.1f}"
-        raise ValueError(  # pragma: no cover
-            f"Unknown format code '{spec}' "
-            f"for object of type '{__name__}.{self.__class__.__name__}'"
-        )
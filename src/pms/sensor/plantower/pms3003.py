@@ -5,11 +5,8 @@ Plantower PMS3003 sensors
 """
 
 from dataclasses import dataclass, field
-from typing import Tuple
-import struct
 
-from pms import WrongMessageFormat, WrongMessageChecksum, SensorWarmingUp
-from pms.sensor import base
+from pms.sensor import base, spec
 
 
 commands = base.Commands(
@@ -21,48 +18,14 @@ commands = base.Commands(
 )
 
 
-class Message(base.Message):
+class Message(spec.Message):
     """Messages from Plantower PMS3003 sensors"""
 
-    data_records = slice(6)
-
-    @property
-    def header(self) -> bytes:
-        return self.message[:4]
-
-    @property
-    def payload(self) -> bytes:
-        return self.message[4:-2]
+    __slots__ = ()
 
-    @property
-    def checksum(self) -> int:
-        return self._unpack(self.message[-2:])[0]
-
-    @classmethod
-    def _validate(cls, message: bytes, header: bytes, length: int) -> base.Message:
-
-        # consistency check: bug in message singnature
-        assert len(header) == 4, f"wrong header length {len(header)}"
-        assert header[:2] == b"BM", f"wrong header start {header!r}"
-        len_payload = cls._unpack(header[-2:])[0]
-        assert length == 4 + len_payload, f"wrong payload length {length} != {4+len_payload}"
-
-        # validate message: recoverable errors (throw away observation)
-        msg = cls(message)
-        if msg.header != header:
-            raise WrongMessageFormat(f"message header: {msg.header!r}")
-        if len(message) != length:
-            raise WrongMessageFormat(f"message length: {len(message)}")
-        checksum = sum(msg.header) + sum(msg.payload)
-        if msg.checksum != checksum:
-            raise WrongMessageChecksum(f"message checksum {msg.checksum} != {checksum}")
-        if sum(msg.payload) == 0:
-            raise SensorWarmingUp(f"message empty: warming up sensor")
-        return msg
-
-    @staticmethod
-    def _unpack(message: bytes) -> Tuple[int, ...]:
-        return struct.unpack(f">{len(message)//2}H", message)
+    # BM + payload length, frame length from the header
+    protocol = spec.Protocol(b"BM", 4, checksum=spec.Checksum.sum16, record=">H")
+    data_records = slice(6)
 
 
 @dataclass(frozen=False)
@@ -81,6 +44,10 @@ class ObsData(base.ObsData):
     pm25: int = field(metadata=base.metadata("PM2.5", "ug/m3", "concentration"))
     pm10: int = field(metadata=base.metadata("PM10", "ug/m3", "concentration"))
 
+    csv_format = (
+        "{0.time}, {0.raw01}, {0.raw25}, {0.raw10}, {0.pm01:.1f}, {0.pm25:.1f}, {0.pm10:.1f}"
+    )
+
     # cfX [1]: pmX/rawX
     @property
     def cf01(self) -> float:
@@ -103,12 +70,10 @@ class ObsData(base.ObsData):
         return 0  # pragma: no cover
 
     def __format__(self, spec: str) -> str:
-        if spec == "header":
+        if spec in ["header", "csv"]:
             return super().__format__(spec)
         if spec == "pm":
             return f"{self.date:%F %T}: PM1 {self.pm01:.1f}, PM2.5 {self.pm25:.1f}, PM10 {self.pm10:.1f} ug/m3"
-        if spec == "csv":
-            return f"{self.time}, {self.raw01}, {self.raw25}, {self.raw10}, {self.pm01:.1f}, {self.pm25:.1f}, {self.pm10:.1f}"
         if spec == "cf":
             return f"{self.date:%F %T}: CF1 {self.cf01:.0%}, CF2.5 {self.cf25:.0%}, CF10 {self.cf10:.0%}"
         if spec == "raw":
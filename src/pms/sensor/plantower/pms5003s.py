@@ -16,6 +16,8 @@ commands = pmsx003.commands
 class Message(pms3003.Message):
     """Messages from Plantower PMS5003S sensors"""
 
+    __slots__ = ()
+
     data_records = slice(13)
 
 
@@ -33,20 +35,19 @@ class ObsData(pmsx003.ObsData):
     # HCHO [mg/m3]: formaldehyde concentration (read as ug/m3, datasheet says 1/1000 mg/m3 ie ug/m3)
     HCHO: int = field(metadata=base.metadata("formaldehyde", "mg/m3", "concentration"))
 
-    def __post_init__(self):
+    csv_format = pmsx003.ObsData.csv_format + ", {0.HCHO:.3f}"
+
+    def _convert(self):
         """Units conversion
         nX_Y [#/cm3] read in [#/0.1L]
         HCHO [mg/m3] read in [ug/m3]
         """
-        super().__post_init__()
-        self.HCHO /= 1000
+        super()._convert()
+        self.HCHO = self.HCHO / 1000  # not in place, HCHO is read as int
 
     def __format__(self, spec: str) -> str:
-        if spec in ["header", "pm", "raw", "cf", "num"]:
+        if spec in ["header", "csv", "pm", "raw", "cf", "num"]:
             return super().__format__(spec)
-        if spec == "csv":
-            csv = super().__format__(spec)
-            return f"{csv}, {self.HCHO:.3f}"
         if spec == "hcho":
             return f"{self.date:%F %T}: HCHO {self.HCHO:.3f} mg/m3"
         raise ValueError(  # pragma: no cover
@@ -5,8 +5,6 @@ Plantower PMS5003ST sensors
 """
 
 from dataclasses import dataclass, field
-from typing import Tuple
-import struct
 
 from pms.sensor import base
 from . import pms3003, pmsx003, pms5003s
@@ -24,15 +22,10 @@ commands = base.Commands(
 class Message(pms3003.Message):
     """Messages from Plantower PMS5003ST sensors"""
 
-    data_records = slice(15)
+    __slots__ = ()
 
-    @staticmethod
-    def _unpack(message: bytes) -> Tuple[int, ...]:
-        if len(message) == 34:
-            # 14th record is signed (temp)
-            return struct.unpack(f">13Hh3H", message)
-        else:
-            return pms3003.Message._unpack(message)
+    data_records = slice(15)
+    layouts = {34: ">13Hh3H"}  # 14th record is signed (temp)
 
 
 @dataclass(frozen=False)
@@ -52,23 +45,22 @@ class ObsData(pms5003s.ObsData):
     temp: float = field(metadata=base.metadata("temperature", "°C", "degrees"))
     rhum: float = field(metadata=base.metadata("relative humidity", "%", "percentage"))
 
-    def __post_init__(self):
+    csv_format = pms5003s.ObsData.csv_format + ", {0.temp:.1f}, {0.rhum:.1f}"
+
+    def _convert(self):
         """Units conversion
         nX_Y [#/cm3] read in [#/0.1L]
         HCHO [mg/m3] read in [ug/m3]
         temp [°C]    read in [0.1 °C]
         rhum [%]     read in [1/1000]
         """
-        super().__post_init__()
+        super()._convert()
         self.temp /= 10
         self.rhum /= 10
 
     def __format__(self, spec: str) -> str:
-        if spec in ["header", "pm", "raw", "cf", "num", "hcho"]:
+        if spec in ["header", "csv", "pm", "raw", "cf", "num", "hcho"]:
             return super().__format__(spec)
-        if spec == "csv":
-            csv = super().__format__(spec)
-            return f"{csv}, {self.temp:.1f}, {self.rhum:.1f}"
         if spec == "atm":
             return f"{self.date:%F %T}: Temp. {self.temp:.1f} °C, Rel.Hum. {self.rhum:.1f} %"
         raise ValueError(  # pragma: no cover
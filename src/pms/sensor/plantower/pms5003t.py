@@ -5,8 +5,6 @@ Plantower PMS5003T sensors
 """
 
 from dataclasses import dataclass, field
-from typing import Tuple
-import struct
 
 from pms import InconsistentObservation
 from pms.sensor import base
@@ -19,15 +17,10 @@ commands = pmsx003.commands
 class Message(pms3003.Message):
     """Messages from Plantower PMS5003T sensors"""
 
-    data_records = slice(12)
+    __slots__ = ()
 
-    @staticmethod
-    def _unpack(message: bytes) -> Tuple[int, ...]:
-        if len(message) == 26:
-            # 11th record is signed (temp)
-            return struct.unpack(">10Hh2H", message)
-        else:
-            return pms3003.Message._unpack(message)
+    data_records = slice(12)
+    layouts = {26: ">10Hh2H"}  # 11th record is signed (temp)
 
 
 @dataclass(frozen=False)
@@ -51,7 +44,18 @@ class ObsData(pms3003.ObsData):
     temp: float = field(metadata=base.metadata("temperature", "°C", "degrees"))
     rhum: float = field(metadata=base.metadata("relative humidity", "%", "percentage"))
 
+    csv_format = pms3003.ObsData.csv_format + (
+        ", {0.n0_3:.2f}, {0.n0_5:.2f}, {0.n1_0:.2f}, {0.n2_5:.2f}, {0.temp:.1f}, {0.rhum:.1f}"
+    )
+
     def __post_init__(self):
+        super().__post_init__()
+        if not self._consistent():
+            raise InconsistentObservation(
+                f"inconsistent obs: PM10={self.pm10} and N0.3={self.n0_3}"
+            )
+
+    def _convert(self):
         """Units conversion
         nX_Y [#/cm3] read in [#/0.1L]
         temp [°C]    read in [0.1 °C]
@@ -64,17 +68,13 @@ class ObsData(pms3003.ObsData):
         self.temp /= 10
         self.rhum /= 10
 
-        if self.n0_3 == 0 and self.pm10 > 0:
-            raise InconsistentObservation(
-                f"inconsistent obs: PM10={self.pm10} and N0.3={self.n0_3}"
-            )
+    def _consistent(self):
+        """no PM10 without particles over 0.3 um"""
+        return (self.n0_3 != 0) | (self.pm10 <= 0)
 
     def __format__(self, spec: str) -> str:
-        if spec in ["header", "pm", "raw", "cf"]:
+        if spec in ["header", "csv", "pm", "raw", "cf"]:
             return super().__format__(spec)
-        if spec == "csv":
-            pm = super().__format__(spec)
-            return f"{pm}, {self.n0_3:.2f}, {self.n0_5:.2f}, {self.n1_0:.2f}, {self.n2_5:.2f}, {self.temp:.1f}, {self.rhum:.1f}"
         if spec == "num":
             return f"{self.date:%F %T}: N0.3 {self.n0_3:.2f}, N0.5 {self.n0_5:.2f}, N1.0 {self.n1_0:.2f}, N2.5 {self.n2_5:.2f} #/cm3"
         if spec == "atm":
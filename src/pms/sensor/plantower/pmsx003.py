@@ -22,6 +22,8 @@ commands = base.Commands(
 class Message(pms3003.Message):
     """Messages from Plantower PMS1003, PMS5003, PMS7003 and PMSA003 sensors"""
 
+    __slots__ = ()
+
     data_records = slice(12)
 
 
@@ -43,7 +45,18 @@ class ObsData(pms3003.ObsData):
     n5_0: float
     n10_0: float
 
+    csv_format = pms3003.ObsData.csv_format + (
+        ", {0.n0_3:.2f}, {0.n0_5:.2f}, {0.n1_0:.2f}, {0.n2_5:.2f}, {0.n5_0:.2f}, {0.n10_0:.2f}"
+    )
+
     def __post_init__(self):
+        super().__post_init__()
+        if not self._consistent():
+            raise InconsistentObservation(
+                f"inconsistent obs: PM10={self.pm10} and N0.3={self.n0_3}"
+            )
+
+    def _convert(self):
         """Convert from #/100cm3 to #/cm3"""
         self.n0_3 /= 100
         self.n0_5 /= 100
@@ -52,17 +65,13 @@ class ObsData(pms3003.ObsData):
         self.n5_0 /= 100
         self.n10_0 /= 100
 
-        if self.n0_3 == 0 and self.pm10 > 0:
-            raise InconsistentObservation(
-                f"inconsistent obs: PM10={self.pm10} and N0.3={self.n0_3}"
-            )
+    def _consistent(self):
+        """no PM10 without particles over 0.3 um"""
+        return (self.n0_3 != 0) | (self.pm10 <= 0)
 
     def __format__(self, spec: str) -> str:
-        if spec in ["header", "pm", "raw", "cf"]:
+        if spec in ["header", "csv", "pm", "raw", "cf"]:
             return super().__format__(spec)
-        if spec == "csv":
-            csv = super().__format__(spec)
-            return f"{csv}, {self.n0_3:.2f}, {self.n0_5:.2f}, {self.n1_0:.2f}, {self.n2_5:.2f}, {self.n5_0:.2f}, {self.n10_0:.2f}"
         if spec == "num":
             return f"{self.date:%F %T}: N0.3 {self.n0_3:.2f}, N0.5 {self.n0_5:.2f}, N1.0 {self.n1_0:.2f}, N2.5 {self.n2_5:.2f}, N5.0 {self.n5_0:.2f}, N10 {self.n10_0:.2f} #/cm3"
         raise ValueError(  # pragma: no cover
@@ -6,18 +6,27 @@ NOTE:
 - Tested on PMS3003, PMS7003, PMSA003, SDS011 and MCU680
 """
 
+import os
 import sys
 import time
-from csv import DictReader
-from functools import lru_cache
 from pathlib import Path
-from textwrap import wrap
-from typing import Generator, NamedTuple, Optional, overload
+from typing import IO, Any, Callable, Dict, Generator, Iterable, List, NamedTuple, Optional, Tuple
+from typing import Union, overload
 
 from serial import Serial
 
-from pms import logger, SensorWarning, SensorWarmingUp, InconsistentObservation
+from pms import logger, SensorWarning, SensorWarmingUp, InconsistentObservation, MissingAnswer
 from pms.sensor import Sensor, base
+from pms.sensor.compression import Compression
+from pms.sensor.novafitness.extra_commands import work_period
+from pms.sensor.transaction import Transport
+
+
+# precomputed byte-to-text tables for hexdump
+_HEX = tuple(f"{b:02x} " for b in range(0x100))
+_ASCII = bytes.maketrans(
+    bytes(range(0x20)) + bytes(range(0x7E, 0x100)), b"." * (0x20 + 0x100 - 0x7E)
+)
 
 
 class RawData(NamedTuple):
@@ -30,19 +39,36 @@ class RawData(NamedTuple):
     def hex(self) -> str:
         return self.data.hex()
 
-    @classmethod
-    @lru_cache(maxsize=1, typed=True)
-    def __table(cls) -> bytes:
-        """translation table for raw.hexdump(n)"""
-        return bytes.maketrans(
-            bytes(range(0x20)) + bytes(range(0x7E, 0x100)), b"." * (0x20 + 0x100 - 0x7E)
-        )
-
     def hexdump(self, line: Optional[int] = None) -> str:
-        offset = time if line is None else line * len(self.data)
-        hex = " ".join(wrap(self.data.hex(), 2))  # raw.hex(" ") in python3.8+
-        dump = self.data.translate(self.__table()).decode()
-        return f"{offset:08x}: {hex}  {dump}"
+        offset = 0 if line is None else line * len(self.data)
+        return _hexdump(offset, self.data)
+
+
+def _hexdump(offset: int, data: bytes) -> str:
+    hex = "".join(map(_HEX.__getitem__, data))
+    dump = data.translate(_ASCII).decode()
+    return f"{offset:08x}: {hex} {dump}"
+
+
+def hexdump(
+    messages: Iterable[RawData], *, offset: int = 0, lines: int = 1024
+) -> Generator[str, None, None]:
+    """Format many messages per call
+
+    Yield blocks of (up to) `lines` newline terminated hexdump lines,
+    offsets are the cumulative message lengths from `offset`
+    """
+    block: List[str] = []
+    for raw in messages:
+        block.append(_hexdump(offset, raw.data))
+        offset += len(raw.data)
+        if len(block) >= lines:
+            block.append("")
+            yield "\n".join(block)
+            block.clear()
+    if block:
+        block.append("")
+        yield "\n".join(block)
 
 
 class SensorReader:
@@ -53,14 +79,36 @@ class SensorReader:
 
     PMS3003 sensors do not accept serial commands, such as wake/sleep or passive mode read.
     Valid messages are extracted from the serial buffer.
+
+    Commands are sent through a transaction layer (pms.sensor.transaction), which matches
+    every answer to its command, and retries unanswered commands `retries` times,
+    so a late answer to an earlier command does not corrupt the next read.
+    Answers are read into a preallocated buffer, so the acquisition loop does not allocate
+    a new read buffer for every sample.
+
+    On duty cycle mode, the sensor is put to sleep between samples and woken up
+    ahead of the next sample by the warm-up lead time: the time from wake up to the first
+    valid observation, learned per sensor model. SDS01x sensors sleep between samples
+    on their own, with the working period set to the interval in minutes.
     """
 
+    buffer_size = 256  # bytes, grows if the serial port has more data waiting
+    retries = 0  # commands written again when unanswered, each waits up to the port timeout
+    warmup_poll = 1.0  # seconds between reads while the sensor warms up
+    warmup_default = 5.0  # seconds, initial warm-up lead time
+    warmup_weight = 0.5  # weight of the latest warm-up time on the learned lead time
+    min_sleep = 10.0  # seconds, shortest sleep worth a sleep/wake cycle
+
+    # learned warm-up lead time [s] by sensor model, shared by all readers
+    warmup: Dict[str, float] = {}
+
     def __init__(
         self,
         sensor: str = "PMSx003",
         port: str = "/dev/ttyUSB0",
         interval: Optional[int] = None,
         samples: Optional[int] = None,
+        duty_cycle: bool = False,
     ) -> None:
         """Configure serial port"""
         self.sensor = Sensor[sensor]
@@ -70,51 +118,133 @@ class SensorReader:
         self.serial.timeout = 5  # max time to wake up sensor
         self.interval = interval
         self.samples = samples
+        self.duty_cycle = duty_cycle
+        self.work_period = 0  # minutes, SDS01x working period
+        if duty_cycle and self.sensor is Sensor.SDS01x and interval and interval >= 60:
+            self.work_period = min(interval // 60, 30)
+        self._woke: Optional[float] = None  # time.monotonic() of the last wake up
+        self.transport = Transport(
+            self.serial, self.sensor, retries=self.retries, buffer_size=self.buffer_size
+        )
         logger.debug(
             f"capture {samples if samples else '?'} {sensor} obs "
             f"from {port} every {interval if interval else '?'} secs"
         )
 
-    def _cmd(self, command: str) -> bytes:
-        """Write command to sensor and return answer"""
+    def _cmd(self, command: Union[str, base.Cmd]) -> bytes:
+        """Write command, by name or an extra command, to sensor and return its answer"""
+        cmd = self.sensor.command(command) if isinstance(command, str) else command
+        if not cmd.command and isinstance(command, str) and command.endswith("read"):
+            self.transport.reset()  # wait for a new message
+        return self.transport.request(cmd)
 
-        # send command
-        cmd = self.sensor.command(command)
-        if cmd.command:
-            self.serial.write(cmd.command)
-            self.serial.flush()
-        elif command.endswith("read"):
-            self.serial.reset_input_buffer()
+    def request(self, command: base.Cmd) -> bytes:
+        """Answer to an extra command, e.g. pms.sensor.novafitness.extra_commands.work_period
 
-        # return full buffer
-        return self.serial.read(max(cmd.answer_length, self.serial.in_waiting))
+        raise MissingAnswer when the sensor does not answer
+        """
+        return bytes(self._cmd(command))
 
     def __enter__(self) -> "SensorReader":
         """Open serial port and sensor setup"""
         if not self.serial.is_open:
             logger.debug(f"open {self.serial.port}")
             self.serial.open()
-            self.serial.reset_input_buffer()
+        self.transport.serial = self.serial  # the port could have been replaced, e.g. simulator
+        self.transport.reset()
 
         # wake sensor and set passive mode
-        logger.debug(f"wake {self.sensor.name}")
-        buffer = self._cmd("wake") + self._cmd("passive_mode")
-        logger.debug(f"buffer length: {len(buffer)}")
-
-        # check against sensor type derived from buffer
-        if not self.sensor.check(buffer, "passive_mode"):
+        try:
+            name, answer = self._wake()
+        except MissingAnswer as e:
+            logger.debug(e)
+            name, answer = "", b""
+
+        # check against sensor type derived from the answer
+        if not (name and self._check(name, answer)):
             logger.error(f"Sensor is not {self.sensor.name}")
             sys.exit(1)
 
+        if self.work_period:
+            logger.debug(f"{self.sensor.name} working period {self.work_period} min")
+            try:
+                self._cmd(work_period(self.work_period))
+            except MissingAnswer:
+                logger.warning(f"no working period on {self.sensor.name}, sleep between samples")
+                self.work_period = 0
+
         return self
 
     def __exit__(self, exception_type, exception_value, traceback) -> None:
         """Put sensor to sleep and close serial port"""
-        logger.debug(f"sleep {self.sensor.name}")
-        buffer = self._cmd("sleep")
+        try:
+            if self.work_period:
+                self._cmd(work_period(0))
+            self._sleep()
+        except MissingAnswer as e:
+            logger.debug(e)
         logger.debug(f"close {self.serial.port}")
         self.serial.close()
 
+    def _wake(self) -> Tuple[str, bytes]:
+        """Wake sensor and set passive mode, start timing the warm-up
+
+        Return the last setup command with an answer, and its answer
+        """
+        logger.debug(f"wake {self.sensor.name}")
+        answer = self._cmd("wake")
+        self._woke = time.monotonic()
+        if not self.sensor.Commands.passive_mode.answer_length:
+            return "wake", answer
+        return "passive_mode", self._cmd("passive_mode")
+
+    def _check(self, name: str, answer: bytes) -> bool:
+        """Answer matched the expected header, and passive_mode answers with a payload are valid
+
+        acknowledgements without payload (HPMA115S0) and wake answers (SPS30, no passive_mode)
+        are only checked by their header
+        """
+        logger.debug(f"{name} answer length: {len(answer)}")
+        if name != "passive_mode" or len(answer) <= len(self.sensor.command(name).answer_header):
+            return True
+        return self.sensor.check(answer, name)
+
+    def _sleep(self) -> None:
+        logger.debug(f"sleep {self.sensor.name}")
+        self._cmd("sleep")
+
+    @property
+    def lead_time(self) -> float:
+        """seconds to wake up the sensor ahead of the next sample"""
+        return self.warmup.get(self.sensor.name, self.warmup_default)
+
+    def _warm(self) -> None:
+        """Learn the warm-up lead time from the first valid observation after wake up"""
+        if self._woke is None:
+            return
+        latency, self._woke = time.monotonic() - self._woke, None
+        name = self.sensor.name
+        lead = self.warmup.get(name)
+        self.warmup[name] = (
+            latency if lead is None else lead + self.warmup_weight * (latency - lead)
+        )
+        logger.debug(f"{name} warm-up {latency:.1f} s, lead time {self.warmup[name]:.1f} s")
+
+    def wait(self, delay: float, sleep: Callable[[float], Any] = time.sleep) -> None:
+        """Wait for the next sample, on duty cycle mode sleep the sensor meanwhile
+
+        a `sleep` that returns True, e.g. Event.wait on a stopping reader, ends the wait
+        without waking the sensor
+        """
+        lead = self.lead_time
+        if not self.duty_cycle or self.work_period or delay - lead < self.min_sleep:
+            sleep(delay)
+            return
+        self._sleep()
+        if sleep(delay - lead) is True:
+            return
+        self._wake()
+
     @overload
     def __call__(self) -> Generator[base.ObsData, None, None]:
         pass
@@ -127,18 +257,18 @@ class SensorReader:
         """Passive mode reading at regular intervals"""
         while self.serial.is_open:
             try:
-                buffer = self._cmd("passive_read")
-
                 try:
+                    buffer = self._cmd("passive_read")
                     obs = self.sensor.decode(buffer)
                 except (SensorWarmingUp, InconsistentObservation) as e:
                     logger.debug(e)
-                    time.sleep(5)
+                    time.sleep(self.warmup_poll)
                 except SensorWarning as e:
                     logger.debug(e)
-                    self.serial.reset_input_buffer()
+                    self.transport.reset()
                 else:
-                    yield RawData(obs.time, buffer) if raw else obs
+                    self._warm()
+                    yield RawData(obs.time, bytes(buffer)) if raw else obs
                     if self.samples:
                         self.samples -= 1
                         if self.samples <= 0:
@@ -146,28 +276,176 @@ class SensorReader:
                     if self.interval:
                         delay = self.interval - (time.time() - obs.time)
                         if delay > 0:
-                            time.sleep(delay)
+                            self.wait(delay)
             except KeyboardInterrupt:
                 print()
                 break
 
 
 class MessageReader:
-    def __init__(self, path: Path, sensor: Sensor, samples: Optional[int] = None) -> None:
+    """Read captured messages from a csv file (`pms csv --capture`)
+
+    Compressed files (pms.sensor.compression) are decompressed as they are read.
+
+    On follow mode, for uncompressed files only, the file is read as it grows, like `tail -f`,
+    so one process can capture messages while another decodes them:
+    - only complete rows are decoded, a row half written is read again on the next poll
+    - the file is polled every `poll` seconds after reaching its end
+    - rotation: when the file is renamed/replaced (new inode) or truncated,
+      the rest of the old file is read before switching to the new one
+    - checkpoint: the inode and offset of the last row read are saved to `checkpoint`
+      when waiting for new rows and on exit, so a restarted reader resumes from there
+      (from the start, if the file was rotated since)
+    - messages that do not decode are skipped, instead of ending the stream
+    """
+
+    poll = 1.0  # seconds between checks for new rows, on follow mode
+
+    def __init__(
+        self,
+        path: Path,
+        sensor: Sensor,
+        samples: Optional[int] = None,
+        *,
+        follow: bool = False,
+        checkpoint: Optional[Path] = None,
+    ) -> None:
         self.path = path
         self.sensor = sensor
         self.samples = samples
+        self.follow = follow
+        self.checkpoint = checkpoint
+        self.csv: Optional[IO[bytes]] = None  # decompressed stream over raw
+        self.raw: IO[bytes]
+        self.columns: Dict[str, int] = {}
+        self.inode = 0
+        self.offset = 0  # end of the last complete row read
 
     def __enter__(self) -> "MessageReader":
-        logger.debug(f"open {self.path}")
-        self.csv = self.path.open()
-        reader = DictReader(self.csv)
-        self.data = (row for row in reader if row["sensor"] == self.sensor.name)
+        inode, offset = self._resume()
+        if self._open() and inode == self.inode and offset > self.offset:
+            logger.debug(f"resume {self.path} from byte {offset}")
+            self._seek(offset)
         return self
 
     def __exit__(self, exception_type, exception_value, traceback) -> None:
+        self._close()
+
+    def _open(self) -> bool:
+        """open file and read header, False if the file is not there yet"""
+        try:
+            raw = self.path.open("rb")
+        except FileNotFoundError:
+            if not self.follow:
+                raise
+            return False
+        compression = Compression.detect(raw)
+        if compression != Compression.none and self.follow:
+            raw.close()
+            raise ValueError(f"can not follow {compression.value} compressed {self.path}")
+        logger.debug(f"open {self.path}")
+        self.raw, self.csv = raw, compression.open(raw, "rb")
+        self.inode = os.fstat(raw.fileno()).st_ino
+        self.columns = {}
+        self.offset = 0
+        line = self.csv.readline()
+        if line.endswith(b"\n"):
+            self._header(line)
+            self.offset = len(line)
+        else:  # header half written, read again with the rows
+            self.csv.seek(0)
+        return True
+
+    def _header(self, line: bytes) -> None:
+        self.columns = {name.strip(): n for n, name in enumerate(line.decode().split(","))}
+
+    def _close(self) -> None:
+        if self.csv is None:
+            return
+        self._save()
         logger.debug(f"close {self.path}")
         self.csv.close()
+        self.raw.close()
+        self.csv = None
+
+    def _seek(self, offset: int) -> None:
+        assert self.csv is not None
+        self.csv.seek(offset)
+        self.offset = offset
+
+    def _resume(self) -> Tuple[int, int]:
+        """inode and offset from checkpoint"""
+        if self.checkpoint is None or not self.checkpoint.exists():
+            return 0, 0
+        inode, offset = map(int, self.checkpoint.read_text().split())
+        return inode, offset
+
+    def _save(self) -> None:
+        """save inode and offset to checkpoint, atomically"""
+        if self.checkpoint is None or not self.columns:
+            return
+        temp = self.checkpoint.with_name(f".{self.checkpoint.name}.tmp")
+        temp.write_text(f"{self.inode} {self.offset}\n")
+        os.replace(temp, self.checkpoint)
+
+    def _rotated(self) -> bool:
+        """file renamed/replaced or truncated"""
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:  # rotation in progress
+            return False
+        return stat.st_ino != self.inode or stat.st_size < self.offset
+
+    def _lines(self) -> Generator[bytes, None, None]:
+        """complete rows, on follow mode wait for new rows"""
+        rotated = False
+        while True:
+            if self.csv is None:
+                if not self._open():
+                    time.sleep(self.poll)
+                    continue
+            assert self.csv is not None
+            try:
+                line = self.csv.readline()
+            except EOFError as e:  # compressed stream cut short, e.g. writer did not close it
+                logger.warning(f"{self.path}: {e}")
+                return
+            if line.endswith(b"\n") or (line and not self.follow):
+                self.offset += len(line)
+                yield line
+                continue
+            if not self.follow:
+                return
+
+            # end of file: wait for the rest of the row, new rows or rotation
+            self._seek(self.offset)
+            if rotated:
+                logger.debug(f"{self.path} rotated")
+                self._close()
+                rotated = False
+                continue
+            rotated = self._rotated()
+            if not rotated:
+                self._save()
+                time.sleep(self.poll)
+
+    def _rows(self) -> Generator[Tuple[int, bytes], None, None]:
+        """time and message from rows for this sensor"""
+        sensor = self.sensor.name
+        for line in self._lines():
+            if not self.columns:
+                self._header(line)
+                continue
+            values = line.decode().split(",")
+            if values[self.columns["sensor"]].strip() != sensor:
+                continue
+            try:
+                time, hex = values[self.columns["time"]], values[self.columns["hex"]]
+                yield int(time), bytes.fromhex(hex.strip())
+            except (IndexError, ValueError) as e:
+                if not self.follow:
+                    raise
+                logger.debug(f"skip row {line!r}: {e}")
 
     @overload
     def __call__(self) -> Generator[base.ObsData, None, None]:
@@ -178,9 +456,17 @@ class MessageReader:
         pass
 
     def __call__(self, *, raw: Optional[bool] = None):
-        for row in self.data:
-            time, message = int(row["time"]), bytes.fromhex(row["hex"])
-            yield RawData(time, message) if raw else self.sensor.decode(message, time=time)
+        for time, message in self._rows():
+            if raw:
+                yield RawData(time, message)
+            else:
+                try:
+                    yield self.sensor.decode(message, time=time)
+                except SensorWarning as e:
+                    if not self.follow:
+                        raise
+                    logger.debug(e)
+                    continue
             if self.samples:
                 self.samples -= 1
                 if self.samples <= 0:
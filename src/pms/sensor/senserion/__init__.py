@@ -1 +1 @@
-from . import sps30
+from . import sps30, extra_commands
@@ -0,0 +1,77 @@
+"""Additional commands for Senserion SPS30 sensors
+
+Datasheet SPS30, Particulate Matter Sensor for Air Quality Monitoring and Control
+
+Commands are sent as SHDLC MOSI frames: 0x7E | ADR | CMD | LEN | DATA | CHK | 0x7E
+"""
+
+from pms.sensor.base import Cmd
+from .sps30 import stuff
+
+
+def _msg(cmd: int, data: bytes = b"", address: int = 0) -> bytes:
+    assert 0 <= cmd <= 0xFF, f"command id out of range: 0 <= {cmd} <= 0xFF"
+    assert len(data) <= 0xFF, f"data too long: {len(data)} > 0xFF"
+    frame = bytes([address, cmd, len(data)]) + data
+    checksum = 0xFF - sum(frame) % 0x100
+    return b"\x7E" + stuff(frame + bytes([checksum])) + b"\x7E"
+
+
+def _answer(cmd: int, length: int = None, address: int = 0) -> bytes:
+    """answer header, without LEN for variable length answers"""
+    header = bytes([0x7E, address, cmd, 0x00])
+    if length is None:
+        return header
+    return header + bytes([length])
+
+
+def device_info(info: str = "serial") -> Cmd:
+    """Device Information, command 0xD0
+
+    info: product type, or serial number (null terminated ASCII strings)
+    """
+
+    data = dict(type=0x00, serial=0x03)
+    assert info in data, f"unknown device info {info!r}"
+    return Cmd(_msg(0xD0, bytes([data[info]])), _answer(0xD0), 7 + 32)
+
+
+def read_version() -> Cmd:
+    """Read Version, command 0xD1
+
+    firmware major.minor, hardware revision and SHDLC protocol major.minor
+    """
+    return Cmd(_msg(0xD1), _answer(0xD1, 7), 7 + 7)
+
+
+def read_status() -> Cmd:
+    """Read Device Status Register, command 0xD2
+
+    read the register without clearing it
+    """
+    return Cmd(_msg(0xD2, b"\x00"), _answer(0xD2, 5), 7 + 5)
+
+
+def start_cleaning() -> Cmd:
+    """Start Fan Cleaning, command 0x56
+
+    Clean the fan at maximum speed for 10 seconds, only on measurement mode
+    """
+    return Cmd(_msg(0x56), _answer(0x56, 0), 7)
+
+
+def cleaning_interval(seconds: int = None) -> Cmd:
+    """Read/Write Auto Cleaning Interval, command 0x80
+
+    seconds: new interval, read current interval if None [factory default is 604800s, 1 week]
+    0 seconds: disable automatic cleaning
+    """
+    if seconds is None:
+        return Cmd(_msg(0x80, b"\x00"), _answer(0x80, 4), 7 + 4)
+    assert 0 <= seconds <= 0xFFFFFFFF, f"seconds out of range: 0 <= {seconds} <= 0xFFFFFFFF"
+    return Cmd(_msg(0x80, b"\x00" + seconds.to_bytes(4, "big")), _answer(0x80, 0), 7)
+
+
+def reset() -> Cmd:
+    """Device Reset, command 0xD3"""
+    return Cmd(_msg(0xD3), _answer(0xD3, 0), 7)
@@ -1,17 +1,18 @@
 """
 Senserion SPS30 sensors
-- message protocol implements byte-stuffing
+- message protocol implements byte-stuffing (SHDLC)
 - there is no active mode read
-- passive read messages are 47b long
+- passive read messages are 47b long, before byte-stuffing
 - empty read messages are 7b long
 """
 
 from dataclasses import dataclass, field
-from typing import Tuple
+from typing import Optional, Tuple
 import struct
 
 from pms import WrongMessageFormat, WrongMessageChecksum, SensorWarmingUp
 from pms.sensor import base
+from pms.sensor.checksum import INV8, total
 
 commands = base.Commands(
     # Read Measured Values
@@ -24,60 +25,104 @@ commands = base.Commands(
     wake=base.Cmd(b"\x7E\x00\x00\x02\x01\x03\xF9\x7E", b"\x7E\x00\x00", 7),
 )
 
+# SHDLC byte-stuffing: 0x7E, 0x7D, 0x11 and 0x13 are sent as 0x7D followed by byte^0x20
+STUFFED = b"\x7E\x7D\x11\x13"
+_ESCAPED = {b ^ 0x20: b for b in STUFFED}
+
+
+def stuff(data: bytes) -> bytes:
+    """SHDLC byte-stuffing"""
+    if not any(b in data for b in STUFFED):
+        return data
+    return b"".join(bytes([0x7D, b ^ 0x20]) if b in STUFFED else bytes([b]) for b in data)
+
+
+def destuff(data: bytes) -> bytes:
+    """SHDLC byte de-stuffing, in a single pass over the data"""
+    if b"\x7D" not in data:
+        return data
+    head, *tail = data.split(b"\x7D")
+    frame = bytearray(head)
+    for part in tail:
+        if not part or part[0] not in _ESCAPED:
+            raise WrongMessageFormat(f"message stuffing: {data.hex()}")
+        frame.append(_ESCAPED[part[0]])
+        frame += part[1:]
+    return bytes(frame)
+
 
 class Message(base.Message):
-    """Messages from Senserion SPS30 sensors"""
+    """Messages from Senserion SPS30 sensors
 
-    data_records = slice(10)
+    MISO frame: 0x7E | ADR | CMD | STATE | LEN | DATA | CHK | 0x7E
+    everything between the frame delimiters is byte-stuffed,
+    the frame is de-stuffed once, when the message is created
+    """
 
-    @property
-    def header(self) -> bytes:
-        return self.message[:5]
+    __slots__ = ()
 
-    @property
-    def payload(self) -> bytes:
-        """byte de-stuffing"""
-        p = self.message[5:-2]
-        for k, v in {
-            b"\x7E": b"\x7D\x5E",
-            b"\x7D": b"\x7D\x5D",
-            b"\x11": b"\x7D\x31",
-            b"\x13": b"\x7D\x33",
-        }.items():
-            if v in p:  # pragma: no cover
-                p = p.replace(v, k)
-        return p
+    data_records = slice(10)
+
+    @staticmethod
+    def _split(message: bytes) -> Tuple[bytes, bytes, int]:
+        frame = destuff(bytes(message[1:-1]))
+        return bytes(message[:1]) + frame[:4], frame[4:-1], frame[-1] if len(frame) > 4 else -1
 
     @property
-    def checksum(self) -> int:
-        return self.message[-2]
+    def length(self) -> int:
+        """message length after de-stuffing, every escape byte adds one byte to the message"""
+        return len(self.message) - bytes(self.message[1:-1]).count(b"\x7D")
 
     @property
     def tail(self) -> int:
         return self.message[-1]
 
+    @classmethod
+    def _last_message(cls, message: bytes, header: bytes, length: int) -> Optional[bytes]:
+        """last complete frame on buffer, stuffed frames can be longer than `length`"""
+        start = message.rfind(header)
+        while start >= 0:
+            end = message.find(b"\x7E", start + 1)
+            if end > 0:
+                return message[start : end + 1]
+            start = message.rfind(header, 0, start)
+        return None
+
+    @classmethod
+    def frame_length(
+        cls, buffer: bytes, start: int, length: int, end: Optional[int] = None
+    ) -> Optional[int]:
+        """up to the closing frame delimiter, stuffed frames can be longer than `length`"""
+        stop = buffer.find(b"\x7E", start + 1, len(buffer) if end is None else end)
+        return None if stop < 0 else stop + 1 - start
+
     @classmethod
     def _validate(cls, message: bytes, header: bytes, length: int) -> base.Message:
 
         # consistency check: bug in message singnature
-        assert len(header) == 5, f"wrong header length {len(header)}"
+        assert len(header) in [4, 5], f"wrong header length {len(header)}"
         assert header[:2] == b"\x7E\x00", f"wrong header start {header!r}"
-        assert length in [7, 47], f"wrong payload length {length} != 4||47"
-        len_payload = header[-1]
-        assert length == len_payload + 7, f"wrong payload length {length} != {len_payload+7}"
+        if len(header) == 5:  # answers without LEN have variable length, up to `length`
+            len_payload = header[-1]
+            assert length == len_payload + 7, f"wrong payload length {length} != {len_payload+7}"
 
         # validate message: recoverable errors (throw away observation)
         msg = cls(message)
-        if msg.header != header:
+        if msg.header[: len(header)] != header:
             raise WrongMessageFormat(f"message header: {msg.header!r}")
         if msg.tail != 0x7E:
             raise WrongMessageFormat(f"message tail: {msg.tail:#x}")
-        if len(message) != length:
-            raise WrongMessageFormat(f"message length: {len(message)} != {length}")
-        checksum = 0xFF - (sum(msg.header[1:]) + sum(msg.payload)) % 0x100
+        # LEN from the expected header, or from the message for variable length answers
+        len_message = (header if len(header) == 5 else msg.header)[-1] + 7
+        if msg.length != len_message:
+            raise WrongMessageFormat(f"message length: {msg.length} != {len_message}")
+        if msg.length > length:
+            raise WrongMessageFormat(f"message length: {msg.length} > {length}")
+        payload = sum(msg.payload)
+        checksum = INV8.finish(total(msg.header, 1) + payload)
         if msg.checksum != checksum:
             raise WrongMessageChecksum(f"message checksum {msg.checksum} != {checksum}")
-        if sum(msg.payload) == 0:
+        if payload == 0:
             raise SensorWarmingUp(f"message empty: warming up sensor")
         return msg
 
@@ -85,6 +130,16 @@ class Message(base.Message):
     def _unpack(message: bytes) -> Tuple[float, ...]:
         return struct.unpack(f">{len(message)//4}f", message)
 
+    @classmethod
+    def _encode(cls, header: bytes, payload: bytes) -> bytes:
+        """MISO frame with STATE=0, stuffed between the frame delimiters"""
+        frame = header[1:3] + bytes([0, len(payload)]) + payload
+        return b"\x7E" + stuff(frame + bytes([INV8(frame)])) + b"\x7E"
+
+    @staticmethod
+    def _pack(records: Tuple[float, ...]) -> bytes:
+        return struct.pack(f">{len(records)}f", *records)
+
 
 @dataclass(frozen=False)
 class ObsData(base.ObsData):
@@ -107,15 +162,16 @@ class ObsData(base.ObsData):
     n10_0: float
     diam: float
 
+    csv_format = (
+        "{0.time}, {0.pm01:.1f}, {0.pm25:.1f}, {0.pm04:.1f}, {0.pm10:.1f}, "
+        "{0.n0_5:.2f}, {0.n1_0:.2f}, {0.n2_5:.2f}, {0.n4_0:.2f}, {0.n10_0:.2f}, {0.diam:.1f}"
+    )
+
     def __format__(self, spec: str) -> str:
-        if spec == "header":
+        if spec in ["header", "csv"]:
             return super().__format__(spec)
         if spec == "pm":
             return f"{self.date:%F %T}: PM1 {self.pm01:.1f}, PM2.5 {self.pm25:.1f}, PM4 {self.pm04:.1f}, PM10 {self.pm10:.1f} ug/m3"
-        if spec == "csv":
-            pm = f"{self.pm01:.1f}, {self.pm25:.1f}, {self.pm04:.1f}, {self.pm10:.1f}"
-            num = f"{self.n0_5:.2f}, {self.n1_0:.2f}, {self.n2_5:.2f}, {self.n4_0:.2f}, {self.n10_0:.2f}"
-            return f"{self.time}, {pm}, {num}, {self.diam:.1f}"
         if spec == "num":
             return f"{self.date:%F %T}: N0.5 {self.n0_5:.2f}, N1.0 {self.n1_0:.2f}, N2.5 {self.n2_5:.2f}, N4.0 {self.n4_0:.2f}, N10 {self.n10_0:.2f} #/cm3"
         if spec == "diam":
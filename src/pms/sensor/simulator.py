@@ -0,0 +1,448 @@
+"""
+Simulated sensors for load and soak testing
+
+SimulatedSensor answers the serial commands of any supported sensor with valid messages,
+built by the sensor's own message encoder
+- passive mode: answer passive_read commands
+- active mode: send a message every `period` seconds (PMS3003 sensors only have active mode)
+- level/noise: mean and relative standard deviation of the simulated measurements
+- faults: probability of a faulty message
+  - checksum: corrupted payload, the checksum does not match
+  - truncated: incomplete message
+  - warmup: empty message, as sent by sensors warming up
+- warmup_time: seconds after waking up with empty messages
+- capture: replay messages from a capture file (`pms csv --capture`),
+  active mode messages are sent at `speed` times the original pace
+- device: NovaFitness device ID, the sensor answers only to commands for its ID (or 0xFFFF)
+  and acknowledges any other command, e.g. extra_commands.work_period
+
+Simulated sensors are served over
+- SimulatedSerial: in-process stand-in for serial.Serial
+- PseudoTerminal: a pty, for readers on another thread or process
+Several NovaFitness sensors with different device IDs can share a SimulatedBus.
+"""
+
+import os
+import random
+import select
+import struct
+import threading
+import time
+import tty
+from collections import deque
+from enum import Enum
+from pathlib import Path
+from typing import Deque, Dict, Generator, List, Optional, Sequence, Tuple, Union
+
+from pms import logger
+from pms.sensor.bus import NOVAFITNESS
+from pms.sensor.reader import MessageReader
+from pms.sensor.sensor import Sensor
+
+
+class Fault(str, Enum):
+    checksum = "checksum"
+    truncated = "truncated"
+    warmup = "warmup"
+
+
+class SimulatedSensor:
+    """Answer sensor commands with valid, or faulty, messages
+
+    >>> sensor = SimulatedSensor("SDS01x", noise=0.2, faults={Fault.checksum: 0.01})
+    >>> sensor.write(Sensor.SDS01x.Commands.passive_read.command)
+    b'\\xaa\\xc0...'
+    """
+
+    def __init__(
+        self,
+        sensor: Union[str, Sensor] = "PMSx003",
+        *,
+        level: float = 10.0,
+        noise: float = 0.1,
+        faults: Optional[Dict[Fault, float]] = None,
+        period: float = 1.0,
+        latency: float = 0.0,
+        warmup_time: float = 0.0,
+        capture: Optional[Path] = None,
+        speed: float = 1.0,
+        device: Optional[int] = None,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.sensor = sensor if isinstance(sensor, Sensor) else Sensor[sensor]
+        if device is not None:
+            assert self.sensor in NOVAFITNESS, f"no device ID on {self.sensor.name}"
+            assert 0 <= device < 0xFFFF, f"device id out of range: 0 <= {device} < 0xFFFF"
+        assert level >= 0, f"level out of range: {level} < 0"
+        assert noise >= 0, f"noise out of range: {noise} < 0"
+        assert period > 0, f"period out of range: {period} <= 0"
+        assert speed > 0, f"speed out of range: {speed} <= 0"
+        self.level = level
+        self.noise = noise
+        self.faults = {Fault(fault): p for fault, p in (faults or {}).items()}
+        self.period = period
+        self.latency = latency
+        self.warmup_time = warmup_time
+        self.capture = capture
+        self.speed = speed
+        self.device = None if device is None else device.to_bytes(2, "big")
+        self.random = random.Random(seed)
+
+        # sensors start on active mode, if they have one
+        self.active = self.sensor.Commands.active_mode.answer_length > 0
+        self.awake = True
+        self.warm = time.monotonic() + warmup_time  # end of warm-up
+        self.sent = 0
+
+        # command bytes to command name, first name for shared commands
+        self._commands: Dict[bytes, str] = {}
+        for name, cmd in self.sensor.Commands._asdict().items():
+            if cmd.command:
+                self._commands.setdefault(cmd.command, name)
+        self._received = bytearray()
+
+        # passive_read payload as records, and the position/max value of the measurements
+        cmd = self.sensor.Commands.passive_read
+        Message = self.sensor.Message
+        size = cmd.answer_length - len(Message._encode(cmd.answer_header, b""))
+        self._records = list(Message._unpack(bytes(size)))
+        self._data = range(len(self._records))[Message.data_records]  # type: ignore
+        self._limits = [self._limit(n) for n in self._data]
+
+        self._frames: Generator[Tuple[float, bytes], None, None]
+        self._frames = self._replay() if capture else self._generate()
+        self._next: Optional[Tuple[float, bytes]] = None  # next active mode (time, message)
+
+    def _limit(self, n: int) -> float:
+        """largest value for record n"""
+        if isinstance(self._records[n], float):
+            return float("inf")
+        records = list(self._records)
+        for limit in [0x7FFF, 0xFF]:
+            records[n] = limit
+            try:
+                self.sensor.Message._pack(tuple(records))
+            except struct.error:
+                continue
+            return limit
+        return 1  # pragma: no cover
+
+    def _message(self, value: Optional[float] = None) -> bytes:
+        """passive_read answer, every measurement on the message takes the same sampled value"""
+        if value is None:
+            value = max(self.level * (1 + self.noise * self.random.gauss(0, 1)), 0.0)
+        records = list(self._records)
+        for n, limit in zip(self._data, self._limits):
+            if isinstance(records[n], float):
+                records[n] = value
+            else:
+                records[n] = int(min(max(round(value), 1), limit)) if value else 0
+        message = self.sensor.Message.encode(tuple(records), self.sensor.Commands.passive_read)
+        if self.device is not None:  # device ID on bytes 6-7
+            message = self.sensor.Message._encode(message[:2], message[2:6] + self.device)
+        return message
+
+    def _generate(self) -> Generator[Tuple[float, bytes], None, None]:
+        """simulated messages, and seconds to wait before sending them on active mode"""
+        while True:
+            yield self.period, self._message()
+
+    def _replay(self) -> Generator[Tuple[float, bytes], None, None]:
+        """captured messages, and seconds to wait before sending them on active mode"""
+        assert self.capture is not None
+        with MessageReader(self.capture, self.sensor) as reader:
+            last: Optional[int] = None
+            for raw in reader(raw=True):
+                delay = 0.0 if last is None else (raw.time - last) / self.speed
+                last = raw.time
+                yield delay, raw.data
+        logger.debug(f"end of {self.sensor.name} replay from {self.capture}")
+
+    def _fault(self, message: bytes) -> bytes:
+        """inject faults with the configured probabilities"""
+        for fault, p in self.faults.items():
+            if self.random.random() >= p:
+                continue
+            logger.debug(f"inject {fault.value} fault on {self.sensor.name} message")
+            if fault == Fault.warmup:
+                return self._message(0.0)
+            if fault == Fault.truncated:
+                return message[: self.random.randrange(1, len(message))]
+            if fault == Fault.checksum:
+                n = len(self.sensor.Commands.passive_read.answer_header)
+                return message[:n] + bytes([message[n] ^ 0x01]) + message[n + 1 :]
+        return message
+
+    def close(self) -> None:
+        """stop generating/replaying messages"""
+        self._frames.close()
+        self._next = None
+
+    def message(self) -> bytes:
+        """next message, empty when the replay is over"""
+        if time.monotonic() < self.warm:
+            return self._message(0.0)
+        frame = next(self._frames, None)
+        if frame is None:
+            return b""
+        self.sent += 1
+        return self._fault(frame[1])
+
+    def answer(self, name: str, command: bytes = b"") -> bytes:
+        """answer to a single command, and update the sensor state"""
+        if name == "sleep":
+            self.awake = False
+        elif name == "wake":
+            if not self.awake:
+                self.warm = time.monotonic() + self.warmup_time
+            self.awake = True
+        elif not self.awake:
+            return b""
+        elif name == "passive_mode":
+            self.active = False
+        elif name == "active_mode":
+            self.active = True
+
+        cmd = self.sensor.command(name)
+        if cmd.answer_header == self.sensor.Commands.passive_read.answer_header:
+            return self.message()
+        if cmd.answer_length <= len(cmd.answer_header):
+            return cmd.answer_header[: cmd.answer_length]
+        return self._ack(cmd.answer_header, cmd.answer_length, command)
+
+    def _ack(self, header: bytes, length: int, command: bytes) -> bytes:
+        """acknowledge with the command code, and the device ID"""
+        size = length - len(self.sensor.Message._encode(header, b""))
+        payload = (command[2:] + bytes(size))[:size]
+        if self.device is not None:
+            payload = payload[:-2] + self.device
+        return self.sensor.Message._encode(header, payload)
+
+    def _write_addressed(self) -> bytes:
+        """answer the NovaFitness commands for this device, or every device"""
+        answers: List[bytes] = []
+        while True:
+            start = self._received.find(b"\xAA\xB4")
+            if start < 0 or len(self._received) - start < 19:
+                del self._received[: start if start >= 0 else max(len(self._received) - 1, 0)]
+                break
+            frame = bytes(self._received[start : start + 19])
+            del self._received[: start + 19]
+            device = frame[15:17]
+            if device not in [b"\xFF\xFF", self.device]:
+                continue
+            # broadcast version of the command, as on self.sensor.Commands
+            broadcast = frame[:15] + b"\xFF\xFF" + bytes([(sum(frame[2:15]) + 0xFE) % 0x100])
+            name = self._commands.get(broadcast + b"\xAB")
+            if name is not None:
+                answers.append(self.answer(name, frame))
+            elif self.awake:  # extra command
+                answers.append(self._ack(b"\xAA\xC5", 10, frame))
+        return b"".join(answers)
+
+    def write(self, data: bytes) -> bytes:
+        """answer the complete commands on data, partial commands wait for the next write"""
+        if not self._commands:  # sensor does not accept commands
+            return b""
+        self._received += data
+        if self.device is not None:
+            return self._write_addressed()
+        answers: List[bytes] = []
+        while True:
+            found = [(self._received.find(cmd), cmd) for cmd in self._commands]
+            found = [(start, cmd) for start, cmd in found if start >= 0]
+            if not found:  # keep what could be the start of a command
+                keep = max(map(len, self._commands)) - 1
+                del self._received[: max(len(self._received) - keep, 0)]
+                break
+            start, cmd = min(found)
+            del self._received[: start + len(cmd)]
+            answers.append(self.answer(self._commands[cmd], cmd))
+        return b"".join(answers)
+
+    @property
+    def deadline(self) -> Optional[float]:
+        """time of the next active mode message, None when not sending messages"""
+        return self._next[0] if self._next else None
+
+    def due(self, now: float) -> bytes:
+        """active mode messages due by `now`, as time.monotonic() seconds"""
+        if not (self.active and self.awake):
+            self._next = None
+            return b""
+        if self._next is None:
+            frame = next(self._frames, None)
+            if frame is None:
+                return b""
+            self._next = (now + frame[0], frame[1])
+        messages: List[bytes] = []
+        while self._next and self._next[0] <= now:
+            deadline, message = self._next
+            self.sent += 1
+            messages.append(self._fault(message))
+            frame = next(self._frames, None)
+            self._next = (deadline + frame[0], frame[1]) if frame else None
+        return b"".join(messages)
+
+
+class SimulatedBus:
+    """Several simulated NovaFitness sensors on a shared line
+
+    >>> bus = SimulatedBus([SimulatedSensor("SDS01x", device=0xA001), ...])
+    >>> reader.serial = SimulatedSerial(bus)
+    """
+
+    def __init__(self, sensors: Sequence[SimulatedSensor]) -> None:
+        assert sensors, "no sensors on bus"
+        self.sensors = list(sensors)
+        self.sensor = self.sensors[0].sensor
+        assert all(s.sensor == self.sensor for s in self.sensors), "mixed sensor models"
+        assert all(s.device is not None for s in self.sensors), "sensors without device ID"
+        self.latency = max(s.latency for s in self.sensors)
+
+    def close(self) -> None:
+        for sensor in self.sensors:
+            sensor.close()
+
+    def write(self, data: bytes) -> bytes:
+        """every sensor reads the line, and answers the commands for its device ID"""
+        return b"".join(sensor.write(data) for sensor in self.sensors)
+
+    @property
+    def deadline(self) -> Optional[float]:
+        """sensors on a bus are polled, no active mode messages"""
+        return None
+
+    def due(self, now: float) -> bytes:
+        return b""
+
+
+class SimulatedSerial:
+    """In-process stand-in for serial.Serial, attached to a simulated sensor
+
+    >>> reader = SensorReader("SDS01x")
+    >>> reader.serial = SimulatedSerial(SimulatedSensor("SDS01x"))
+    """
+
+    def __init__(
+        self, sensor: Union[SimulatedSensor, SimulatedBus], timeout: Optional[float] = 5
+    ) -> None:
+        self.sensor = sensor
+        self.port = f"sim://{sensor.sensor.name}"
+        self.baudrate = sensor.sensor.baud
+        self.timeout = timeout
+        self.is_open = False
+        self._input = bytearray()
+        self._answers: Deque[Tuple[float, bytes]] = deque()  # (time, answer) after latency
+
+    def open(self) -> None:
+        self.is_open = True
+
+    def close(self) -> None:
+        self.is_open = False
+
+    def _update(self) -> Optional[float]:
+        """move due messages to the input buffer, and return the time of the next one"""
+        now = time.monotonic()
+        while self._answers and self._answers[0][0] <= now:
+            self._input += self._answers.popleft()[1]
+        self._input += self.sensor.due(now)
+        deadlines = [self._answers[0][0]] if self._answers else []
+        if self.sensor.deadline is not None:
+            deadlines.append(self.sensor.deadline)
+        return min(deadlines, default=None)
+
+    def write(self, data: bytes) -> int:
+        answer = self.sensor.write(bytes(data))
+        if answer:
+            self._answers.append((time.monotonic() + self.sensor.latency, answer))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    @property
+    def in_waiting(self) -> int:
+        self._update()
+        return len(self._input)
+
+    def reset_input_buffer(self) -> None:
+        self._update()
+        self._input.clear()
+
+    def read(self, size: int = 1) -> bytes:
+        end = None if self.timeout is None else time.monotonic() + self.timeout
+        while True:
+            deadline = self._update()
+            if len(self._input) >= size:
+                break
+            now = time.monotonic()
+            if end is not None and now >= end:
+                break
+            if deadline is None and end is None:  # pragma: no cover
+                break  # nothing else will come
+            wake = min(t for t in [deadline, end] if t is not None)
+            time.sleep(max(wake - now, 0))
+        data = bytes(self._input[:size])
+        del self._input[:size]
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+
+class PseudoTerminal(threading.Thread):
+    """Serve a simulated sensor over a pseudo-terminal
+
+    >>> with PseudoTerminal(SimulatedSensor("PMSx003")) as pty:
+    >>>     with SensorReader("PMSx003", pty.port) as reader:
+    >>>         ...
+    """
+
+    def __init__(self, sensor: Union[SimulatedSensor, SimulatedBus]) -> None:
+        super().__init__(name=f"sim-{sensor.sensor.name}", daemon=True)
+        self.sensor = sensor
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self.closing = threading.Event()
+
+    def run(self) -> None:
+        while not self.closing.is_set():
+            now = time.monotonic()
+            data = self.sensor.due(now)
+            deadline = self.sensor.deadline
+            timeout = 0.1 if deadline is None else min(max(deadline - now, 0), 0.1)
+            try:
+                if data:
+                    os.write(self._master, data)
+                ready, _, _ = select.select([self._master], [], [], timeout)
+                if not ready:
+                    continue
+                answer = self.sensor.write(os.read(self._master, 1024))
+                if answer:
+                    if self.sensor.latency:
+                        time.sleep(self.sensor.latency)
+                    os.write(self._master, answer)
+            except OSError as e:  # pragma: no cover
+                if not self.closing.is_set():
+                    logger.error(f"{self.name} on {self.port} failed: {e!r}")
+                break
+
+    def close(self) -> None:
+        self.closing.set()
+        if self.is_alive():
+            self.join()
+        os.close(self._master)
+        os.close(self._slave)
+        self.sensor.close()
+
+    def __enter__(self) -> "PseudoTerminal":
+        logger.debug(f"serve simulated {self.sensor.sensor.name} on {self.port}")
+        self.start()
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback) -> None:
+        self.close()
@@ -0,0 +1,269 @@
+"""
+Declarative message and observation specs
+
+Sensors with fixed-layout frames, header + payload + checksum [+ tail],
+describe their protocol instead of hand-writing the decoder
+
+    class Message(spec.Message):
+        protocol = spec.Protocol(
+            b"\\xAA", 2, lengths=(10,), checksum=spec.Checksum.sum8, tail=b"\\xAB", record="<H"
+        )
+        data_records = slice(2)
+
+and their observations by the field metadata
+
+    @dataclass(frozen=False)
+    class ObsData(spec.ObsData):
+        pm25: float = field(metadata=base.metadata("PM2.5", "ug/m3", "concentration", scale=10))
+
+From the protocol, every Message subclass gets its frame slices and payload structs
+precompiled at import, and all of them share one split/validate/unpack/encode path.
+From the field metadata, ObsData gets its unit conversions and its csv and pm formats.
+"""
+
+import re
+import struct
+from dataclasses import dataclass, fields
+from enum import Enum
+from functools import lru_cache
+from typing import Any, Dict, NamedTuple, Tuple
+
+try:
+    import numpy
+except ModuleNotFoundError:  # pragma: no cover
+    numpy = None  # type: ignore
+
+from pms import WrongMessageFormat, WrongMessageChecksum, SensorWarmingUp
+from pms.sensor import base, checksum
+
+
+class Checksum(Enum):
+    """Checksum algorithms"""
+
+    sum16 = "sum16"  # sum of header and payload, 16b big endian
+    sum8 = "sum8"  # sum of payload, 8b
+    neg8 = "neg8"  # two's complement of the sum of header and payload, 8b
+
+    @property
+    def size(self) -> int:
+        """checksum size [bytes]"""
+        return 2 if self is Checksum.sum16 else 1
+
+    @property
+    def kernel(self) -> checksum.Kernel:
+        return dict(sum16=checksum.SUM16, sum8=checksum.SUM8, neg8=checksum.NEG8)[self.value]
+
+    def start(self, header_length: int) -> int:
+        """first byte covered by the checksum"""
+        return header_length if self is Checksum.sum8 else 0
+
+
+class Protocol(NamedTuple):
+    """Frame layout: header + payload + checksum [+ tail]"""
+
+    header_start: bytes  # constant start of every answer header
+    header_length: int
+    lengths: Tuple[int, ...] = ()  # valid frame lengths, empty for lengths from the header
+    checksum: Checksum = Checksum.sum16
+    tail: bytes = b""
+    record: str = ">H"  # struct format of the payload records
+    data: slice = slice(None)  # payload bytes that read zero while the sensor warms up
+
+
+# struct format characters to numpy type codes
+_NUMPY = dict(B="u1", H="u2", h="i2", L="u4", l="i4", f="f4")
+
+
+class Message(base.Message):
+    """Messages described by a Protocol
+
+    Subclasses set `protocol` and `data_records`, and optionally `layouts`
+    for payloads with mixed record types, e.g. {26: ">10Hh2H"} (payload length: format)
+    """
+
+    __slots__ = ()
+
+    protocol: Protocol
+    layouts: Dict[int, str] = {}
+
+    # precompiled on subclass creation
+    _header: slice
+    _payload: slice
+    _checksum: slice
+    _kernel: checksum.Kernel
+    _summed: int  # first byte covered by the checksum
+    _trailer: int  # checksum and tail length
+    _structs: Dict[int, struct.Struct]  # by payload length, for unpack
+    _packers: Dict[int, struct.Struct]  # by number of records, for pack
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)  # type: ignore
+        protocol = cls.protocol
+        end = protocol.checksum.size + len(protocol.tail)
+        cls._header = slice(protocol.header_length)
+        cls._payload = slice(protocol.header_length, -end)
+        cls._checksum = slice(-end, -len(protocol.tail) or None)
+        cls._kernel = protocol.checksum.kernel
+        cls._summed = protocol.checksum.start(protocol.header_length)
+        cls._trailer = end
+        cls._structs = {length: struct.Struct(fmt) for length, fmt in cls.layouts.items()}
+        cls._packers = {len(s.unpack(bytes(s.size))): s for s in cls._structs.values()}
+
+    @classmethod
+    def _split(cls, message: bytes) -> Tuple[bytes, bytes, int]:  # type: ignore
+        checksum = int.from_bytes(message[cls._checksum], "big")
+        return message[cls._header], message[cls._payload], checksum
+
+    @property
+    def tail(self) -> bytes:
+        return self.message[-len(self.protocol.tail) :] if self.protocol.tail else b""
+
+    @classmethod
+    def _length(cls, header: bytes) -> int:
+        """frame length from the header, for protocols without fixed lengths"""
+        return cls.protocol.header_length + int.from_bytes(header[-2:], "big")
+
+    @classmethod
+    def _signature(cls, header: bytes, length: int) -> None:
+        """consistency check: bug in message singnature"""
+        protocol = cls.protocol
+        assert len(header) == protocol.header_length, f"wrong header length {len(header)}"
+        start = protocol.header_start
+        assert header[: len(start)] == start, f"wrong header start {header!r}"
+        lengths = protocol.lengths or (cls._length(header),)
+        if len(lengths) == 1:
+            assert length in lengths, f"wrong payload length {length} != {lengths[0]}"
+        else:
+            assert length in lengths, f"wrong payload length {length}"
+
+    @classmethod
+    def _validate(cls, message: bytes, header: bytes, length: int) -> base.Message:
+        protocol = cls.protocol
+        cls._signature(header, length)
+
+        # validate message: recoverable errors (throw away observation)
+        msg = cls(message)
+        if msg.header != header:
+            raise WrongMessageFormat(f"message header: {msg.header!r}")
+        if msg.tail != protocol.tail:
+            raise WrongMessageFormat(f"message tail: {int.from_bytes(msg.tail, 'big'):#x}")
+        if len(message) != length:
+            raise WrongMessageFormat(f"message length: {len(message)} != {length}")
+        checksum = cls._kernel(message, cls._summed, length - cls._trailer)
+        if msg.checksum != checksum:
+            raise WrongMessageChecksum(f"message checksum {msg.checksum} != {checksum}")
+        if not any(msg.payload[protocol.data]):
+            raise SensorWarmingUp(f"message empty: warming up sensor")
+        return msg
+
+    @classmethod
+    def _struct(cls, length: int) -> struct.Struct:
+        """payload struct, compiled once per payload length"""
+        if length not in cls._structs:
+            record = cls.protocol.record
+            count = length // struct.calcsize(record)
+            cls._structs[length] = struct.Struct(f"{record[0]}{count}{record[1:]}")
+        return cls._structs[length]
+
+    @classmethod
+    def _unpack(cls, message: bytes) -> Tuple[float, ...]:  # type: ignore
+        return cls._struct(len(message)).unpack(message)
+
+    @classmethod
+    def validate_batch(cls, frames: bytes, header: bytes, length: int) -> Any:
+        """Validate consecutive `length` byte frames at once, numpy mask of the valid frames
+
+        same checks as _validate, frames are not searched for a complete message
+        """
+        cls._signature(header, length)
+        protocol = cls.protocol
+        rows = numpy.frombuffer(frames, dtype=numpy.uint8).reshape(-1, length)
+        valid = (rows[:, cls._header] == numpy.frombuffer(header, dtype=numpy.uint8)).all(axis=1)
+        if protocol.tail:
+            tail = numpy.frombuffer(protocol.tail, dtype=numpy.uint8)
+            valid &= (rows[:, length - len(protocol.tail) :] == tail).all(axis=1)
+        stored = rows[:, cls._checksum].astype(numpy.int64)
+        if protocol.checksum.size == 2:
+            stored = stored[:, 0] << 8 | stored[:, 1]
+        else:
+            stored = stored[:, 0]
+        valid &= cls._kernel.batch(frames, length, cls._summed, length - cls._trailer) == stored
+        valid &= rows[:, cls._payload][:, protocol.data].any(axis=1)
+        return valid
+
+    @classmethod
+    def unpack_batch(cls, frames: bytes, length: int) -> Any:
+        """Unpack consecutive `length` byte frames at once, numpy array with a row per frame"""
+        rows = numpy.frombuffer(frames, dtype=numpy.uint8).reshape(-1, length)
+        payload = numpy.ascontiguousarray(rows[:, cls._payload])
+        fmt = cls._struct(payload.shape[1]).format
+        fmt = fmt.decode() if isinstance(fmt, bytes) else fmt  # type: ignore # bytes on py36
+        order, codes = fmt[0], "".join(
+            code * int(count or 1) for count, code in re.findall(r"(\d*)(\w)", fmt[1:])
+        )
+        dtype = [(f"r{n}", f"{order}{_NUMPY[code]}") for n, code in enumerate(codes)]
+        records = payload.view(dtype).reshape(-1)
+        return numpy.stack([records[name].astype(numpy.float64) for name, _ in dtype], axis=1)
+
+    @classmethod
+    def _encode(cls, header: bytes, payload: bytes) -> bytes:
+        message = header + payload
+        checksum = cls._kernel(message, cls._summed).to_bytes(cls.protocol.checksum.size, "big")
+        return message + checksum + cls.protocol.tail
+
+    @classmethod
+    def _pack(cls, records: Tuple[float, ...]) -> bytes:  # type: ignore
+        packer = cls._packers.get(len(records))
+        if packer is None:
+            packer = cls._struct(len(records) * struct.calcsize(cls.protocol.record))
+        return packer.pack(*records)
+
+
+@dataclass  # type: ignore
+class ObsData(base.ObsData):
+    """Observations described by their field metadata
+
+    - unit conversions: fields read as value*scale, metadata(..., scale=10)
+    - csv format: time and every field with metadata, with one decimal
+    - pm format: every field with metadata, with its long name and units
+    """
+
+    @classmethod
+    @lru_cache(maxsize=None)
+    def _scales(cls) -> Tuple[Tuple[str, int], ...]:
+        return tuple(
+            (field.name, field.metadata["scale"])
+            for field in fields(cls)
+            if field.metadata.get("scale", 1) != 1
+        )
+
+    def _convert(self) -> None:
+        for name, scale in self._scales():
+            setattr(self, name, getattr(self, name) / scale)
+
+    @classmethod
+    @lru_cache(maxsize=None)
+    def _templates(cls) -> Tuple[str, str]:
+        """csv and pm format templates"""
+        described = [field for field in fields(cls) if field.metadata]
+        csv = "{0.time}" + "".join(f", {{0.{field.name}:.1f}}" for field in described)
+        units = {field.metadata["units"] for field in described}
+        values = ", ".join(f"{f.metadata['long_name']} {{0.{f.name}:.1f}}" for f in described)
+        pm = "{0.date:%F %T}: " + values + (f" {units.pop()}" if len(units) == 1 else "")
+        return csv, pm
+
+    @classmethod
+    def csv_formatter(cls):  # type: ignore
+        if "csv_format" not in vars(cls):
+            cls.csv_format = cls._templates()[0]
+        return super().csv_formatter()
+
+    def __format__(self, spec: str) -> str:
+        if spec in ["header", "csv"]:
+            return super().__format__(spec)
+        if spec == "pm":
+            return self._templates()[1].format(self)
+        raise ValueError(  # pragma: no cover
+            f"Unknown format code '{spec}' "
+            f"for object of type '{type(self).__module__}.{type(self).__name__}'"
+        )
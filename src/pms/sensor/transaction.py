@@ -0,0 +1,194 @@
+"""
+Command/response transactions with PM sensors
+
+Commands are written to the serial port, and answers are matched to their commands by
+- answer_header, and answer_length (or the frame delimiters, for byte-stuffed messages)
+- the command code or device ID echoed on the answer, for protocols that echo them
+Bytes that do not belong to a pending command, such as a late answer to an earlier command,
+are discarded, so they do not corrupt the next answer.
+
+Every command has a deadline, and can be written again with exponential backoff
+when the deadline passes without an answer. Retries are opt-in (retries=0 by default),
+as every retry adds a full deadline to an unanswered command, e.g. a sensor
+that is already asleep or a missing device on a bus.
+Several commands can be in flight at once, e.g. queries to every device on a shared
+NovaFitness bus, and their answers are matched in the order they arrive.
+Commands without command bytes (PMS3003) wait for the next matching message.
+
+Answers are memoryview slices of the receive buffer, valid until the next transaction:
+the buffer is compacted in place when a transaction starts, and replaced by a new one
+when it fills up during a transaction, so earlier answers from that transaction stay intact.
+"""
+
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from pms import logger, MissingAnswer
+from pms.sensor import Sensor
+from pms.sensor.base import Cmd
+
+
+class Transport:
+    """Command/response transactions over a serial port
+
+    >>> transport = Transport(serial, Sensor.SDS01x)
+    >>> answer = transport.request(extra_commands.firmware_version())
+    >>> answers = transport.pipeline([sds01x.commands.passive_read, ...])
+    """
+
+    def __init__(
+        self,
+        serial: Any,
+        sensor: Sensor,
+        *,
+        retries: int = 0,
+        backoff: float = 0.5,
+        buffer_size: int = 256,
+    ) -> None:
+        assert retries >= 0, f"retries out of range: {retries} < 0"
+        self.serial = serial
+        self.sensor = sensor
+        self.retries = retries
+        self.backoff = backoff
+        self._buffer = bytearray(buffer_size)  # received bytes
+        self._start = 0  # first byte not matched yet
+        self._length = 0  # valid bytes on buffer
+
+    @property
+    def timeout(self) -> float:
+        """default deadline [s], the serial port timeout"""
+        return self.serial.timeout or 0
+
+    def reset(self) -> None:
+        """Discard received, and waiting, bytes"""
+        self._start = self._length = 0
+        self.serial.reset_input_buffer()
+
+    def _compact(self) -> None:
+        """Move the unmatched bytes to the start of the buffer, in place
+
+        answers from earlier transactions are overwritten
+        """
+        if self._start:
+            unmatched = self._length - self._start
+            self._buffer[:unmatched] = self._buffer[self._start : self._length]
+            self._start, self._length = 0, unmatched
+
+    def _receive(self, size: int) -> None:
+        """Read at least `size` bytes, or what arrives before the serial port timeout"""
+        size = max(size, self.serial.in_waiting, 1)
+        if self._length + size > len(self._buffer):
+            # a new buffer, answers on the old one stay valid
+            unmatched = self._length - self._start
+            buffer = bytearray(max(len(self._buffer), unmatched + size))
+            logger.debug(f"new {len(buffer)} bytes buffer")
+            buffer[:unmatched] = self._buffer[self._start : self._length]
+            self._buffer, self._start, self._length = buffer, 0, unmatched
+        with memoryview(self._buffer) as view:
+            self._length += self.serial.readinto(view[self._length : self._length + size])
+
+    def _discard(self, size: int) -> None:
+        """Drop the first `size` unmatched bytes"""
+        self._start += size
+
+    def _match(self, pending: Dict[int, Cmd], answers: List[Optional[bytes]]) -> int:
+        """Match complete answers on the buffer, and return the bytes needed for the next answer"""
+        Message = self.sensor.Message
+        buffer = self._buffer
+        while pending:
+            start, end = self._start, self._length
+            found = [(buffer.find(cmd.answer_header, start, end), n) for n, cmd in pending.items()]
+            found = [(s - start, n) for s, n in found if s >= 0]
+            if not found:
+                # keep what could be the start of an answer
+                keep = max(len(cmd.answer_header) for cmd in pending.values()) - 1
+                if end - start > keep:
+                    logger.debug(f"discard {end - start - keep} unmatched bytes")
+                    self._discard(end - start - keep)
+                return min(cmd.answer_length for cmd in pending.values()) - (end - self._start)
+
+            skip, _ = min(found)
+            if skip:
+                logger.debug(f"discard {skip} unmatched bytes: {buffer[start:start + skip].hex()}")
+                self._discard(skip)
+                continue
+
+            # answers with the same header, in request order
+            same = sorted(n for s, n in found if s == 0)
+            lengths = {
+                n: Message.frame_length(buffer, start, pending[n].answer_length, end) for n in same
+            }
+            for n in same:
+                length = lengths[n]
+                if length is None:
+                    continue
+                answer = memoryview(buffer)[start : start + length]
+                if Message.answers(pending[n].command, answer):  # type: ignore
+                    answers[n] = answer  # type: ignore
+                    del pending[n]
+                    self._discard(length)
+                    break
+            else:
+                incomplete = [pending[n].answer_length for n in same if lengths[n] is None]
+                if incomplete:
+                    return min(incomplete) - (end - start)
+                # stale answer, e.g. to an earlier command or to another device on the bus
+                logger.debug(f"discard unexpected answer: {buffer[start:end].hex()}")
+                self._discard(1)
+        return 0
+
+    def pipeline(
+        self,
+        commands: Sequence[Cmd],
+        *,
+        timeout: Optional[float] = None,
+        retries: Optional[int] = None,
+    ) -> List[Optional[bytes]]:
+        """Write every command at once, and collect their answers
+
+        Commands without answer get an empty answer, unanswered commands None.
+        Answers are only valid until the next transaction, copy them to keep them.
+        The deadline is checked between reads, so a deadline shorter than the serial port
+        timeout can be overrun by up to the serial port timeout.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        retries = self.retries if retries is None else retries
+        self._compact()
+        answers: List[Optional[bytes]] = [None] * len(commands)
+        pending: Dict[int, Cmd] = {}
+        for n, cmd in enumerate(commands):
+            if cmd.answer_length:
+                pending[n] = cmd
+            else:
+                answers[n] = b""
+                if cmd.command:
+                    self.serial.write(cmd.command)
+
+        for attempt in range(retries + 1):
+            if not pending:
+                break
+            if attempt:
+                delay = self.backoff * 2 ** (attempt - 1)
+                logger.debug(f"{len(pending)} commands unanswered, retry in {delay} s")
+                time.sleep(delay)
+            for cmd in pending.values():
+                if cmd.command:
+                    self.serial.write(cmd.command)
+            self.serial.flush()
+
+            deadline = time.monotonic() + timeout
+            while pending:
+                needed = self._match(pending, answers)
+                if not pending or time.monotonic() >= deadline:
+                    break
+                self._receive(needed)
+        return answers
+
+    def request(
+        self, command: Cmd, *, timeout: Optional[float] = None, retries: Optional[int] = None
+    ) -> bytes:
+        """Write command and return its answer, raise MissingAnswer after the last retry"""
+        answer = self.pipeline([command], timeout=timeout, retries=retries)[0]
+        if answer is None:
+            raise MissingAnswer(f"no answer to {command.command.hex() or 'listen'}")
+        return answer
@@ -0,0 +1,191 @@
+"""
+End-to-end throughput benchmark for the service layer
+
+Run the `mqtt` and `bridge` commands against local stand-ins
+(pms.service.standin) and simulated sensors (pms.sensor.simulator), and measure
+- throughput: delivered messages per second
+- latency percentiles:
+  - mqtt: from the sensor answer to the arrival of the observation on the broker
+  - bridge: from the arrival of a message on the broker to its arrival on the database
+- memory: peak resident set size, and peak traced allocations (trace_memory=True)
+"""
+
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from dataclasses import fields
+from typing import List, NamedTuple, Sequence, Tuple
+
+from pms import logger
+from pms.sensor import Sensor
+from pms.sensor.simulator import PseudoTerminal, SimulatedSensor
+from pms.service.standin import InfluxDBStub, MQTTBroker
+
+
+class Report(NamedTuple):
+    """Benchmark results"""
+
+    name: str
+    messages: int
+    seconds: float
+    latency: Tuple[float, ...]  # p50, p90, p99 [s]
+    peak_rss: float  # MB
+    peak_traced: float = 0  # MB, only with trace_memory=True
+
+    @property
+    def rate(self) -> float:
+        """messages per second"""
+        return self.messages / self.seconds if self.seconds > 0 else 0
+
+    def __str__(self) -> str:
+        p50, p90, p99 = (t * 1e3 for t in self.latency)
+        memory = f"peak RSS {self.peak_rss:.1f} MB"
+        if self.peak_traced:
+            memory += f", peak traced {self.peak_traced:.1f} MB"
+        return (
+            f"{self.name}: {self.messages} messages in {self.seconds:.2f} s "
+            f"({self.rate:.0f} msg/s), latency p50/p90/p99 {p50:.1f}/{p90:.1f}/{p99:.1f} ms, {memory}"
+        )
+
+
+def percentiles(data: Sequence[float], *q: float) -> Tuple[float, ...]:
+    """nearest-rank percentiles"""
+    if not data:
+        return tuple(0.0 for _ in q)
+    data = sorted(data)
+    return tuple(data[min(int(len(data) * p / 100), len(data) - 1)] for p in q)
+
+
+def _peak_rss() -> float:
+    """peak resident set size [MB], ru_maxrss is in bytes on macOS and in kB elsewhere"""
+    scale = 2**20 if sys.platform == "darwin" else 2**10
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+class _TimedSensor(SimulatedSensor):
+    """keep the time of every passive_read answer"""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.reads: List[float] = []
+
+    def answer(self, name: str, command: bytes = b"") -> bytes:
+        if name == "passive_read" and self.awake:
+            self.reads.append(time.monotonic())
+        return super().answer(name, command)
+
+
+def _report(
+    name: str, messages: int, start: float, sent: List[float], arrived: List[float], traced: bool
+) -> Report:
+    end = arrived[-1] if arrived else time.monotonic()
+    latency = [b - a for a, b in zip(sent, arrived)]
+    peak_traced = tracemalloc.get_traced_memory()[1] / 2**20 if traced else 0
+    return Report(
+        name, messages, end - start, percentiles(latency, 50, 90, 99), _peak_rss(), peak_traced
+    )
+
+
+def bench_mqtt(
+    sensor: str = "PMSx003",
+    samples: int = 1000,
+    *,
+    topic: str = "homie/bench",
+    timeout: float = 60,
+    trace_memory: bool = False,
+) -> Report:
+    """Run `pms mqtt` on a simulated sensor against a local MQTT broker"""
+    from pms.cli import main
+
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        with MQTTBroker(record=True) as broker:
+            simulated = _TimedSensor(sensor, seed=0)
+            with PseudoTerminal(simulated) as pty:
+                start = time.monotonic()
+                args = (
+                    f"-m {sensor} -s {pty.port} -n {samples} -i 0 "
+                    f"mqtt -t {topic} --mqtt-host {broker.host} --mqtt-port {broker.port}"
+                )
+                main(args.split(), standalone_mode=False)
+            reads = simulated.reads
+
+            # observations are complete when their last measurement arrives
+            last = [field for field in fields(Sensor[sensor].Data) if field.metadata][-1]
+            target = f"{topic}/{last.name}/{last.metadata['topic']}"
+            if not broker.wait(len(reads), topic=target, timeout=timeout):  # pragma: no cover
+                logger.warning(f"mqtt benchmark timed out after {timeout} s")
+            arrived = [msg.time for msg in broker.messages if msg.topic == target]
+            messages = sum(1 for msg in broker.messages if msg.topic.startswith(topic))
+        return _report("mqtt", messages, start, reads, arrived, trace_memory)
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+
+
+def bench_bridge(
+    samples: int = 1000,
+    *,
+    rate: float = 0,
+    topic: str = "homie/bench",
+    timeout: float = 60,
+    trace_memory: bool = False,
+) -> Report:
+    """Run `pms bridge` between a local MQTT broker and a local InfluxDB endpoint
+
+    Messages are published at `rate` messages per second (0: as fast as possible).
+    The bridge runs on its own thread, with the `bridge` command defaults,
+    and is stopped at the end of the run.
+    """
+    from pms.service.cli import run_bridge
+    from pms.service.influxdb import Schema, client_pub
+
+    if trace_memory:
+        tracemalloc.start()
+    stop = threading.Event()
+    try:
+        with MQTTBroker() as broker, InfluxDBStub() as db:
+            pub = client_pub(
+                host=db.host,
+                port=db.port,
+                username="root",
+                password="root",
+                db_name="homie",
+                schema=Schema.field,
+            )
+            mqtt = dict(topic=f"{topic.split('/')[0]}/+/+/+", host=broker.host, port=broker.port)
+            bridge = threading.Thread(
+                target=run_bridge,
+                args=(pub, Schema.field, 1024),
+                kwargs=dict(stop=stop, username="", password="", **mqtt),
+                name="bridge",
+                daemon=True,
+            )
+            bridge.start()
+            if not broker.wait(subscribers=1, timeout=timeout):  # pragma: no cover
+                raise TimeoutError(f"bridge did not subscribe after {timeout} s")
+
+            start = time.monotonic()
+            sent: List[float] = []
+            for n in range(samples):
+                if rate:
+                    delay = start + n / rate - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                sent.append(broker.publish(f"{topic}/pm25/concentration", str(n).encode()).time)
+
+            if not db.wait(samples, timeout=timeout):  # pragma: no cover
+                logger.warning(f"bridge benchmark timed out after {timeout} s")
+            arrived = [t for t, _ in db.points]
+            messages = len(db.points)
+            report = _report("bridge", messages, start, sent, arrived, trace_memory)
+            stop.set()
+            bridge.join(timeout)
+        return report
+    finally:
+        stop.set()
+        if trace_memory:
+            tracemalloc.stop()
@@ -1,7 +1,29 @@
-from typer import Context, Option
+import json
+import signal
+import threading
+from contextlib import ExitStack
+from enum import Enum
+from pathlib import Path
+from typing import Any, List, Optional
 
-from pms.service.influxdb import client_pub, influxdb
-from pms.service.mqtt import client_sub, Data, mqtt
+from typer import Argument, Context, Option, BadParameter, echo
+
+from pms import logger
+from pms.pipeline.dedup import Gaps, Window
+
+from pms.service.csvfile import CSVFile
+from pms.service.fanout import FanOut, Overflow, Sink, SinkWorker
+from pms.service.fleet import Fleet, load
+from pms.service.http import Server
+from pms.service.influxdb import (
+    Points,
+    PubFunc,
+    Schema,
+    client_pub,
+    influxdb,
+    publisher as db_publisher,
+)
+from pms.service.mqtt import client_sub, Data, mqtt, publisher as mqtt_publisher
 
 
 def bridge(
@@ -15,20 +37,188 @@ def bridge(
     db_user: str = Option("root", help="server username"),
     db_pass: str = Option("root", help="server password"),
     db_name: str = Option("homie", help="database name"),
+    db_schema: Schema = Option(Schema.field, help="measurement per field or point"),
+    dedup: int = Option(1024, help="messages on the repeated message window, 0 to disable"),
 ):
-    """Bridge between MQTT and InfluxDB servers"""
+    """Bridge between MQTT and InfluxDB servers
+
+    With --db-schema point, the fields of a location received on the same second
+    are merged into a single point
+    """
     pub = client_pub(
-        host=db_host, port=db_port, username=db_user, password=db_pass, db_name=db_name
+        host=db_host,
+        port=db_port,
+        username=db_user,
+        password=db_pass,
+        db_name=db_name,
+        schema=db_schema,
     )
-
-    def on_sensordata(data: Data) -> None:
-        pub(time=data.time, tags={"location": data.location}, data={data.measurement: data.value})
-
-    client_sub(
+    run_bridge(
+        pub,
+        db_schema,
+        dedup,
         topic=mqtt_topic,
         host=mqtt_host,
         port=mqtt_port,
         username=mqtt_user,
         password=mqtt_pass,
-        on_sensordata=on_sensordata,
     )
+
+
+def run_bridge(
+    pub: PubFunc,
+    schema: Schema,
+    dedup: int,
+    *,
+    stop: Optional[threading.Event] = None,
+    **mqtt: Any,
+) -> None:
+    """Deliver sensor data from MQTT to the database, until the MQTT loop ends or `stop` is set"""
+    if schema is Schema.point:
+        pub = Points(pub)
+    window = Window(dedup) if dedup > 0 else None
+    gaps = Gaps()
+
+    def on_sensordata(data: Data) -> None:
+        if window is not None and window.seen(data):  # location, measurement, time and value
+            logger.debug(f"drop repeated message {data}")
+            return
+        gaps((data.location, data.measurement), data.time)
+        pub(time=data.time, tags={"location": data.location}, data={data.measurement: data.value})
+
+    try:
+        client_sub(on_sensordata=on_sensordata, stop=stop, **mqtt)
+    finally:
+        if isinstance(pub, Points):  # write the points still waiting for fields
+            pub.flush()
+
+
+class SinkName(str, Enum):
+    csv = "csv"
+    mqtt = "mqtt"
+    influxdb = "influxdb"
+
+
+def fanout(
+    ctx: Context,
+    sinks: List[SinkName] = Option(..., "--sink", help="deliver observations to sink"),
+    path: Path = Option(Path("pypms.csv"), "--csv-file", help="csv formatted file"),
+    mqtt_topic: str = Option("homie/test", help="mqtt root/topic"),
+    mqtt_host: str = Option("mqtt.eclipse.org", help="mqtt server"),
+    mqtt_port: int = Option(1883, help="server port"),
+    mqtt_user: str = Option("", help="server username", show_default=False),
+    mqtt_pass: str = Option("", help="server password", show_default=False),
+    db_host: str = Option("influxdb", help="database server"),
+    db_port: int = Option(8086, help="server port"),
+    db_user: str = Option("root", help="server username"),
+    db_pass: str = Option("root", help="server password"),
+    db_name: str = Option("homie", help="database name"),
+    db_schema: Schema = Option(Schema.field, help="measurement per field or point"),
+    jtag: str = Option(json.dumps({"location": "test"}), "--tags", help="measurement tags"),
+    maxsize: int = Option(100, "--queue-size", help="max observations waiting per sink"),
+    overflow: Overflow = Option(Overflow.block, "--overflow", help="policy for full queues"),
+    spill_dir: Optional[Path] = Option(None, "--spill-dir", help="directory for spill files"),
+):
+    """Read sensor and deliver measurements to several sinks at once"""
+    if maxsize <= 0:  # pragma: no cover
+        raise BadParameter(f"queue size out of range: {maxsize} <= 0")
+
+    reader = ctx.obj["reader"]
+    with ExitStack() as stack:
+        workers = []
+        sink: Sink
+        for name in dict.fromkeys(sinks):  # unique sinks, keep order
+            if name == SinkName.csv:
+                sink = stack.enter_context(CSVFile(path))
+            elif name == SinkName.mqtt:
+                sink = mqtt_publisher(
+                    topic=mqtt_topic,
+                    host=mqtt_host,
+                    port=mqtt_port,
+                    username=mqtt_user,
+                    password=mqtt_pass,
+                    sensor=reader.sensor.name,
+                )
+            else:
+                sink = db_publisher(
+                    host=db_host,
+                    port=db_port,
+                    username=db_user,
+                    password=db_pass,
+                    db_name=db_name,
+                    tags=json.loads(jtag.replace("'", '"')),
+                    schema=db_schema,
+                )
+            workers.append(
+                SinkWorker(
+                    name.value, sink, maxsize=maxsize, overflow=overflow, spill_dir=spill_dir
+                )
+            )
+
+        stack.enter_context(reader)
+        with FanOut(*workers) as fan:
+            fan.feed(reader())
+
+
+class Benchmark(str, Enum):
+    mqtt = "mqtt"
+    bridge = "bridge"
+
+
+def benchmark(
+    ctx: Context,
+    command: Benchmark = Argument(..., help="command to benchmark"),
+    messages: int = Option(1000, "--messages", help="sensor reads or bridged messages"),
+    rate: float = Option(0, help="bridged messages per second [default: as fast as possible]"),
+    timeout: float = Option(60, help="seconds to wait for delivery"),
+    trace_memory: bool = Option(False, "--trace-memory", help="trace python allocations"),
+):
+    """Benchmark mqtt/bridge commands against local servers and simulated sensors"""
+    # pseudo-terminals and resource are POSIX only, import on demand
+    from pms.service.benchmark import bench_bridge, bench_mqtt
+
+    if command == Benchmark.mqtt:
+        report = bench_mqtt(
+            ctx.obj["reader"].sensor.name, messages, timeout=timeout, trace_memory=trace_memory
+        )
+    else:
+        report = bench_bridge(messages, rate=rate, timeout=timeout, trace_memory=trace_memory)
+    echo(str(report))
+
+
+def fleet(
+    config: Path = Argument(..., exists=True, dir_okay=False, help="fleet config file"),
+):
+    """Read the sensors on a fleet config file, reload the file on SIGHUP"""
+    reload = threading.Event()
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, lambda signum, frame: reload.set())
+
+    with Fleet() as sensors:
+        sensors.apply(load(config))
+        try:
+            while sensors.running:
+                if not reload.wait(1):
+                    sensors.supervise()
+                    continue
+                reload.clear()
+                logger.info(f"reload {config}")
+                try:
+                    sensors.apply(load(config))
+                except Exception as e:
+                    logger.error(f"keep running config, {config}: {e!r}")
+        except KeyboardInterrupt:
+            echo()
+
+
+def http(
+    ctx: Context,
+    host: str = Option("0.0.0.0", "--http-host", help="listen address"),
+    port: int = Option(8080, "--http-port", help="listen port"),
+    size: int = Option(3600, "--buffer-size", help="observations kept in memory"),
+):
+    """Read sensor and serve the latest measurements over HTTP"""
+    reader = ctx.obj["reader"]
+    with Server(host, port, size=size) as server, reader:
+        for obs in reader():
+            server.publish(reader.sensor.name, obs)
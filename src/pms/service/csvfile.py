@@ -0,0 +1,233 @@
+"""
+Write observations, or raw messages, to csv files
+
+Rows are formatted with the precompiled per-model formatters from ObsData.csv_formatter,
+buffered and written in batches:
+- flush_every: rows written to the file on each flush, at most this many rows are lost on a crash
+- fsync_every: rows between forced writes to disk (0: leave it to the OS)
+
+Optional file rotation:
+- daily: one file per day of observations, named `{date:%F}_pypms.csv` on a directory
+  or `{date:%F}_{name}` for a file path
+- size: rename the file to `{stem}.N{suffix}` when it reaches max_bytes
+
+Optional quality control flags (pms.pipeline.qc): a last `flags` column,
+with the flags of each observation separated by spaces, empty for clean observations.
+
+Optional streaming compression, see pms.sensor.compression:
+the compression suffix is added to the file names, e.g. `pypms.csv.gz` and `pypms.1.csv.gz`,
+and max_bytes counts the rows before compression.
+"""
+
+import os
+from datetime import date, datetime, timedelta
+from enum import Enum
+from pathlib import Path
+from typing import IO, List, Optional, Union
+
+from pms import logger
+from pms.sensor.base import ObsData
+from pms.sensor.compression import Compression
+from pms.sensor.reader import RawData
+
+
+class Rotation(str, Enum):
+    none = "none"
+    daily = "daily"
+    size = "size"
+
+
+class CSVFile:
+    """Buffered csv sink
+
+    >>> with CSVFile(Path("pypms.csv"), flush_every=10) as csv:
+    >>>     for obs in reader():
+    >>>         csv(obs)
+
+    capture raw messages instead of observations
+
+    >>> with CSVFile(Path("pypms.csv"), capture="PMSx003") as csv:
+    >>>     for raw in reader(raw=True):
+    >>>         csv(raw)
+    """
+
+    capture_header = "time,sensor,hex"
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        capture: Optional[str] = None,
+        overwrite: bool = False,
+        flush_every: int = 1,
+        fsync_every: int = 0,
+        rotate: Rotation = Rotation.none,
+        max_bytes: int = 0,
+        compression: Compression = Compression.none,
+        flags: bool = False,
+    ) -> None:
+        assert flush_every > 0, f"flush_every out of range: {flush_every} <= 0"
+        assert fsync_every >= 0, f"fsync_every out of range: {fsync_every} < 0"
+        self.rotate = Rotation(rotate)
+        if self.rotate == Rotation.size:
+            assert max_bytes > 0, f"max_bytes out of range: {max_bytes} <= 0"
+        self.base = path
+        self.capture = capture
+        self.mode = "wb" if overwrite else "ab"
+        self.flush_every = flush_every
+        self.fsync_every = fsync_every
+        self.max_bytes = max_bytes
+        self.compression = Compression(compression)
+        self.flags = flags
+
+        self.path: Optional[Path] = None
+        self._file: Optional[IO[bytes]] = None  # compressed stream over _raw
+        self._raw: Optional[IO[bytes]] = None
+        self._rows: List[bytes] = []
+        self._size = 0  # bytes on file and pending
+        self._unsynced = 0  # rows since last fsync
+        self._day = (0.0, 0.0)  # start/end of the current daily file
+
+    @property
+    def empty(self) -> bool:
+        """nothing written to the current file"""
+        return self._size == 0
+
+    def _daily_path(self, day: date) -> Path:
+        if self.base.is_dir():
+            return self.base / f"{day:%F}_pypms.csv"
+        return self.base.with_name(f"{day:%F}_{self.base.name}")
+
+    def _open(self, time: Optional[int] = None) -> None:
+        """Open current file, rotate if needed"""
+        if self.rotate == Rotation.daily:
+            now = datetime.fromtimestamp(time) if time else datetime.now()
+            day = now.date()
+            self._day = (
+                datetime.combine(day, datetime.min.time()).timestamp(),
+                datetime.combine(day + timedelta(days=1), datetime.min.time()).timestamp(),
+            )
+            path = self._daily_path(day)
+        elif self.base.is_dir():
+            path = self._daily_path(datetime.now().date())
+        else:
+            path = self.base
+        suffix = self.compression.suffix
+        if suffix and not path.name.endswith(suffix):
+            path = path.with_name(path.name + suffix)
+
+        logger.debug(f"open {path} on '{self.mode[0]}' mode")
+        self.path = path
+        self._raw = raw = path.open(self.mode, buffering=1 << 16)
+        self._file = self.compression.open(raw, self.mode)
+        self._size = raw.tell() if self.mode == "ab" else 0
+        if self._size and self.rotate == Rotation.size and self.compression != Compression.none:
+            self._size = self._uncompressed(path)
+        self.mode = "ab"  # overwrite only the first file
+
+    def _uncompressed(self, path: Path) -> int:
+        """file size before compression, read as a stream"""
+        size = 0
+        with path.open("rb") as raw, self.compression.open(raw, "rb") as file:
+            try:
+                for chunk in iter(lambda: file.read(1 << 16), b""):
+                    size += len(chunk)
+            except EOFError as e:  # compressed stream cut short
+                logger.warning(f"{path}: {e}")
+        return size
+
+    def _rollover(self) -> None:
+        """Close current file and rename it as `{stem}.N{suffix}`"""
+        self.close()
+        assert self.path is not None
+        name = Path(self.path.name[: len(self.path.name) - len(self.compression.suffix)])
+        n = 1
+        while True:
+            path = self.path.with_name(f"{name.stem}.{n}{name.suffix}{self.compression.suffix}")
+            if not path.exists():
+                break
+            n += 1
+        logger.debug(f"rotate {self.path} to {path}")
+        self.path.rename(path)
+
+    def _write(self, time: int, header: str, row: str) -> None:
+        data = f"{row}\n".encode()
+        if self._file is None:
+            self._open(time)
+        elif self.rotate == Rotation.daily and not self._day[0] <= time < self._day[1]:
+            self.close()
+            self._open(time)
+        elif self.rotate == Rotation.size and self._size + len(data) > self.max_bytes:
+            self._rollover()
+            self._open(time)
+
+        if self._size == 0:
+            data = f"{header}\n".encode() + data
+        self._rows.append(data)
+        self._size += len(data)
+        if len(self._rows) >= self.flush_every:
+            self.flush()
+
+    def header(self, obs: ObsData) -> None:
+        """Write header to new files, from an observation of the right type"""
+        if self._file is None:
+            self._open(obs.time)
+        if self._size == 0:
+            data = f"{self._header(obs)}\n".encode()
+            self._rows.append(data)
+            self._size += len(data)
+
+    def __call__(self, data: Union[ObsData, RawData]) -> None:
+        if self.capture:
+            assert isinstance(data, RawData)
+            self._write(data.time, self.capture_header, f"{data.time},{self.capture},{data.hex}")
+        else:
+            assert isinstance(data, ObsData)
+            row = data.csv_formatter()(data)
+            if self.flags:
+                row = f"{row}, {' '.join(data.flags)}"
+            self._write(data.time, self._header(data), row)
+
+    def _header(self, obs: ObsData) -> str:
+        return f"{obs.csv_header()}, flags" if self.flags else obs.csv_header()
+
+    def flush(self) -> None:
+        """Write pending rows, and sync to disk every fsync_every rows"""
+        if self._file is None:
+            return
+        rows = len(self._rows)
+        if rows:
+            self._file.write(b"".join(self._rows))
+            self._rows.clear()
+        self.compression.flush(self._file)
+        assert self._raw is not None
+        self._raw.flush()
+        self._unsynced += rows
+        if self.fsync_every and self._unsynced >= self.fsync_every:
+            os.fsync(self._raw.fileno())
+            self._unsynced = 0
+
+    def close(self) -> None:
+        if self._file is None:
+            return
+        self.flush()
+        assert self._raw is not None
+        if self._file is not self._raw:
+            self._file.close()  # end of the compressed stream
+            self._raw.flush()
+        if self.fsync_every and self._unsynced:
+            os.fsync(self._raw.fileno())
+            self._unsynced = 0
+        logger.debug(f"close {self.path}")
+        self._raw.close()
+        self._file = self._raw = None
+        if self._size == 0 and self.path is not None:  # do not leave empty files behind
+            self.path.unlink()
+
+    def __enter__(self) -> "CSVFile":
+        if self._file is None:
+            self._open()
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback) -> None:
+        self.close()
@@ -0,0 +1,227 @@
+"""
+Deliver observations from a single reader to several sinks
+
+Each sink runs on its own worker thread and is fed from a bounded queue,
+so a slow sink does not throttle acquisition or the other sinks.
+When a queue is full, the overflow policy decides what happens to new observations:
+- block: wait until the sink catches up (throttles acquisition)
+- drop: discard the oldest queued observation
+- spill: write observations to disk, and feed them to the sink once the queue drains
+
+Spilled observations are read back in chunks, and spill files are rotated every
+`segment_size` bytes, so a long outage costs disk space but not memory,
+and drained files are removed while the rest of the spill is delivered.
+The worker takes over the spill files under a lock, and reads them without it,
+so spilling new observations does not wait for the spill being read back.
+"""
+
+import pickle
+import queue
+import threading
+from collections import deque
+from enum import Enum
+from pathlib import Path
+from tempfile import mkstemp
+from typing import Callable, Deque, Iterable, List, Optional
+
+from pms import logger
+from pms.sensor.base import ObsData
+
+
+Sink = Callable[[ObsData], None]
+
+
+class Overflow(str, Enum):
+    block = "block"
+    drop = "drop"
+    spill = "spill"
+
+
+_STOP = object()  # end of stream marker
+
+
+class SinkWorker(threading.Thread):
+    """Feed observations to a sink from a bounded queue on a worker thread"""
+
+    segment_size = 1 << 20  # spill file size [bytes] before rotation
+    close_timeout = 30.0  # seconds to deliver pending observations on close, before giving up
+
+    def __init__(
+        self,
+        name: str,
+        sink: Sink,
+        *,
+        maxsize: int = 100,
+        overflow: Overflow = Overflow.block,
+        spill_dir: Optional[Path] = None,
+    ) -> None:
+        super().__init__(name=name, daemon=True)
+        assert maxsize > 0, f"queue size out of range: {maxsize} <= 0"
+        self.sink = sink
+        self.queue: queue.Queue = queue.Queue(maxsize)
+        self.overflow = Overflow(overflow)
+        self.dropped = 0
+        self.spilled = 0
+        self._lock = threading.Lock()
+        self._spill_dir = spill_dir
+        self._segments: Deque[Path] = deque()  # spill files being written, oldest first
+        self._reading: Deque[Path] = deque()  # spill files taken over by the worker
+        self._unread = 0  # observations left on the files taken over by the worker
+        self._offset = 0  # read position on the oldest file taken over by the worker
+
+    def _rotate(self) -> None:
+        """Start a new spill file"""
+        fd, path = mkstemp(prefix=f"{self.name}_", suffix=".spill", dir=self._spill_dir)
+        with open(fd, "wb"):
+            pass
+        self._segments.append(Path(path))
+        logger.debug(f"{self.name} spill file {path}")
+
+    def put(self, obs: ObsData) -> None:
+        """Queue observation for the sink, according to the overflow policy"""
+        if self.overflow == Overflow.block:
+            self.queue.put(obs)
+            return
+
+        if self.overflow == Overflow.spill:
+            with self._lock:
+                # keep order: once spilling, everything goes to disk until the spill is drained
+                if not self.spilled:
+                    try:
+                        self.queue.put_nowait(obs)
+                    except queue.Full:
+                        pass
+                    else:
+                        return
+                self._spill_obs(obs)
+            return
+
+        while True:
+            try:
+                self.queue.put_nowait(obs)
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:  # pragma: no cover
+                    pass
+                else:
+                    self.dropped += 1
+                    logger.debug(f"{self.name} queue full, dropped oldest observation")
+            else:
+                return
+
+    def _spill_obs(self, obs: ObsData) -> None:
+        """Append observation to the newest spill file, call with lock held"""
+        if not self._segments or self._segments[-1].stat().st_size >= self.segment_size:
+            self._rotate()
+        with self._segments[-1].open("ab") as f:
+            pickle.dump(obs, f)
+        self.spilled += 1
+
+    def _unspill(self) -> List[ObsData]:
+        """Read back the oldest spilled observations, up to a queue size at a time,
+        and remove the drained spill files"""
+        if not self._unread:
+            with self._lock:  # take over the spill files written so far
+                self._reading, self._segments = self._segments, deque()
+                self._unread = self.spilled
+        data: List[ObsData] = []
+        while self._unread and len(data) < self.queue.maxsize:
+            path = self._reading[0]
+            size = path.stat().st_size
+            with path.open("rb") as f:
+                f.seek(self._offset)
+                while self._offset < size and len(data) < self.queue.maxsize:
+                    data.append(pickle.load(f))
+                    self._offset = f.tell()
+                    self._unread -= 1
+            if self._offset >= size:
+                self._reading.popleft().unlink()
+                self._offset = 0
+        with self._lock:
+            self.spilled -= len(data)
+        if data:
+            logger.debug(f"{self.name} recovered {len(data)} spilled observations")
+        return data
+
+    def _deliver(self, obs: ObsData) -> None:
+        try:
+            self.sink(obs)
+        except Exception as e:
+            logger.error(f"{self.name} failed to deliver observation: {e!r}")
+
+    def run(self) -> None:
+        stop = False
+        while not stop:
+            if self.spilled and self.queue.empty():
+                for obs in self._unspill():
+                    self._deliver(obs)
+                continue
+            try:
+                obs = self.queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if obs is _STOP:
+                stop = True
+            else:
+                self._deliver(obs)
+
+        # deliver anything left behind
+        while self.spilled:
+            for obs in self._unspill():
+                self._deliver(obs)
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Deliver pending observations and stop the worker
+
+        a sink still busy after `timeout` seconds (close_timeout by default),
+        e.g. a hung network publish, is abandoned with its pending observations
+        """
+        timeout = self.close_timeout if timeout is None else timeout
+        if self.is_alive():
+            try:
+                self.queue.put(_STOP, timeout=timeout)
+            except queue.Full:
+                pass
+            else:
+                self.join(timeout)
+        if self.is_alive():
+            pending = self.queue.qsize() + self.spilled
+            logger.warning(f"{self.name} sink did not stop after {timeout:.0f} s, abandoned")
+            logger.debug(f"{self.name} abandoned {pending} pending observations")
+            return
+        if not self.spilled:
+            for segments in (self._reading, self._segments):
+                while segments:
+                    segments.popleft().unlink()
+
+
+class FanOut:
+    """Deliver observations to several sinks at once
+
+    >>> with reader, FanOut(SinkWorker("csv", csv), SinkWorker("mqtt", mqtt)) as fanout:
+    >>>     fanout.feed(reader())
+    """
+
+    def __init__(self, *workers: SinkWorker) -> None:
+        self.workers = workers
+
+    def __enter__(self) -> "FanOut":
+        for worker in self.workers:
+            logger.debug(f"start {worker.name} sink")
+            worker.start()
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback) -> None:
+        for worker in self.workers:
+            logger.debug(f"stop {worker.name} sink")
+            worker.close()
+
+    def __call__(self, obs: ObsData) -> None:
+        for worker in self.workers:
+            worker.put(obs)
+
+    def feed(self, observations: Iterable[ObsData]) -> None:
+        """Deliver every observation to all sinks"""
+        for obs in observations:
+            self(obs)
@@ -0,0 +1,428 @@
+"""
+Read a fleet of sensors, as described on a JSON config file
+
+    {
+        "sensors": {
+            "kitchen": {
+                "model": "PMSx003",
+                "port": "/dev/ttyUSB0",
+                "interval": 60,
+                "pipeline": [
+                    {"stage": "qc", "action": "drop"},
+                    {"stage": "calibration", "path": "calibration.json", "location": "kitchen",
+                     "humidity": "hallway"}
+                ],
+                "sinks": {
+                    "csv": {"type": "csv", "path": "kitchen.csv", "flush_every": 10},
+                    "mqtt": {"type": "mqtt", "topic": "homie/kitchen", "host": "localhost"},
+                    "db": {"type": "influxdb", "tags": {"location": "kitchen"}, "overflow": "drop"},
+                    "api": {"type": "http", "port": 8080, "name": "kitchen"}
+                }
+            }
+        }
+    }
+
+- sensor: model, port, interval [s], samples and duty_cycle, as the main command options
+- pipeline: processing stages, in order, see STAGES,
+  calibration stages take the relative humidity for their humidity correction
+  from a co-located sensor on the same fleet, e.g. "humidity": "hallway"
+- sinks: named sinks, with the same options/defaults as the sink commands,
+  the http sinks of several sensors on the same port share one server,
+  and the sink queue options `queue_size`, `overflow` and `spill_dir` (see pms.service.fanout)
+
+Every sensor is read on its own thread, and its observations are delivered to its sinks
+by SinkWorker threads, so a misbehaving sensor does not hold back the others.
+Fleet.supervise, called every few seconds,
+- restarts a failed reader, e.g. serial port errors or the wrong sensor on the port,
+  after an exponential backoff, see Station.backoff
+- closes the port of a reader without observations for longer than the interval
+  plus Station.stall seconds, e.g. a port that blocks on every read, and restarts it
+Stopping a reader waits at most Station.grace seconds for the sensor to go to sleep,
+and then closes the port under it, so a stuck reader does not hold back supervise or apply.
+Fleet.apply compares a new config against the running one and
+- restarts the reader only when any of the sensor options changed,
+  unchanged serial sessions stay up
+- replaces the pipeline without touching the reader
+- starts, stops or replaces only the sinks that changed,
+  or all the sinks and stages of a sensor when its model changed
+"""
+
+import json
+import threading
+import time
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from pms import logger
+from pms.pipeline import Pipeline, Stage
+from pms.pipeline.calibration import Calibration, Correction
+from pms.pipeline.dedup import Deduplicate
+from pms.pipeline.qc import QualityControl
+from pms.sensor import Sensor, SensorReader
+from pms.service.csvfile import CSVFile
+from pms.service import http
+from pms.service.fanout import Overflow, Sink, SinkWorker
+from pms.service.influxdb import publisher as db_publisher
+from pms.service.mqtt import publisher as mqtt_publisher
+
+Config = Dict[str, Any]
+
+# reader options and their defaults, a change on any of them restarts the reader
+READER = dict(model="PMSx003", port="/dev/ttyUSB0", interval=60, samples=None, duty_cycle=False)
+
+
+def _calibration(model: str, options: Config) -> Stage:
+    return Calibration.load(Path(options["path"])).stage(
+        model, serial=options.get("serial", ""), location=options.get("location", "")
+    )
+
+
+def _qc(model: str, options: Config) -> Stage:
+    options = dict(options)
+    del options["stage"]
+    return QualityControl(model, **options)
+
+
+def _dedup(model: str, options: Config) -> Stage:
+    options = dict(options)
+    del options["stage"]
+    return Deduplicate(model, **options)
+
+
+# pipeline stage factories, called with the sensor model and the stage options
+STAGES: Dict[str, Callable[[str, Config], Stage]] = dict(
+    calibration=_calibration, qc=_qc, dedup=_dedup
+)
+
+
+def _csv(model: str, options: Config, stack: ExitStack) -> Sink:
+    options = dict(options)
+    return stack.enter_context(CSVFile(Path(options.pop("path", "pypms.csv")), **options))
+
+
+def _mqtt(model: str, options: Config, stack: ExitStack) -> Sink:
+    defaults = dict(topic="homie/test", host="mqtt.eclipse.org", port=1883)
+    defaults.update(username="", password="")
+    return mqtt_publisher(sensor=model, **dict(defaults, **options))
+
+
+def _influxdb(model: str, options: Config, stack: ExitStack) -> Sink:
+    defaults = dict(host="influxdb", port=8086, username="root", password="root")
+    defaults.update(db_name="homie", tags={"location": "test"})
+    return db_publisher(**dict(defaults, **options))
+
+
+def _http(model: str, options: Config, stack: ExitStack) -> Sink:
+    options = dict(options)
+    name = options.pop("name", model)
+    return stack.enter_context(http.shared(**options)).sink(name)
+
+
+# sink factories, called with the sensor model, the sink options and an ExitStack for cleanup
+SINKS: Dict[str, Callable[[str, Config, ExitStack], Sink]] = dict(
+    csv=_csv, mqtt=_mqtt, influxdb=_influxdb, http=_http
+)
+
+
+def load(path: Path) -> Config:
+    """Read and check fleet config"""
+    logger.debug(f"fleet config from {path}")
+    with path.open() as f:
+        config = json.load(f)
+    check(config)
+    return config
+
+
+def check(config: Config) -> None:
+    """Raise ValueError on unknown models, stages, sinks or options"""
+    sensors = config.get("sensors")
+    if not isinstance(sensors, dict):
+        raise ValueError("fleet config without sensors")
+    for name, sensor in sensors.items():
+        unknown = set(sensor) - set(READER) - {"pipeline", "sinks"}
+        if unknown:
+            raise ValueError(f"{name}: unknown options {', '.join(sorted(unknown))}")
+        model = sensor.get("model", READER["model"])
+        if model not in Sensor.__members__:
+            raise ValueError(f"{name}: unknown sensor model {model}")
+        for stage in sensor.get("pipeline", []):
+            if stage.get("stage") not in STAGES:
+                raise ValueError(f"{name}: unknown pipeline stage {stage.get('stage')}")
+            if "humidity" in stage and stage["humidity"] not in sensors:
+                raise ValueError(f"{name}: unknown humidity sensor {stage['humidity']}")
+        for sink, options in sensor.get("sinks", {}).items():
+            if options.get("type") not in SINKS:
+                raise ValueError(f"{name}/{sink}: unknown sink type {options.get('type')}")
+            Overflow(options.get("overflow", Overflow.block))
+
+
+def _reader(config: Config) -> Tuple:
+    """reader options"""
+    return tuple(config.get(key, default) for key, default in READER.items())
+
+
+class Station:
+    """One sensor, with its pipeline and sinks
+
+    The sensor is read on its own thread, so the stations of a fleet are read concurrently.
+    The reader paces the samples, so it can be stopped between samples without waiting
+    for the end of the interval.
+    Every observation is a heartbeat, see supervise.
+    """
+
+    stall = 120.0  # seconds without observations, on top of the interval, before a restart
+    grace = 5.0  # seconds for a stopped reader to put the sensor to sleep, before an abort
+    backoff = (1.0, 300.0)  # seconds before restarting a failed reader: first and longest wait
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.config: Config = {}
+        self.pipeline = Pipeline(None)  # stages only, the station reads the sensor
+        self.colocated: List[Tuple[str, Correction]] = []  # humidity source and correction
+        self.humidity: List[Correction] = []  # corrections fed by this sensor, see Fleet.apply
+        self.sinks: Dict[str, Tuple[Config, SinkWorker, ExitStack]] = {}
+        self.thread: Optional[threading.Thread] = None
+        self.reader: Optional[SensorReader] = None
+        self.heartbeat = 0.0  # time.monotonic() of the last observation, or the reader start
+        self.failures = 0  # consecutive reader failures
+        self.restart_at: Optional[float] = None  # time.monotonic() to restart a failed reader
+        self._stop = threading.Event()
+        self._aborted = False
+
+    @property
+    def model(self) -> str:
+        return self.config.get("model", READER["model"])
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def apply(self, config: Config) -> None:
+        """Restart only what changed
+
+        new stages and sinks are built before anything is stopped, so when a stage
+        or sink fails to start, e.g. a missing calibration file or an unreachable server,
+        the station keeps running its old config, and applying the new one again retries
+        """
+        old = self.config
+        model = config.get("model", READER["model"])
+        restart = not old or _reader(old) != _reader(config)
+        new_model = old.get("model", READER["model"]) != model
+
+        pipeline, colocated = self.pipeline, self.colocated
+        if new_model or old.get("pipeline") != config.get("pipeline"):
+            options = config.get("pipeline", [])
+            logger.debug(f"{self.name} pipeline: {[stage['stage'] for stage in options]}")
+            stages = [STAGES[stage["stage"]](model, stage) for stage in options]
+            pipeline = Pipeline(None, *stages)
+            colocated = [
+                (stage_options["humidity"], stage)
+                for stage_options, stage in zip(options, stages)
+                if "humidity" in stage_options and isinstance(stage, Correction)
+            ]
+
+        sinks = config.get("sinks", {})
+        replaced = [
+            name for name in self.sinks if new_model or self.sinks[name][0] != sinks.get(name)
+        ]
+        started: Dict[str, Tuple[Config, SinkWorker, ExitStack]] = {}
+        try:
+            for name, options in sinks.items():
+                if name not in self.sinks or name in replaced:
+                    started[name] = self._start_sink(name, model, options)
+        except BaseException:
+            for name, (_, worker, stack) in started.items():
+                logger.debug(f"stop {self.name}/{name} sink")
+                worker.close()
+                stack.close()
+            raise
+
+        if restart:
+            self.stop()
+        self.config = config
+        self.pipeline, self.colocated = pipeline, colocated
+        for name in replaced:
+            self._close_sink(name)
+        self.sinks = dict(self.sinks, **started)
+        if restart:
+            self.start()
+
+    def _start_sink(
+        self, name: str, model: str, options: Config
+    ) -> Tuple[Config, SinkWorker, ExitStack]:
+        logger.debug(f"start {self.name}/{name} sink")
+        config, options = options, dict(options)
+        kind = options.pop("type")
+        worker_options = dict(
+            maxsize=options.pop("queue_size", 100),
+            overflow=Overflow(options.pop("overflow", Overflow.block)),
+            spill_dir=Path(options.pop("spill_dir")) if "spill_dir" in options else None,
+        )
+        stack = ExitStack()
+        try:
+            sink = SINKS[kind](model, options, stack)
+            worker = SinkWorker(f"{self.name}/{name}", sink, **worker_options)
+        except BaseException:
+            stack.close()
+            raise
+        worker.start()
+        return config, worker, stack
+
+    def _close_sink(self, name: str) -> None:
+        logger.debug(f"stop {self.name}/{name} sink")
+        sinks = dict(self.sinks)
+        _, worker, stack = sinks.pop(name)
+        self.sinks = sinks  # the reader thread sees the old or the new sinks, never a partial set
+        worker.close()
+        stack.close()
+
+    def start(self) -> None:
+        logger.debug(f"start {self.name} reader")
+        self._stop.clear()
+        self._aborted = False
+        self.restart_at = None
+        self.heartbeat = time.monotonic()
+        self.thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """Stop reader, and wait for the sensor to go to sleep
+
+        a reader still running after `grace` seconds is aborted,
+        and left behind if it does not end after another `grace` seconds
+        """
+        self.restart_at = None
+        if self.thread is None:
+            return
+        logger.debug(f"stop {self.name} reader")
+        self._stop.set()
+        self.thread.join(self.grace)
+        if self.thread.is_alive():
+            logger.warning(f"{self.name}: reader did not stop after {self.grace:.0f} s, abort")
+            self._abort()
+            self.thread.join(self.grace)
+            if self.thread.is_alive():  # pragma: no cover
+                logger.error(f"{self.name}: reader did not end after an abort, leave it behind")
+        self.thread = None
+        self.restart_at = None  # the reader could have failed meanwhile
+
+    def supervise(self) -> None:
+        """Restart a failed reader after its backoff, abort a reader without heartbeat"""
+        now = time.monotonic()
+        if self.running:
+            stall = (self.config.get("interval", READER["interval"]) or 0) + self.stall
+            if not self._aborted and now - self.heartbeat > stall:
+                logger.warning(f"{self.name}: no observations for {stall:.0f} s, restart reader")
+                self._abort()
+        elif self.restart_at is not None and now >= self.restart_at:
+            self.start()
+
+    def _abort(self) -> None:
+        """Close the serial port under a stuck reader, so the reader thread ends"""
+        self._aborted = True
+        reader = self.reader
+        if reader is None:
+            return
+        if hasattr(reader.serial, "cancel_read"):  # wake up a blocking read
+            reader.serial.cancel_read()
+        reader.serial.close()
+
+    def _failed(self) -> None:
+        """Schedule a restart, with exponential backoff"""
+        self.failures += 1
+        first, longest = self.backoff
+        delay = min(first * 2 ** (self.failures - 1), longest)
+        logger.warning(f"{self.name}: restart reader in {delay:.1f} s")
+        self.restart_at = time.monotonic() + delay
+
+    def close(self) -> None:
+        self.stop()
+        for name in list(self.sinks):
+            self._close_sink(name)
+
+    def _run(self) -> None:
+        model, port, interval, samples, duty_cycle = _reader(self.config)
+        reader = SensorReader(model, port, interval, samples, duty_cycle)
+        reader.interval = None  # pace samples here, so the reader can stop between samples
+        failed = True
+        try:
+            with reader:
+                self.reader = reader
+                for obs in reader():
+                    self.heartbeat = time.monotonic()
+                    self.failures = 0
+                    for correction in self.humidity:
+                        correction.update_humidity(obs)
+                    processed = self.pipeline.process(obs)
+                    if processed is not None:
+                        for _, worker, _ in self.sinks.values():
+                            worker.put(processed)
+                    delay = (interval or 0) - (time.time() - obs.time)
+                    if delay > 0:
+                        reader.wait(delay, self._stop.wait)  # no wake up once stopped
+                    if self._stop.is_set():
+                        break
+                failed = self._aborted
+        except SystemExit:
+            logger.error(f"{self.name}: no {model} sensor on {port}")
+        except Exception as e:
+            logger.error(f"{self.name}: {e!r}")
+        finally:
+            self.reader = None
+        if failed and not self._stop.is_set():
+            self._failed()
+
+
+class Fleet:
+    """Sensors and sinks described by a fleet config
+
+    >>> with Fleet() as fleet:
+    >>>     fleet.apply(load(path))
+    """
+
+    def __init__(self) -> None:
+        self.stations: Dict[str, Station] = {}
+
+    def __enter__(self) -> "Fleet":
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback) -> None:
+        self.close()
+
+    @property
+    def running(self) -> bool:
+        """any sensor still being read, or waiting for a restart"""
+        return any(
+            station.running or station.restart_at is not None for station in self.stations.values()
+        )
+
+    def supervise(self) -> None:
+        """Restart failed or stuck readers, see Station.supervise"""
+        for station in self.stations.values():
+            station.supervise()
+
+    def apply(self, config: Config) -> None:
+        """Start, stop or update stations to match the config"""
+        check(config)
+        sensors = config["sensors"]
+        for name in [name for name in self.stations if name not in sensors]:
+            self.stations.pop(name).close()
+        try:
+            for name, sensor in sensors.items():
+                station = self.stations.setdefault(name, Station(name))
+                if station.config != sensor:
+                    station.apply(sensor)
+        finally:
+            for station in self.stations.values():
+                station.humidity = [
+                    correction
+                    for other in self.stations.values()
+                    for source, correction in other.colocated
+                    if source == station.name
+                ]
+
+    def close(self) -> None:
+        for station in self.stations.values():
+            station.close()
+        self.stations.clear()
@@ -0,0 +1,269 @@
+"""
+Serve recent observations over HTTP, as JSON
+
+    >>> with Server("0.0.0.0", 8080) as server:
+    >>>     for obs in reader():
+    >>>         server.publish("kitchen", obs)
+
+Endpoints
+- GET /sensors: sensor names, with the time of their latest observation and the field units
+- GET /sensors/NAME: latest observation
+- GET /sensors/NAME/window?seconds=300: count, mean, min and max of every field,
+  over the observations on the last `seconds` up to the latest observation,
+  seconds must be positive and finite
+- GET /sensors/NAME/stream: server-sent events (SSE), one event per new observation
+- GET /stream: server-sent events from all sensors, with the sensor name as the event type
+
+The server runs an asyncio event loop on a background thread, so publishing an observation
+is a buffer append and the streams are fed straight from the reader, without a database
+round trip. Only the last `size` observations per sensor are kept in memory,
+and streams to slow clients drop observations instead of holding back the reader.
+"""
+
+import asyncio
+import json
+import math
+import threading
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import fields
+from typing import Any, Deque, Dict, Iterator, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from pms import logger
+from pms.sensor.base import ObsData
+from pms.service.fanout import Sink
+
+
+def _values(obs: ObsData) -> Dict[str, Any]:
+    """time and every field with metadata, as on the csv format, and the flags from --qc flag"""
+    values: Dict[str, Any] = {"time": obs.time}
+    for field in fields(obs):
+        if field.metadata:
+            values[field.name] = getattr(obs, field.name)
+    if obs.flags:
+        values["flags"] = list(obs.flags)
+    return values
+
+
+def _units(obs: ObsData) -> Dict[str, str]:
+    return {field.name: field.metadata["units"] for field in fields(obs) if field.metadata}
+
+
+class Recent:
+    """Last `size` observations from one sensor"""
+
+    def __init__(self, size: int) -> None:
+        self.observations: Deque[ObsData] = deque(maxlen=size)
+
+    @property
+    def latest(self) -> ObsData:
+        return self.observations[-1]
+
+    def window(self, seconds: float) -> Dict[str, Dict[str, float]]:
+        """aggregates over the last `seconds` up to the latest observation"""
+        start = self.latest.time - seconds
+        values = [_values(obs) for obs in list(self.observations) if obs.time > start]
+        aggregates: Dict[str, Dict[str, float]] = {}
+        if not values:
+            return aggregates
+        for name in values[0]:
+            if name in ["time", "flags"]:
+                continue
+            column = [value[name] for value in values]
+            aggregates[name] = dict(
+                count=len(column),
+                mean=sum(column) / len(column),
+                min=min(column),
+                max=max(column),
+            )
+        return aggregates
+
+
+class Server:
+    """Latest observations, window aggregates and observation streams over HTTP"""
+
+    queue_size = 100  # observations waiting per stream client, newer ones are dropped
+
+    def __init__(self, host: str = "0.0.0.0", port: int = 8080, *, size: int = 3600) -> None:
+        assert size > 0, f"buffer size out of range: {size} <= 0"
+        self.host = host
+        self.port = port  # 0: any free port, updated on start
+        self.size = size
+        self.sensors: Dict[str, Recent] = {}
+        self.dropped = 0  # observations not sent to slow stream clients
+        self._lock = threading.Lock()
+        self._streams: Set[Tuple[Optional[str], asyncio.Queue]] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+        self._error: Optional[BaseException] = None
+
+    def __enter__(self) -> "Server":
+        self._thread = threading.Thread(target=self._run, name="http", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._thread is None:
+            return
+        assert self._loop is not None
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._thread = None
+
+    def _run(self) -> None:
+        self._loop = loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            server = loop.run_until_complete(
+                asyncio.start_server(self._handle, self.host, self.port)
+            )
+        except OSError as e:
+            self._error = e
+            self._ready.set()
+            loop.close()
+            return
+        self.port = server.sockets[0].getsockname()[1]  # type: ignore
+        logger.debug(f"serve observations on http://{self.host}:{self.port}")
+        self._ready.set()
+        try:
+            loop.run_forever()
+        finally:
+            server.close()
+            loop.run_until_complete(server.wait_closed())
+            for _, stream in list(self._streams):
+                stream.put_nowait(None)  # end of stream
+            all_tasks = getattr(asyncio, "all_tasks", None) or asyncio.Task.all_tasks  # py36
+            pending = [task for task in all_tasks(loop) if not task.done()]
+            if pending:
+                loop.run_until_complete(asyncio.wait(pending, timeout=1))
+            loop.close()
+            logger.debug(f"stop serving observations on http://{self.host}:{self.port}")
+
+    def publish(self, name: str, obs: ObsData) -> None:
+        """Keep the observation, and send it to the streams"""
+        with self._lock:
+            if name not in self.sensors:
+                self.sensors[name] = Recent(self.size)
+            self.sensors[name].observations.append(obs)
+        if self._streams and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._send, name, obs)
+
+    def sink(self, name: str) -> Sink:
+        """publish the observations from one sensor"""
+        return lambda obs: self.publish(name, obs)
+
+    def _send(self, name: str, obs: ObsData) -> None:
+        event = f"event: {name}\ndata: {json.dumps(_values(obs))}\n\n".encode()
+        for sensor, stream in list(self._streams):
+            if sensor is not None and sensor != name:
+                continue
+            try:
+                stream.put_nowait(event)
+            except asyncio.QueueFull:
+                self.dropped += 1
+
+    def _get(self, path: str, query: Dict[str, List[str]]) -> Tuple[int, Any]:
+        """status and JSON answer"""
+        parts = [part for part in path.split("/") if part]
+        with self._lock:
+            if parts == ["sensors"]:
+                return 200, {
+                    name: dict(time=recent.latest.time, units=_units(recent.latest))
+                    for name, recent in self.sensors.items()
+                }
+            if len(parts) < 2 or parts[0] != "sensors" or parts[1] not in self.sensors:
+                return 404, dict(error=f"not found: {path}")
+            recent = self.sensors[parts[1]]
+            if len(parts) == 2:
+                return 200, _values(recent.latest)
+            if parts[2:] == ["window"]:
+                try:
+                    seconds = float(query.get("seconds", ["300"])[0])
+                except ValueError:
+                    seconds = math.nan
+                if not (0 < seconds < math.inf):
+                    return 400, dict(error=f"seconds: {query['seconds'][0]}")
+                return 200, recent.window(seconds)
+        return 404, dict(error=f"not found: {path}")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = (await reader.readline()).decode("latin-1").split()
+            while (await reader.readline()).strip():
+                pass  # headers
+            if len(request) != 3 or request[0] != "GET":
+                self._answer(writer, 405, dict(error="only GET requests"))
+                return
+            url = urlsplit(request[1])
+            parts = [part for part in url.path.split("/") if part]
+            if parts == ["stream"] or (len(parts) == 3 and parts[::2] == ["sensors", "stream"]):
+                await self._stream(writer, parts[1] if len(parts) == 3 else None)
+                return
+            status, answer = self._get(url.path, parse_qs(url.query))
+            self._answer(writer, status, answer)
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            logger.debug(f"http client: {e!r}")
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _answer(writer: asyncio.StreamWriter, status: int, answer: Any) -> None:
+        body = json.dumps(answer).encode()
+        reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed"}
+        writer.write(
+            f"HTTP/1.1 {status} {reason[status]}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n".encode() + body
+        )
+
+    async def _stream(self, writer: asyncio.StreamWriter, sensor: Optional[str]) -> None:
+        stream: asyncio.Queue = asyncio.Queue(self.queue_size)
+        self._streams.add((sensor, stream))
+        logger.debug(f"http stream {sensor or 'all sensors'}: {len(self._streams)} clients")
+        try:
+            writer.write(
+                b"HTTP/1.1 200 OK\r\n"
+                b"Content-Type: text/event-stream\r\n"
+                b"Cache-Control: no-cache\r\n"
+                b"Connection: close\r\n\r\n"
+            )
+            while True:
+                event = await stream.get()
+                if event is None:
+                    break
+                writer.write(event)
+                await writer.drain()
+        finally:
+            self._streams.discard((sensor, stream))
+
+
+# servers shared by the sinks of several sensors, and their number of users
+_shared: Dict[Tuple[str, int], Tuple[Server, int]] = {}
+
+
+@contextmanager
+def shared(host: str = "0.0.0.0", port: int = 8080, *, size: int = 3600) -> Iterator[Server]:
+    """One server per address, e.g. for the sinks of a fleet"""
+    key = (host, port)
+    if key in _shared:
+        server, users = _shared[key]
+    else:
+        server, users = Server(host, port, size=size).__enter__(), 0
+    _shared[key] = (server, users + 1)
+    try:
+        yield server
+    finally:
+        server, users = _shared.pop(key)
+        if users > 1:
+            _shared[key] = (server, users - 1)
+        else:
+            server.close()
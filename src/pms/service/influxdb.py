@@ -1,6 +1,17 @@
+"""
+Push observations to an InfluxDB server, with one of two layouts (schemas)
+
+- field: one measurement per field, with a single `value` field, e.g.
+  `pm25,location=test value=10`, one point per field and one series per field and location
+- point: one point per observation with every field, e.g.
+  `observation,location=test pm25=10,pm10=20`, a single point and series per location
+"""
+
+import heapq
 import json
 from dataclasses import fields
-from typing import Dict, Callable
+from enum import Enum
+from typing import Any, Dict, Callable, List, Tuple
 
 from typer import Context, Option, style, colors, echo, Abort
 from mypy_extensions import NamedArg
@@ -10,6 +21,8 @@ try:
 except ModuleNotFoundError:  # pragma: no cover
     client = None  # type: ignore
 
+from pms.sensor.base import ObsData
+
 
 def __missing_influxdb():  # pragma: no cover
     name = style(__name__, fg=colors.GREEN, bold=True)
@@ -31,12 +44,27 @@ Or, if you installed {package} with pipx
     raise Abort()
 
 
-def client_pub(
-    *, host: str, port: int, username: str, password: str, db_name: str
-) -> Callable[
+class Schema(str, Enum):
+    field = "field"
+    point = "point"
+
+
+PubFunc = Callable[
     [NamedArg(int, "time"), NamedArg(Dict[str, str], "tags"), NamedArg(Dict[str, float], "data")],
     None,
-]:  # pragma: no cover
+]
+
+
+def client_pub(
+    *,
+    host: str,
+    port: int,
+    username: str,
+    password: str,
+    db_name: str,
+    schema: Schema = Schema.field,
+    measurement: str = "observation",
+) -> PubFunc:  # pragma: no cover
     if client is None:
         __missing_influxdb()
     c = client(host, port, username, password, None)
@@ -46,17 +74,93 @@ def client_pub(
     c.switch_database(db_name)
 
     def pub(*, time: int, tags: Dict[str, str], data: Dict[str, float]) -> None:
-        c.write_points(
-            [
+        if schema is Schema.point:
+            points = [{"measurement": measurement, "tags": tags, "time": time, "fields": data}]
+        else:
+            points = [
                 {"measurement": k, "tags": tags, "time": time, "fields": {"value": v}}
                 for k, v in data.items()
-            ],
-            time_precision="s",
-        )
+            ]
+        c.write_points(points, time_precision="s")
 
     return pub
 
 
+class Points:
+    """Fields arriving one at a time, e.g. one per MQTT message, merged into points
+
+    Fields with the same tags and time are written as a single point, when a field
+    with a later time arrives, or a field already on the point arrives again.
+    Pending points are also kept on a heap by time, so a field only looks at the
+    points it completes, not at every location.
+    """
+
+    def __init__(self, pub: PubFunc) -> None:
+        self.pub = pub
+        self.pending: Dict[Tuple[Tuple[str, str], ...], Tuple[int, Dict[str, float]]] = {}
+        self._times: List[Tuple[int, Tuple[Tuple[str, str], ...]]] = []  # may hold written points
+
+    def __call__(self, *, time: int, tags: Dict[str, str], data: Dict[str, float]) -> None:
+        key = tuple(sorted(tags.items()))
+        if key in self.pending:
+            pending_time, fields = self.pending[key]
+            if pending_time != time or not fields.keys().isdisjoint(data):
+                self._write(key)
+        if key in self.pending:
+            self.pending[key][1].update(data)
+        else:
+            self.pending[key] = (time, dict(data))
+            heapq.heappush(self._times, (time, key))
+        # points from other tags do not wait for their next field
+        while self._times and self._times[0][0] < time:
+            pending_time, other = heapq.heappop(self._times)
+            if other in self.pending and self.pending[other][0] == pending_time:
+                self._write(other)
+
+    def _write(self, key: Tuple[Tuple[str, str], ...]) -> None:
+        time, data = self.pending.pop(key)
+        self.pub(time=time, tags=dict(key), data=data)
+
+    def flush(self) -> None:
+        while self._times:
+            time, key = heapq.heappop(self._times)
+            if key in self.pending and self.pending[key][0] == time:
+                self._write(key)
+
+
+def publisher(
+    *,
+    host: str,
+    port: int,
+    username: str,
+    password: str,
+    db_name: str,
+    tags: Dict[str, str],
+    schema: Schema = Schema.field,
+) -> Callable[[ObsData], None]:
+    """Push observations to an InfluxDB server"""
+    pub = client_pub(
+        host=host,
+        port=port,
+        username=username,
+        password=password,
+        db_name=db_name,
+        schema=Schema(schema),
+    )
+
+    def publish(obs: ObsData) -> None:
+        data: Dict[str, Any] = {
+            field.name: getattr(obs, field.name) for field in fields(obs) if field.metadata
+        }
+        # quality control flags as a string field, e.g. flags="pm25:spike pm10:spike",
+        # a tag would start a new series for every combination of flags
+        if obs.flags:
+            data["flags"] = " ".join(obs.flags)
+        pub(time=obs.time, tags=tags, data=data)
+
+    return publish
+
+
 def influxdb(
     ctx: Context,
     host: str = Option("influxdb", "--db-host", help="database server"),
@@ -65,12 +169,14 @@ def influxdb(
     word: str = Option("root", "--db-pass", help="server password"),
     name: str = Option("homie", "--db-name", help="database name"),
     jtag: str = Option(json.dumps({"location": "test"}), "--tags", help="measurement tags"),
+    schema: Schema = Option(Schema.field, "--db-schema", help="measurement per field or point"),
 ):
     """Read sensor and push PM measurements to an InfluxDB server"""
-    pub = client_pub(host=host, port=port, username=user, password=word, db_name=name)
     tags = json.loads(jtag.replace("'", '"'))
+    publish = publisher(
+        host=host, port=port, username=user, password=word, db_name=name, tags=tags, schema=schema
+    )
 
     with ctx.obj["reader"] as reader:
         for obs in reader():
-            data = {field.name: getattr(obs, field.name) for field in fields(obs) if field.metadata}
-            pub(time=obs.time, tags=tags, data=data)
+            publish(obs)
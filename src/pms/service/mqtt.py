@@ -1,6 +1,9 @@
+import threading
+from collections import OrderedDict
 from datetime import datetime
 from dataclasses import fields
-from typing import Dict, Union, Callable, NamedTuple
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Union, Callable, NamedTuple, Tuple
 
 from typer import Context, Option, style, colors, echo, Abort
 
@@ -10,6 +13,7 @@ except ModuleNotFoundError:  # pragma: no cover
     client = None  # type: ignore
 
 from pms import logger
+from pms.sensor import Sensor
 from pms.sensor.base import ObsData
 
 
@@ -34,8 +38,18 @@ Or, if you installed {package} with pipx
 
 
 def client_pub(
-    *, topic: str, host: str, port: int, username: str, password: str
+    *,
+    topic: str,
+    host: str,
+    port: int,
+    username: str,
+    password: str,
+    metadata: Optional[Dict[str, str]] = None,
 ) -> Callable[[Dict[str, Union[int, str]]], None]:  # pragma: no cover
+    """Publish retained messages under topic, and metadata on every (re)connection
+
+    so the metadata survives a broker restart
+    """
     if client is None:
         __missing_mqtt()
     c = client.Client(topic)
@@ -43,16 +57,24 @@ def client_pub(
     if username:
         c.username_pw_set(username, password)
 
-    c.on_connect = lambda client, userdata, flags, rc: client.publish(
-        f"{topic}/$online", "true", 1, True
-    )
+    def on_connect(client, userdata, flags, rc):
+        client.publish(f"{topic}/$online", "true", 1, True)
+        for k, v in (metadata or {}).items():
+            client.publish(f"{topic}/{k}", v, 1, True)
+
+    c.on_connect = on_connect
     c.will_set(f"{topic}/$online", "false", 1, True)
     c.connect(host, port, 60)
     c.loop_start()
 
+    topics: Dict[str, str] = {}  # full topics, built once
+
     def pub(data: Dict[str, Union[int, str]]) -> None:
         for k, v in data.items():
-            c.publish(f"{topic}/{k}", v, 1, True)
+            full = topics.get(k)
+            if full is None:
+                full = topics[k] = f"{topic}/{k}"
+            c.publish(full, v, 1, True)
 
     return pub
 
@@ -82,7 +104,7 @@ class Data(NamedTuple):
         fields = topic.split("/")
         if len(fields) != 4:
             raise UserWarning(f"topic total length: {len(fields)}")
-        if any([f.startswith("$") for f in fields]):
+        if any(f.startswith("$") for f in fields):
             raise UserWarning(f"system topic: {topic}")
         location, measurement = fields[1:3]
 
@@ -94,6 +116,68 @@ class Data(NamedTuple):
             return cls(time, location, measurement, value)
 
 
+Route = Tuple[str, str]  # location, measurement
+
+
+class Router:
+    """Location and measurement from the topics of sensor data messages
+
+    Subscription filters, e.g. "homie/+/+/+", are compiled into a trie of topic levels,
+    and the routes of the last `size` topics are kept on a LRU cache, so messages on
+    known topics are routed with a single lookup. System topics ($online, $type, ...),
+    topics outside the filters and topics not of the form root/location/measurement/property
+    route to None, without raising exceptions.
+
+    >>> route = Router("homie/+/+/+")
+    >>> route("homie/test/pm10/concentration")
+    >>> ("test", "pm10")
+    """
+
+    def __init__(self, *filters: str, size: int = 65536) -> None:
+        assert size > 0, f"cache size out of range: {size} <= 0"
+        self.size = size
+        self.trie: Dict[str, Any] = {}
+        for topic_filter in filters:
+            node = self.trie
+            for level in topic_filter.split("/"):
+                node = node.setdefault(level, {})
+            node["/"] = {}  # end of filter, no topic level contains "/"
+        self.routes: "OrderedDict[str, Optional[Route]]" = OrderedDict()
+        self.dropped = 0  # messages without a route
+
+    def __call__(self, topic: str) -> Optional[Route]:
+        routes = self.routes
+        if topic in routes:
+            routes.move_to_end(topic)
+            route = routes[topic]
+        else:
+            route = routes[topic] = self._route(topic)
+            if len(routes) > self.size:
+                routes.popitem(last=False)
+        if route is None:
+            self.dropped += 1
+        return route
+
+    def _route(self, topic: str) -> Optional[Route]:
+        if topic.startswith("$") or "/$" in topic:
+            return None
+        levels = topic.split("/")
+        if len(levels) != 4 or not self._match(self.trie, levels, 0):
+            return None
+        return levels[1], levels[2]
+
+    @classmethod
+    def _match(cls, node: Dict[str, Any], levels: List[str], n: int) -> bool:
+        if "#" in node:
+            return True
+        if n == len(levels):
+            return "/" in node
+        for key in (levels[n], "+"):
+            if key in node and cls._match(node[key], levels, n + 1):
+                return True
+        return False
+
+
 def client_sub(
     topic: str,
     host: str,
@@ -102,14 +186,34 @@ def client_sub(
     password: str,
     *,
     on_sensordata: Callable[[Data], None],
+    stop: Optional[threading.Event] = None,
 ) -> None:  # pragma: no cover
+    """Subscribe to sensor data, until the process ends or `stop` is set"""
+    # last payload and time by topic: retained messages delivered again on reconnect
+    # keep the time they were first received, so they can be told apart from new values,
+    # for the last `route.size` topics, as the routes
+    last: "OrderedDict[str, Tuple[bytes, int]]" = OrderedDict()
+    route = Router(topic)
+
     def on_message(client, userdata, msg):
-        try:
-            data = Data.decode(msg.topic, msg.payload)
-        except UserWarning as e:
-            logger.debug(e)
+        routed = route(msg.topic)
+        if routed is None:
+            return
+        if msg.retain and msg.topic in last and last[msg.topic][0] == msg.payload:
+            time = last[msg.topic][1]
         else:
-            on_sensordata(data)
+            time = Data.now()
+        try:
+            value = float(msg.payload)
+        except ValueError:
+            logger.debug(f"non numeric payload: {msg.payload}")
+            return
+        location, measurement = routed
+        last[msg.topic] = (msg.payload, time)
+        last.move_to_end(msg.topic)
+        if len(last) > route.size:
+            last.popitem(last=False)
+        on_sensordata(Data(time, location, measurement, value))
 
     if client is None:
         __missing_mqtt()
@@ -121,7 +225,87 @@ def client_sub(
     c.on_connect = lambda client, userdata, flags, rc: client.subscribe(topic)
     c.on_message = on_message
     c.connect(host, port, 60)
-    c.loop_forever()
+    if stop is None:
+        c.loop_forever()
+        return
+    c.loop_start()
+    stop.wait()
+    c.disconnect()
+    c.loop_stop()
+
+
+@lru_cache(maxsize=None)
+def topics(sensor: str) -> Tuple[Tuple[str, str], ...]:
+    """field names and their value topics for a sensor model, e.g. ("pm25", "pm25/concentration")"""
+    return tuple(
+        (field.name, f"{field.name}/{field.metadata['topic']}")
+        for field in fields(Sensor[sensor].Data)
+        if field.metadata
+    )
+
+
+@lru_cache(maxsize=None)
+def homie(sensor: str) -> Dict[str, str]:
+    """Homie metadata topics for a sensor model"""
+    metadata = {}
+    for field in fields(Sensor[sensor].Data):
+        if not field.metadata:
+            continue
+        metadata[f"{field.name}/$type"] = field.metadata["long_name"]
+        metadata[f"{field.name}/$properties"] = f"sensor,unit,{field.metadata['topic']}"
+        metadata[f"{field.name}/sensor"] = sensor
+        metadata[f"{field.name}/unit"] = field.metadata["units"]
+    return metadata
+
+
+def publisher(
+    *,
+    topic: str,
+    host: str,
+    port: int,
+    username: str,
+    password: str,
+    sensor: str,
+    deadband: Union[None, float, Dict[str, float]] = None,
+) -> Callable[[ObsData], None]:
+    """Publish observations to a MQTT server, with Homie metadata on every connection
+
+    deadband: skip values that changed by no more than this from the last published value,
+    for every field or by field name (None: publish every value)
+    quality control flags (pms.pipeline.qc) are published to `$flags` when they change,
+    e.g. "pm25:spike pm10:spike", empty for clean observations
+    """
+    pub = client_pub(
+        topic=topic,
+        host=host,
+        port=port,
+        username=username,
+        password=password,
+        metadata=homie(sensor),
+    )
+    table = topics(sensor)
+    if deadband is None or isinstance(deadband, dict):
+        bands = dict(deadband or {})
+    else:
+        bands = {name: deadband for name, _ in table}
+    last: Dict[str, float] = {}  # last published value by field
+    flags = ""  # last published flags
+
+    def publish(obs: ObsData) -> None:
+        nonlocal flags
+        data: Dict[str, Union[int, str]] = {}
+        if " ".join(obs.flags) != flags:
+            flags = data["$flags"] = " ".join(obs.flags)
+        for name, value_topic in table:
+            value = getattr(obs, name)
+            if name in bands and name in last and abs(value - last[name]) <= bands[name]:
+                continue
+            last[name] = value
+            data[value_topic] = value
+        if data:
+            pub(data)
+
+    return publish
 
 
 def mqtt(
@@ -131,24 +315,21 @@ def mqtt(
     port: int = Option(1883, "--mqtt-port", help="server port"),
     user: str = Option("", "--mqtt-user", help="server username", show_default=False),
     word: str = Option("", "--mqtt-pass", help="server password", show_default=False),
+    deadband: Optional[float] = Option(
+        None, "--deadband", help="skip changes up to this value", show_default=False
+    ),
 ):
     """Read sensor and push PM measurements to a MQTT server"""
-    pub = client_pub(topic=topic, host=host, port=port, username=user, password=word)
-
-    def publish(obs: ObsData, metadata: bool = False):
-        data = {}
-        for field in fields(obs):
-            if not field.metadata:
-                continue
-            if metadata:
-                data[f"{field.name}/$type"] = field.metadata["long_name"]
-                data[f"{field.name}/$properties"] = f"sensor,unit,{field.metadata['topic']}"
-                data[f"{field.name}/sensor"] = ctx.obj["reader"].sensor.name
-                data[f"{field.name}/unit"] = field.metadata["units"]
-            data[f"{field.name}/{field.metadata['topic']}"] = getattr(obs, field.name)
-        pub(data)
+    publish = publisher(
+        topic=topic,
+        host=host,
+        port=port,
+        username=user,
+        password=word,
+        sensor=ctx.obj["reader"].sensor.name,
+        deadband=deadband,
+    )
 
     with ctx.obj["reader"] as reader:
-        publish(next(reader()), metadata=True)
         for obs in reader():
             publish(obs)
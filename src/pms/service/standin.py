@@ -0,0 +1,400 @@
+"""
+Local stand-ins for the MQTT and InfluxDB servers
+
+Just enough of each protocol for the `mqtt`, `influxdb` and `bridge` commands,
+so the service layer can be exercised and benchmarked without outside services.
+
+MQTTBroker: MQTT 3.1.1 over TCP
+- CONNECT with will message, PUBLISH on QoS 0/1/2, SUBSCRIBE/UNSUBSCRIBE with +/# wildcards,
+  retained messages, PINGREQ and DISCONNECT
+- messages are delivered to subscribers on QoS 0
+- record=True keeps every published message, with its arrival time
+
+InfluxDBStub: InfluxDB 1.x HTTP API
+- /ping, /query (SHOW/CREATE DATABASE) and /write
+- written points are kept as line protocol, with their arrival time
+"""
+
+import gzip
+import json
+import socket
+import socketserver
+import struct
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from pms import logger
+
+
+class Message(NamedTuple):
+    """published message, with time.monotonic() arrival time"""
+
+    time: float
+    topic: str
+    payload: bytes
+    retain: bool = False
+
+
+# MQTT control packet types
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = range(1, 8)
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = range(8, 15)
+
+
+def packet(kind: int, body: bytes = b"", flags: int = 0) -> bytes:
+    """MQTT control packet: fixed header, with variable length encoding, and body"""
+    length, size = bytearray(), len(body)
+    while True:
+        size, byte = divmod(size, 0x80)
+        length.append(byte | 0x80 if size else byte)
+        if not size:
+            break
+    return bytes([kind << 4 | flags]) + bytes(length) + body
+
+
+def string(text: str) -> bytes:
+    """MQTT UTF-8 encoded string"""
+    data = text.encode()
+    return struct.pack(">H", len(data)) + data
+
+
+def matches(topic_filter: str, topic: str) -> bool:
+    """topic matches subscription filter, wildcards do not match $topics"""
+    if topic.startswith("$") and topic_filter[:1] in "+#":
+        return False
+    levels = topic.split("/")
+    for n, level in enumerate(topic_filter.split("/")):
+        if level == "#":
+            return True
+        if n >= len(levels) or level not in ["+", levels[n]]:
+            return False
+    return len(levels) == n + 1
+
+
+class _Session(socketserver.BaseRequestHandler):
+    """Single client connection"""
+
+    server: "_MQTTServer"
+
+    def setup(self) -> None:
+        self.lock = threading.Lock()
+        self.will: Optional[Tuple[str, bytes, bool]] = None
+        self.client_id = ""
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.server.broker._register(self)
+
+    def send(self, data: bytes) -> None:
+        with self.lock:
+            self.request.sendall(data)
+
+    def _read(self, size: int) -> bytes:
+        data = b""
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("connection closed by client")
+            data += chunk
+        return data
+
+    def _packet(self) -> Tuple[int, int, bytes]:
+        """packet type, flags and body"""
+        header = self._read(1)[0]
+        size, shift = 0, 0
+        while True:
+            byte = self._read(1)[0]
+            size += (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                break
+        return header >> 4, header & 0x0F, self._read(size)
+
+    def handle(self) -> None:
+        broker = self.server.broker
+        try:
+            while True:
+                kind, flags, body = self._packet()
+                if kind == DISCONNECT:
+                    self.will = None
+                    break
+                self._dispatch(kind, flags, body)
+        except (ConnectionError, OSError) as e:
+            logger.debug(f"mqtt client {self.client_id!r}: {e}")
+        finally:
+            broker._unsubscribe(self)
+            if self.will is not None:
+                broker.publish(*self.will)
+
+    def _dispatch(self, kind: int, flags: int, body: bytes) -> None:
+        broker = self.server.broker
+        if kind == CONNECT:
+            self._connect(body)
+            self.send(packet(CONNACK, b"\x00\x00"))
+        elif kind == PUBLISH:
+            qos, retain = flags >> 1 & 0x03, bool(flags & 0x01)
+            size = struct.unpack(">H", body[:2])[0]
+            topic, rest = body[2 : 2 + size].decode(), body[2 + size :]
+            if qos:
+                packet_id, rest = rest[:2], rest[2:]
+                self.send(packet(PUBACK if qos == 1 else PUBREC, packet_id))
+            broker.publish(topic, rest, retain)
+        elif kind == PUBREL:
+            self.send(packet(PUBCOMP, body[:2]))
+        elif kind == SUBSCRIBE:
+            packet_id, rest, filters = body[:2], body[2:], []
+            while rest:
+                size = struct.unpack(">H", rest[:2])[0]
+                filters.append(rest[2 : 2 + size].decode())
+                rest = rest[3 + size :]  # skip requested QoS
+            self.send(packet(SUBACK, packet_id + bytes(len(filters))))  # granted QoS 0
+            for topic_filter in filters:
+                broker._subscribe(self, topic_filter)
+        elif kind == UNSUBSCRIBE:
+            packet_id, rest = body[:2], body[2:]
+            while rest:
+                size = struct.unpack(">H", rest[:2])[0]
+                broker._unsubscribe(self, rest[2 : 2 + size].decode())
+                rest = rest[2 + size :]
+            self.send(packet(UNSUBACK, packet_id))
+        elif kind == PINGREQ:
+            self.send(packet(PINGRESP))
+        else:  # pragma: no cover
+            logger.debug(f"mqtt client {self.client_id!r}: ignore packet type {kind}")
+
+    def _connect(self, body: bytes) -> None:
+        def field(data: bytes) -> Tuple[bytes, bytes]:
+            size = struct.unpack(">H", data[:2])[0]
+            return data[2 : 2 + size], data[2 + size :]
+
+        _, rest = field(body)  # protocol name
+        flags, rest = rest[1], rest[4:]  # skip protocol level and keep alive
+        client_id, rest = field(rest)
+        self.client_id = client_id.decode()
+        if flags & 0x04:
+            topic, rest = field(rest)
+            message, rest = field(rest)
+            self.will = (topic.decode(), message, bool(flags & 0x20))
+        logger.debug(f"mqtt client {self.client_id!r} connected")
+
+
+class _MQTTServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    broker: "MQTTBroker"
+
+
+class MQTTBroker:
+    """In-process MQTT broker stand-in
+
+    >>> with MQTTBroker(record=True) as broker:
+    >>>     publish = publisher(topic="homie/test", host=broker.host, port=broker.port, ...)
+    >>>     ...
+    >>>     broker.messages
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, *, record: bool = False) -> None:
+        self._server = _MQTTServer((host, port), _Session)
+        self._server.broker = self
+        self.host, self.port = self._server.server_address[:2]
+        self.record = record
+        self.messages: List[Message] = []
+        self.retained: Dict[str, Message] = {}
+        self.published = 0
+        self.topics: Counter = Counter()  # messages per topic
+        self._subscriptions: Dict[_Session, Set[str]] = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+    def _register(self, session: _Session) -> None:
+        with self._lock:
+            self._subscriptions[session] = set()
+
+    def _subscribe(self, session: _Session, topic_filter: str) -> None:
+        with self._lock:
+            self._subscriptions[session].add(topic_filter)
+            retained = [msg for topic, msg in self.retained.items() if matches(topic_filter, topic)]
+            self._changed.notify_all()
+        for msg in retained:
+            session.send(packet(PUBLISH, string(msg.topic) + msg.payload, flags=0x01))
+
+    def _unsubscribe(self, session: _Session, topic_filter: Optional[str] = None) -> None:
+        with self._lock:
+            if topic_filter is None:
+                self._subscriptions.pop(session, None)
+            else:
+                self._subscriptions.get(session, set()).discard(topic_filter)
+
+    def _subscribers(self) -> int:
+        """clients with subscriptions, call with lock held"""
+        return sum(bool(filters) for filters in self._subscriptions.values())
+
+    def publish(self, topic: str, payload: bytes, retain: bool = False) -> Message:
+        """route message to subscribers"""
+        msg = Message(time.monotonic(), topic, payload, retain)
+        data = packet(PUBLISH, string(topic) + payload)
+        with self._lock:
+            self.published += 1
+            self.topics[topic] += 1
+            if self.record:
+                self.messages.append(msg)
+            if retain:
+                if payload:
+                    self.retained[topic] = msg
+                else:
+                    self.retained.pop(topic, None)
+            sessions = [
+                session
+                for session, filters in self._subscriptions.items()
+                if any(matches(topic_filter, topic) for topic_filter in filters)
+            ]
+            self._changed.notify_all()
+        for session in sessions:
+            try:
+                session.send(data)
+            except OSError as e:  # pragma: no cover
+                logger.debug(f"mqtt client {session.client_id!r}: {e}")
+        return msg
+
+    def wait(
+        self,
+        published: int = 0,
+        *,
+        topic: Optional[str] = None,
+        subscribers: int = 0,
+        timeout: float = 5,
+    ) -> bool:
+        """wait for a number of published messages (on topic) and subscribed clients"""
+        with self._lock:
+            return self._changed.wait_for(
+                lambda: (self.topics[topic] if topic else self.published) >= published
+                and self._subscribers() >= subscribers,
+                timeout,
+            )
+
+    def __enter__(self) -> "MQTTBroker":
+        logger.debug(f"mqtt broker on {self.host}:{self.port}")
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        with self._lock:
+            sessions = list(self._subscriptions)
+        for session in sessions:
+            try:
+                session.request.shutdown(socket.SHUT_RDWR)
+            except OSError:  # pragma: no cover
+                pass
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "_HTTPServer"
+
+    def log_message(self, format, *args) -> None:
+        logger.debug(f"influxdb stub: {format % args}")
+
+    def _reply(self, code: int, data: Optional[dict] = None) -> None:
+        body = json.dumps(data).encode() if data is not None else b""
+        self.send_response(code)
+        self.send_header("X-Influxdb-Version", "1.8-stub")
+        if data is not None:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self) -> bytes:
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        return body
+
+    def _query(self, params: Dict[str, List[str]]) -> None:
+        stub = self.server.stub
+        result: dict = {"statement_id": 0}
+        for query in params.get("q", []):
+            words = query.split()
+            if words[:2] == ["SHOW", "DATABASES"]:
+                values = [[name] for name in sorted(stub.databases)]
+                result["series"] = [{"name": "databases", "columns": ["name"], "values": values}]
+            elif words[:2] == ["CREATE", "DATABASE"]:
+                stub.databases.add(words[2].strip('"'))
+        self._reply(200, {"results": [result]})
+
+    def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        if url.path == "/ping":
+            self._reply(204)
+        elif url.path == "/query":
+            self._query(parse_qs(url.query))
+        else:  # pragma: no cover
+            self._reply(404, {"error": f"unknown path {url.path}"})
+
+    def do_POST(self) -> None:
+        url = urlsplit(self.path)
+        params = parse_qs(url.query)
+        body = self._body()
+        if url.path == "/write":
+            self.server.stub._write(params.get("db", [""])[0], body)
+            self._reply(204)
+        elif url.path == "/query":
+            params.update(parse_qs(body.decode()))
+            self._query(params)
+        else:  # pragma: no cover
+            self._reply(404, {"error": f"unknown path {url.path}"})
+
+
+class _HTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    stub: "InfluxDBStub"
+
+
+class InfluxDBStub:
+    """In-process InfluxDB HTTP endpoint stand-in
+
+    >>> with InfluxDBStub() as db:
+    >>>     publish = publisher(host=db.host, port=db.port, ...)
+    >>>     ...
+    >>>     db.points
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        self._server = _HTTPServer((host, port), _Handler)
+        self._server.stub = self
+        self.host, self.port = self._server.server_address[:2]
+        self.databases: Set[str] = set()
+        self.points: List[Tuple[float, str]] = []  # (time.monotonic(), line protocol)
+        self.writes = 0
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+    def _write(self, db: str, body: bytes) -> None:
+        now = time.monotonic()
+        lines = [line for line in body.decode().splitlines() if line]
+        with self._lock:
+            self.writes += 1
+            self.points.extend((now, line) for line in lines)
+            self._changed.notify_all()
+
+    def wait(self, points: int, timeout: float = 5) -> bool:
+        """wait for a number of written points"""
+        with self._lock:
+            return self._changed.wait_for(lambda: len(self.points) >= points, timeout)
+
+    def __enter__(self) -> "InfluxDBStub":
+        logger.debug(f"influxdb stub on {self.host}:{self.port}")
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
@@ -1,3 +1,4 @@
+import json
 from enum import Enum
 from datetime import datetime
 from pathlib import Path
@@ -53,8 +54,11 @@ class CapturedData(Enum):
             csv=f"csv --overwrite {self.name}_test.csv",
             capture=f"csv --overwrite  --capture {self.name}_pypms.csv",
             decode=f"serial -f csv --decode {self.name}_pypms.csv",
+            decode_hexdump=f"serial -f hexdump --decode {self.name}_pypms.csv",
+            csv_follow=f"--follow {self.name}_pypms.csv serial -f csv",
             mqtt=f"mqtt",
             influxdb=f"influxdb",
+            fanout=f"fanout --sink csv --sink mqtt --sink influxdb --csv-file {self.name}_fanout.csv",
         )[command]
         return f"{capture} --debug {cmd}".split()
 
@@ -148,16 +152,39 @@ def test_capture_decode(capture):
 
     result = runner.invoke(main, capture.options("decode"))
     assert result.exit_code == 0
+    assert result.stdout == capture.output("csv")
+
+    result = runner.invoke(main, capture.options("csv_follow"))
+    assert result.exit_code == 0
     csv.unlink()
+    checkpoint = csv.with_name(f"{csv.name}.offset")
+    assert checkpoint.exists()
+    checkpoint.unlink()
     assert result.stdout == capture.output("csv")
 
 
+def test_capture_hexdump(capture):
+
+    from pms.cli import main
+
+    result = runner.invoke(main, capture.options("capture"))
+    assert result.exit_code == 0
+
+    csv = Path(capture.options("capture")[-1])
+    assert csv.exists()
+
+    result = runner.invoke(main, capture.options("decode_hexdump"))
+    assert result.exit_code == 0
+    csv.unlink()
+    assert result.stdout == capture.output("hexdump")
+
+
 @pytest.fixture()
 def mock_mqtt(monkeypatch):
     """mock pms.service.mqtt.client_pub"""
 
     def client_pub(
-        *, topic: str, host: str, port: int, username: str, password: str
+        *, topic: str, host: str, port: int, username: str, password: str, metadata=None
     ) -> Callable[[Dict[str, Union[int, str]]], None]:
         def pub(data: Dict[str, Union[int, str]]) -> None:
             pass
@@ -192,7 +219,7 @@ def mock_influxdb(monkeypatch):
     """mock pms.service.influxdb.client_pub"""
 
     def client_pub(
-        *, host: str, port: int, username: str, password: str, db_name: str
+        *, host: str, port: int, username: str, password: str, db_name: str, schema=None
     ) -> Callable[
         [
             NamedArg(int, "time"),
@@ -215,3 +242,154 @@ def test_influxdb(capture, mock_influxdb):
 
     result = runner.invoke(main, capture.options("influxdb"))
     assert result.exit_code == 0
+
+
+def test_fanout(capture, mock_mqtt, mock_influxdb):
+
+    from pms.cli import main
+
+    result = runner.invoke(main, capture.options("fanout"))
+    assert result.exit_code == 0
+
+    csv = Path(capture.options("fanout")[-1])
+    assert csv.exists()
+    lines = csv.read_text().splitlines()
+    csv.unlink()
+    # fanout does not use the first observation for the header only
+    output = capture.output("csv").splitlines()
+    assert lines[0] == output[0]
+    assert lines[2:] == output[1:]
+
+
+def test_simulate():
+
+    from pms.cli import main
+
+    result = runner.invoke(main, "-m SDS01x simulate --count 2 --duration 0.1".split())
+    assert result.exit_code == 0
+    ports = result.stdout.splitlines()
+    assert len(ports) == 2
+    assert all(port.startswith("/dev/") for port in ports)
+
+
+@pytest.mark.parametrize("command", ["mqtt", "bridge"])
+def test_benchmark(command):
+    pytest.importorskip("paho.mqtt")
+    pytest.importorskip("influxdb")
+
+    from pms.cli import main
+
+    result = runner.invoke(main, f"-m SDS01x benchmark {command} --messages 5".split())
+    assert result.exit_code == 0
+    assert result.stdout.startswith(f"{command}: ")
+
+
+@pytest.mark.parametrize("capture", [CapturedData.SDS01x], indirect=True)
+def test_calibration(capture, tmp_path):
+    path = tmp_path / "calibration.json"
+    path.write_text('[{"sensor": "SDS01x", "location": "test", "pm25": [1, 2], "pm10": [0, 0]}]')
+
+    from pms.cli import main
+
+    result = runner.invoke(main, capture.options("capture"))
+    assert result.exit_code == 0
+    csv = Path(capture.options("capture")[-1])
+
+    options = f"--calibration {path} --location test".split() + capture.options("decode")
+    result = runner.invoke(main, options)
+    assert result.exit_code == 0
+    csv.unlink()
+    header, *lines = capture.output("csv").splitlines()
+    expected = []
+    for line in lines:
+        time, pm25, pm10 = line.split(", ")
+        expected.append(f"{time}, {1 + 2 * float(pm25):.1f}, 0.0")
+    assert result.stdout.splitlines() == [header] + expected
+
+
+def test_fleet(tmp_path):
+    from pms.cli import main
+    from pms.sensor.simulator import PseudoTerminal, SimulatedSensor
+
+    path = tmp_path / "fleet.json"
+    with PseudoTerminal(SimulatedSensor("SDS01x", seed=0)) as pty:
+        sensor = {"model": "SDS01x", "port": pty.port, "interval": 0, "samples": 3}
+        sensor["sinks"] = {"csv": {"type": "csv", "path": str(tmp_path / "fleet.csv")}}
+        path.write_text(json.dumps({"sensors": {"test": sensor}}))
+        result = runner.invoke(main, ["fleet", str(path)])
+    assert result.exit_code == 0
+    assert len((tmp_path / "fleet.csv").read_text().splitlines()) == 4
+
+
+@pytest.mark.parametrize("format", ["pm", "csv"])
+def test_bus(format):
+    from pms.cli import main
+    from pms.sensor.simulator import PseudoTerminal, SimulatedBus, SimulatedSensor
+
+    bus = SimulatedBus([SimulatedSensor("SDS01x", device=d, seed=0) for d in [0xA001, 0xA002]])
+    with PseudoTerminal(bus) as pty:
+        args = f"-m SDS01x -s {pty.port} -n 1 bus -d A001 -d A002 -f {format}"
+        result = runner.invoke(main, args.split())
+    assert result.exit_code == 0
+    lines = result.stdout.splitlines()
+    if format == "csv":
+        assert lines.pop(0).startswith("device, time, ")
+    assert [line[:5] for line in lines] == ["A001" + lines[0][4], "A002" + lines[0][4]]
+
+
+def test_bus_pipeline(tmp_path):
+    """the pipeline options apply to every device on the bus"""
+    from pms.cli import main
+    from pms.sensor.simulator import PseudoTerminal, SimulatedBus, SimulatedSensor
+
+    path = tmp_path / "calibration.json"
+    path.write_text('[{"sensor": "SDS01x", "location": "test", "pm25": [1, 2], "pm10": [0, 0]}]')
+    bus = SimulatedBus([SimulatedSensor("SDS01x", device=d, seed=0) for d in [0xA001, 0xA002]])
+    with PseudoTerminal(bus) as pty:
+        args = f"-m SDS01x -s {pty.port} -n 1 --calibration {path} --location test --qc drop"
+        result = runner.invoke(main, args.split() + "bus -d A001 -d A002 -f csv".split())
+    assert result.exit_code == 0
+    header, *lines = result.stdout.splitlines()
+    assert [line.split(", ")[0] for line in lines] == ["A001", "A002"]
+    assert all(line.endswith(", 0.0") for line in lines)
+
+    result = runner.invoke(main, f"-m SDS01x --follow {path} bus -d A001".split())
+    assert result.exit_code == 2
+    assert "--follow not supported on bus" in result.output
+
+
+@pytest.mark.parametrize("capture", [CapturedData.SDS01x], indirect=True)
+def test_dedup(capture):
+    """replay overlapping captures"""
+    from pms.cli import main
+
+    result = runner.invoke(main, capture.options("capture"))
+    assert result.exit_code == 0
+    csv = Path(capture.options("capture")[-1])
+    header, *rows = csv.read_text().splitlines(keepends=True)
+    csv.write_text("".join([header] + rows + rows[-3:]))
+
+    result = runner.invoke(main, ["--dedup"] + capture.options("decode"))
+    assert result.exit_code == 0
+    csv.unlink()
+    assert result.stdout == capture.output("csv")
+
+
+@pytest.mark.parametrize("capture", [CapturedData.SDS01x], indirect=True)
+def test_http(capture, monkeypatch):
+    from pms.cli import main
+    from pms.service.http import Server
+
+    published = []
+    monkeypatch.setattr(Server, "publish", lambda self, name, obs: published.append(name))
+
+    result = runner.invoke(main, capture.options("capture"))
+    assert result.exit_code == 0
+    csv = Path(capture.options("capture")[-1])
+
+    options = f"--follow {csv} -n 3 http --http-host 127.0.0.1 --http-port 0".split()
+    result = runner.invoke(main, ["-m", "SDS01x"] + options)
+    csv.unlink()
+    csv.with_name(f"{csv.name}.offset").unlink()
+    assert result.exit_code == 0
+    assert published == ["SDS01x"] * 3
@@ -0,0 +1,117 @@
+import os
+import json
+import pytest
+
+os.environ["LEVEL"] = "DEBUG"
+from pms.sensor.plantower import pms5003st
+from pms.sensor.honeywell import hpma115s0
+from pms.sensor.bosch_sensortec import mcu680
+from pms.pipeline import calibration
+from pms.pipeline.calibration import Calibration, growth, polynomial
+
+entries = [
+    {"sensor": "PMSx003", "pm25": [1, 0.5]},
+    {"sensor": "PMSx003", "location": "roof", "pm25": [0, 2]},
+    {"sensor": "PMSx003", "serial": "A1", "pm25": [0, 1, 0.1]},
+    {"sensor": "PMS5003ST", "pm25": [0, 1], "pm10": [0, 1], "temp": [-1, 1], "kappa": 0.4},
+    {"sensor": "HPMA115S0", "device_cf": 200, "pm25": [0, 1], "pm10": [0, 1]},
+]
+
+
+@pytest.mark.parametrize(
+    "serial,location,coefficients",
+    [
+        pytest.param("", "", (1, 0.5), id="model"),
+        pytest.param("", "roof", (0, 2), id="location"),
+        pytest.param("A1", "roof", (0, 1, 0.1), id="serial"),
+        pytest.param("B2", "street", (1, 0.5), id="unknown"),
+    ],
+)
+def test_coefficients(serial, location, coefficients):
+    table = Calibration(entries)
+    assert table.coefficients("PMSx003", serial=serial, location=location).fields == {
+        "pm25": coefficients
+    }
+
+
+def test_polynomial():
+    assert polynomial((1, 2, 3), 2) == 1 + 2 * 2 + 3 * 4
+    assert growth(0.4, 0) == 1
+    assert growth(0.4, 100) == growth(0.4, 99) == pytest.approx(1 + 0.4 / 1.65 * 99)
+
+
+def test_stage(tmp_path):
+    path = tmp_path / "calibration.json"
+    path.write_text(json.dumps(entries))
+    correct = Calibration.load(path).stage("HPMA115S0")
+
+    obs = hpma115s0.ObsData(1, 10, 20)
+    assert correct(obs) == hpma115s0.ObsData(1, 5, 10)
+    assert obs == hpma115s0.ObsData(1, 10, 20)
+
+    # no coefficients: pass unchanged
+    correct = Calibration.load(path).stage("SDS01x")
+    assert correct(obs) == obs
+
+    with pytest.raises(AssertionError) as e:
+        Calibration([{"sensor": "SDS01x", "pm01": [0, 1]}]).stage("SDS01x")
+    assert str(e.value) == "unknown SDS01x fields: pm01"
+
+
+def pms5003st_obs(rhum: int, time: int = 1):
+    """PM2.5=20, PM10=30, 25 °C and rhum [%]"""
+    records = [10, 20, 30, 10, 20, 30] + [100] * 6 + [50, 250, rhum * 10]
+    return pms5003st.ObsData(time, *records)
+
+
+def test_humidity():
+    correct = Calibration(entries).stage("PMS5003ST")
+    obs = correct(pms5003st_obs(60))
+    assert obs.pm25 == pytest.approx(20 / growth(0.4, 60))
+    assert obs.pm10 == pytest.approx(30 / growth(0.4, 60))
+    assert obs.temp == 24  # no humidity correction for other fields
+    assert obs.n0_3 == 1  # unit conversion are not applied twice
+
+
+def test_colocated_humidity():
+    correct = Calibration([{"sensor": "HPMA115S0", "pm25": [0, 1], "kappa": 0.4}]).stage(
+        "HPMA115S0"
+    )
+    obs = hpma115s0.ObsData(1, 20, 30)
+    assert correct(obs).pm25 == 20
+
+    correct.update_humidity(mcu680.ObsData(1, 2500, 8000, 1013, 0, 0, 0, 0))
+    assert correct.rhum == 80
+    assert correct(obs).pm25 == pytest.approx(20 / growth(0.4, 80))
+
+
+@pytest.mark.parametrize(
+    "entry,pm25,pm10",
+    [
+        pytest.param({"kappa": 0.4}, 20 / growth(0.4, 60), 30 / growth(0.4, 60), id="kappa"),
+        pytest.param({"device_cf": 200}, 10, 15, id="device_cf"),
+        pytest.param({"device_cf": 200, "pm25": [1, 1]}, 11, 15, id="device_cf and pm25"),
+    ],
+)
+@pytest.mark.parametrize("vectorized", [True, False], ids=["numpy", "python"])
+def test_without_polynomial(monkeypatch, entry, pm25, pm10, vectorized):
+    """corrections apply to every PM field, identity polynomial for fields without coefficients"""
+    if not vectorized:
+        monkeypatch.setattr(calibration, "numpy", None)
+    correct = Calibration([dict(sensor="PMS5003ST", **entry)]).stage("PMS5003ST")
+    obs = correct.batch([pms5003st_obs(60)])[0]
+    assert correct(pms5003st_obs(60)) == obs
+    assert (obs.pm25, obs.pm10) == (pytest.approx(pm25), pytest.approx(pm10))
+    assert obs.temp == 25
+
+
+@pytest.mark.parametrize("vectorized", [True, False], ids=["numpy", "python"])
+def test_batch(monkeypatch, vectorized):
+    if vectorized:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(calibration, "numpy", None)
+    correct = Calibration(entries).stage("PMS5003ST")
+    observations = [pms5003st_obs(rhum, time) for time, rhum in enumerate([0, 30, 60, 90])]
+    assert correct.batch(observations) == [correct(obs) for obs in observations]
+    assert correct.batch([]) == []
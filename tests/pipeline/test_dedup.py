@@ -0,0 +1,50 @@
+import os
+import pytest
+
+os.environ["LEVEL"] = "DEBUG"
+from pms.sensor.novafitness import sds01x
+from pms.pipeline.dedup import Deduplicate, Gap, Gaps, Window
+
+
+def test_window():
+    window = Window(3)
+    assert [window.seen(key) for key in [1, 2, 1, 3, 4]] == [False, False, True, False, False]
+    assert len(window) == 3
+    assert not window.seen(2)  # least recently seen, forgotten
+    assert window.seen(4)
+    assert not window.seen(1)  # forgotten to remember 2
+
+
+@pytest.mark.parametrize(
+    "interval,times,gaps",
+    [
+        pytest.param(None, [0, 10, 20, 30], [], id="regular"),
+        pytest.param(None, [0, 10, 20, 50, 60], [(20, 50, 2)], id="learned"),
+        pytest.param(None, [0, 30, 40, 50], [], id="learn shorter"),
+        pytest.param(10, [0, 30, 40], [(0, 30, 2)], id="given"),
+        pytest.param(10, [0, 10, 30, 20, 40], [(10, 30, 1)], id="late"),
+        pytest.param(60, [0, 61, 125, 181], [], id="jitter"),
+    ],
+)
+def test_gaps(interval, times, gaps):
+    check = Gaps(interval)
+    found = [check(("sds",), time) for time in times]
+    found = [gap for gap in found if gap is not None]
+    assert [(gap.start, gap.end, gap.missing) for gap in found] == gaps
+    assert list(check.gaps) == found
+    assert check.counts[("sds",)] == len(gaps)
+
+
+def test_gap_str():
+    assert str(Gap(("SDS01x", "test"), 0, 30, 10)) == "SDS01x/test gap: 2 missing from 0 to 30"
+
+
+def test_deduplicate():
+    dedup = Deduplicate("SDS01x", "test", size=4)
+    times = [0, 60, 120, 60, 180, 0, 300]
+    passed = [obs.time for obs in map(dedup, (sds01x.ObsData(t, 1, 2) for t in times)) if obs]
+    assert passed == [0, 60, 120, 180, 300]
+    assert dedup.duplicates == 2
+    assert [(gap.series, gap.start, gap.end) for gap in dedup.gaps.gaps] == [
+        (("SDS01x", "test"), 180, 300)
+    ]
@@ -0,0 +1,48 @@
+import os
+
+os.environ["LEVEL"] = "DEBUG"
+from pms.sensor import Sensor
+from pms.sensor.reader import RawData
+from pms.pipeline import Pipeline
+
+messages = [
+    RawData(1, bytes.fromhex("AAC00600060058d93dab")),
+    RawData(2, bytes.fromhex("AAC00900090058d943ab")),
+    RawData(3, bytes.fromhex("AAC0D4043A0AA1601DAB")),
+]
+
+
+class Reader:
+    sensor = Sensor.SDS01x
+    samples = None
+
+    def __init__(self):
+        self.open = False
+
+    def __enter__(self):
+        self.open = True
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.open = False
+
+    def __call__(self, *, raw=None):
+        for msg in messages:
+            yield msg if raw else self.sensor.decode(msg.data, time=msg.time)
+
+
+def test_pipeline():
+    def double(obs):
+        obs.pm25 *= 2
+        return obs
+
+    def drop_odd(obs):
+        return None if obs.time % 2 else obs
+
+    reader = Reader()
+    with Pipeline(reader, double, drop_odd) as pipeline:
+        assert reader.open
+        assert pipeline.sensor == Sensor.SDS01x
+        assert [(obs.time, obs.pm25) for obs in pipeline()] == [(2, 1.8)]
+        assert list(pipeline(raw=True)) == messages
+    assert not reader.open
@@ -0,0 +1,96 @@
+import os
+import random
+
+import pytest
+
+os.environ["LEVEL"] = "DEBUG"
+from pms.sensor.honeywell import hpma115c0, hpma115s0
+from pms.sensor.novafitness import sds198
+from pms.pipeline.qc import Action, QualityControl, Window
+
+
+def test_window():
+    window = Window(5)
+    for value in [1, 9, 2, 8, 3]:
+        window.push(value)
+    assert window.full
+    assert window.median == 3
+    assert window.mad == 2  # deviations 0, 1, 2, 5, 6
+
+    window.push(4)  # drop 1
+    assert sorted(window.values) == window.sorted == [2, 3, 4, 8, 9]
+    assert window.median == 4
+
+    window = Window(4)
+    for value in [1, 2, 3, 4]:
+        window.push(value)
+    assert window.median == 2.5
+
+
+@pytest.mark.parametrize("size", [3, 4, 9, 10])
+def test_mad(size):
+    """MAD from the sorted window matches sorting the deviations"""
+    rng = random.Random(size)
+    window = Window(size)
+    for _ in range(200):
+        window.push(rng.choice([0, 1, 1, 2, 5, rng.uniform(0, 50)]))
+        median = window.median
+        deviations = sorted(abs(value - median) for value in window.sorted)
+        assert window.mad == window._median(deviations)
+
+
+def check(qc, values):
+    """flags for a series of (pm25, pm10) observations"""
+    flags = []
+    for time, (pm25, pm10) in enumerate(values):
+        qc(hpma115s0.ObsData(time, pm25, pm10))
+        flags.append(qc.flags)
+    return flags
+
+
+@pytest.mark.parametrize(
+    "values,flags",
+    [
+        pytest.param([(10, 20), (11, 21), (2000, 2000)], ["pm25:range", "pm10:range"], id="range"),
+        pytest.param([(10, 20), (11, 21), (30, 20)], ["pm25>pm10"], id="fractions"),
+        pytest.param(
+            [(10, 20), (11, 21), (10, 20), (90, 99)], ["pm25:spike", "pm10:spike"], id="spike"
+        ),
+        pytest.param([(12, 20), (12, 21), (12, 20), (12, 21)], ["pm25:stuck"], id="stuck"),
+        pytest.param([(0, 1), (0, 2), (0, 1), (0, 2)], [], id="clean air"),
+        pytest.param([(10, 20), (11, 21), (10, 20), (12, 22)], [], id="valid"),
+    ],
+)
+def test_flags(values, flags):
+    qc = QualityControl("HPMA115S0", window=3, stuck=4, threshold=5, mad_floor=2)
+    assert check(qc, values)[-1] == flags
+
+
+def test_level_shift():
+    """a sustained change is a spike only until it fills half of the window"""
+    qc = QualityControl("HPMA115S0", window=5)
+    flags = check(qc, [(10, 20)] * 5 + [(50, 60)] * 4)
+    assert [bool(f) for f in flags] == [False] * 5 + [True] * 3 + [False]
+
+
+@pytest.mark.parametrize("action,passed", [(Action.flag, 4), (Action.drop, 3)])
+def test_action(action, passed):
+    qc = QualityControl("HPMA115C0", action=action)
+    observations = [hpma115c0.ObsData(n, 5, 10, 15, 20) for n in range(3)]
+    observations.insert(1, hpma115c0.ObsData(9, 5, 10, 25, 20))  # pm04 > pm10
+    passing = [qc(obs) for obs in observations]
+    assert len([obs for obs in passing if obs is not None]) == passed
+    assert qc.counts == {"pm04>pm10": 1}
+    if action == Action.flag:
+        assert [obs.flags for obs in passing] == [(), ("pm04>pm10",), (), ()]
+        assert observations[1].flags == ()
+
+
+def test_ranges():
+    qc = QualityControl("SDS198", ranges={"pm100": [0, 50]})
+    qc(sds198.ObsData(0, 60))
+    assert qc.flags == ["pm100:range"]
+
+    with pytest.raises(AssertionError) as e:
+        QualityControl("SDS198", ranges={"pm25": [0, 50]})
+    assert str(e.value) == "unknown SDS198 fields: pm25"
@@ -0,0 +1,85 @@
+import os
+import pytest
+
+os.environ["LEVEL"] = "DEBUG"
+from pms.sensor import BusReader, Sensor
+from pms.sensor.novafitness.extra_commands import addressed, work_period
+from pms.sensor.simulator import SimulatedBus, SimulatedSensor, SimulatedSerial
+
+devices = [0xA001, 0xA002, 0xA003]
+
+
+def simulated_bus(sensor: str = "SDS01x") -> SimulatedBus:
+    return SimulatedBus(
+        [SimulatedSensor(sensor, level=10 * n, noise=0, device=d) for n, d in enumerate(devices, 1)]
+    )
+
+
+def test_addressed():
+    cmd = Sensor.SDS01x.Commands.passive_read
+    assert addressed(cmd, 0xFFFF) == cmd
+    assert addressed(cmd, 0xA160).command.hex() == "aab404000000000000000000000000a16005ab"
+    assert addressed(work_period(5), 0xA160) == work_period(5, 0xA160)
+
+
+def test_simulated_device():
+    sensor = SimulatedSensor("SDS01x", device=0xA001, seed=0)
+    cmd = Sensor.SDS01x.Commands.passive_read
+    assert sensor.write(addressed(cmd, 0xA002).command) == b""
+    for command in [cmd, addressed(cmd, 0xA001)]:
+        answer = sensor.write(command.command)
+        assert answer[6:8] == b"\xA0\x01"
+        assert Sensor.SDS01x.Message.answers(addressed(cmd, 0xA001).command, answer)
+    ack = sensor.write(work_period(5, 0xA001).command)
+    assert ack[:3] == b"\xAA\xC5\x08" and ack[6:8] == b"\xA0\x01"
+
+
+@pytest.mark.parametrize("sensor", ["SDS01x", "SDS198"])
+@pytest.mark.parametrize("pipelined", [False, True], ids=["round-robin", "pipelined"])
+def test_bus_reader(sensor, pipelined):
+    line = simulated_bus(sensor)
+    reader = BusReader(sensor, devices=devices, samples=2, pipelined=pipelined)
+    reader.serial = SimulatedSerial(line, timeout=0.1)
+    with reader:
+        tagged = list(reader())
+    assert [t.id for t in tagged] == ["A001", "A002", "A003"] * 2
+    # simulated records are 10, 20 and 30, SDS01x records are 0.1 ug/m3
+    pm = [t.data.pm25 if sensor == "SDS01x" else t.data.pm100 for t in tagged[:3]]
+    assert pm == ([1, 2, 3] if sensor == "SDS01x" else [10, 20, 30])
+    assert not any(s.awake for s in line.sensors)
+
+
+def test_missing_device():
+    reader = BusReader("SDS01x", devices=[0xA001, 0xB000], samples=1)
+    reader.serial = SimulatedSerial(simulated_bus(), timeout=0.05)
+    with reader:
+        assert reader.active == [0xA001]
+        assert [t.id for t in reader()] == ["A001"]
+
+    reader = BusReader("SDS01x", devices=[0xB000], samples=1)
+    reader.serial = SimulatedSerial(simulated_bus(), timeout=0.05)
+    with pytest.raises(SystemExit):
+        reader.__enter__()
+
+
+def test_rescan(monkeypatch):
+    """missing devices are not polled every round, and join the rounds when they show up"""
+    monkeypatch.setattr(BusReader, "rescan", 3)
+    line = simulated_bus()
+    reader = BusReader("SDS01x", devices=[0xA001, 0xB000], samples=4)
+    reader.serial = SimulatedSerial(line, timeout=0.05)
+    polled = []
+    poll = reader._poll
+
+    def record(name, devices):
+        polled.append(list(devices))
+        return poll(name, devices)
+
+    monkeypatch.setattr(reader, "_poll", record)
+    with reader:
+        line.sensors.append(SimulatedSensor("SDS01x", level=40, noise=0, device=0xB000))
+        tagged = [t.id for t in reader()]
+    assert tagged == ["A001", "A001", "A001", "B000", "A001", "B000"]
+    # setup, 2 rounds, rescan setup of B000, 2 rounds, sleep
+    assert polled.count([0xB000]) == 2
+    assert polled[-1] == [0xA001, 0xB000]
@@ -0,0 +1,76 @@
+import os
+from dataclasses import fields
+from pathlib import Path
+
+import pytest
+
+os.environ["LEVEL"] = "DEBUG"
+from pms import read_capture
+from pms.sensor import Sensor, MessageReader
+from pms.sensor.capture import units
+from pms.sensor.compression import Compression
+
+numpy = pytest.importorskip("numpy")
+captured_data = Path("tests/cli/captured_data/data.csv")
+
+
+@pytest.mark.parametrize("sensor", ["PMS3003", "PMSx003", "SDS01x", "SDS198", "MCU680"])
+def test_read_capture(sensor):
+    with MessageReader(captured_data, Sensor[sensor]) as reader:
+        expected = list(reader())
+    obs = read_capture(captured_data, sensor)
+    assert len(obs) == len(expected)
+    names = [field.name for field in fields(Sensor[sensor].Data)]
+    if sensor == "MCU680":
+        names.append("press")
+    assert list(obs.dtype.names) == names
+    for name in names:
+        assert obs[name].tolist() == pytest.approx([getattr(o, name) for o in expected]), name
+    assert obs[:1].tolist() == read_capture(captured_data, sensor, samples=1).tolist()
+
+
+def test_consistency(tmp_path):
+    path = tmp_path / "pypms.csv"
+    message = Sensor.PMSx003.Message.encode(
+        (0,) * 5 + (32,) + (0,) * 6, Sensor.PMSx003.Commands.passive_read
+    )
+    path.write_text(
+        "time,sensor,hex\n"
+        "1,PMSx003,424d001c0005000d00160005000d001602fd00fc001d000f00060006970003c5\n"
+        "2,SDS01x,aac00600060058d93dab\n"
+        f"3,PMSx003,{message.hex()}\n"
+        "4,PMSx003,424d001c\n"
+    )
+    obs = read_capture(path, "PMSx003")
+    assert obs["time"].tolist() == [1]
+    assert obs["n0_3"].tolist() == [7.65]
+
+
+def test_samples_after_consistency(tmp_path):
+    path = tmp_path / "pypms.csv"
+    message = Sensor.PMSx003.Message.encode(
+        (0,) * 5 + (32,) + (0,) * 6, Sensor.PMSx003.Commands.passive_read
+    )
+    path.write_text(
+        "time,sensor,hex\n"
+        f"1,PMSx003,{message.hex()}\n"
+        "2,PMSx003,424d001c\n"
+        "3,PMSx003,424d001c0005000d00160005000d001602fd00fc001d000f00060006970003c5\n"
+    )
+    obs = read_capture(path, "PMSx003", samples=1)
+    assert obs["time"].tolist() == [3]
+
+
+def test_dataframe():
+    pandas = pytest.importorskip("pandas")
+    df = read_capture(captured_data, "SDS01x", dataframe=True)
+    assert isinstance(df, pandas.DataFrame)
+    assert list(df.columns) == ["time", "pm25", "pm10"]
+    assert df.attrs["units"] == units("SDS01x") == {"time": "s", "pm25": "ug/m3", "pm10": "ug/m3"}
+
+
+def test_compressed(tmp_path):
+    path = tmp_path / "data.csv.gz"
+    with path.open("wb") as raw, Compression.gzip.open(raw, "wb") as file:
+        file.write(captured_data.read_bytes())
+    assert read_capture(path, "SDS01x").tolist() == read_capture(captured_data, "SDS01x").tolist()
@@ -0,0 +1,79 @@
+import os
+from pathlib import Path
+
+import pytest
+
+os.environ["LEVEL"] = "DEBUG"
+from pms import SensorWarning
+from pms.sensor import Sensor
+from pms.sensor.checksum import SUM16, SUM8, NEG8, INV8, total
+
+numpy = pytest.importorskip("numpy")
+captured_data = Path("tests/cli/captured_data/data.csv")
+
+FRAME = bytes(range(0x20, 0x40))
+
+
+@pytest.mark.parametrize(
+    "kernel,start,stop,expected",
+    [
+        pytest.param(SUM16, 0, -2, sum(FRAME[:-2]) & 0xFFFF, id="sum16"),
+        pytest.param(SUM8, 2, -2, sum(FRAME[2:-2]) % 256, id="sum8"),
+        pytest.param(NEG8, 0, -1, (0x10000 - sum(FRAME[:-1])) % 256, id="neg8"),
+        pytest.param(INV8, 1, -2, 0xFF - sum(FRAME[1:-2]) % 256, id="inv8"),
+    ],
+)
+def test_kernel(kernel, start, stop, expected):
+    assert kernel(FRAME, start, stop) == expected
+    assert kernel(memoryview(FRAME), start, stop) == expected
+    assert kernel.finish(total(FRAME, start, stop)) == expected
+    assert kernel.batch(FRAME * 3, len(FRAME), start, stop).tolist() == [expected] * 3
+
+
+@pytest.mark.parametrize(
+    "start,stop",
+    [(0, None), (2, -2), (-5, None), (-5, -1), (3, 99), (8, 2), (0, 0)],
+)
+def test_total(start, stop):
+    """in place sum over a memoryview matches slicing"""
+    view = memoryview(bytearray(64))[16:48]
+    view[:] = FRAME
+    assert total(view, start, stop) == total(FRAME, start, stop) == sum(FRAME[start:stop])
+
+
+def test_partial_batch():
+    with pytest.raises(AssertionError):
+        SUM16.batch(FRAME + FRAME[:3], len(FRAME))
+
+
+def captured(sensor):
+    with captured_data.open() as f:
+        next(f)
+        rows = (line.strip().split(",") for line in f)
+        return [bytes.fromhex(hex) for _, name, hex in rows if name == sensor]
+
+
+@pytest.mark.parametrize("sensor", ["PMS3003", "SDS01x", "SDS198"])
+def test_batch(sensor):
+    """batch validation and unpacking agree with decoding frame by frame"""
+    Message, command = Sensor[sensor].Message, Sensor[sensor].Commands.passive_read
+    frames = [m for m in captured(sensor) if len(m) == command.answer_length]
+    assert frames
+
+    # corrupt the checksum of one frame
+    frames[0] = frames[0][:-3] + bytes([frames[0][-3] ^ 0xFF]) + frames[0][-2:]
+
+    expected = []
+    for frame in frames:
+        try:
+            expected.append(Message.decode(frame, command))
+        except SensorWarning:
+            expected.append(None)
+
+    joined = b"".join(frames)
+    valid = Message.validate_batch(joined, command.answer_header, command.answer_length)
+    records = Message.unpack_batch(joined, command.answer_length)[:, Message.data_records]
+    assert valid.tolist() == [e is not None for e in expected]
+    assert not valid[0]
+    for record, e in zip(records[valid].tolist(), (e for e in expected if e is not None)):
+        assert record == pytest.approx(e)
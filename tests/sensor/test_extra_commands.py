@@ -4,6 +4,7 @@ import pytest
 os.environ["LEVEL"] = "DEBUG"
 import pms.sensor.novafitness.extra_commands as SDS
 import pms.sensor.honeywell.extra_commands as HPMA
+import pms.sensor.senserion.extra_commands as SPS
 
 
 @pytest.mark.parametrize(
@@ -37,6 +38,16 @@ import pms.sensor.honeywell.extra_commands as HPMA
         pytest.param(HPMA.write_cf(30), "6802081E70", 2, id="HPMA cf 30"),
         pytest.param(HPMA.write_cf(100), "680208642A", 2, id="HPMA cf 100"),
         pytest.param(HPMA.write_cf(200), "680208C8C6", 2, id="HPMA cf 200"),
+        pytest.param(SPS.device_info("type"), "7E00D001002E7E", 39, id="SPS type"),
+        pytest.param(SPS.device_info("serial"), "7E00D001032B7E", 39, id="SPS serial"),
+        pytest.param(SPS.read_version(), "7E00D1002E7E", 14, id="SPS version"),
+        pytest.param(SPS.read_status(), "7E00D201002C7E", 12, id="SPS status"),
+        pytest.param(SPS.start_cleaning(), "7E005600A97E", 7, id="SPS clean"),
+        pytest.param(SPS.cleaning_interval(), "7E008001007D5E7E", 11, id="SPS clean interval?"),
+        pytest.param(
+            SPS.cleaning_interval(604800), "7E0080050000093A80B77E", 7, id="SPS clean weekly"
+        ),
+        pytest.param(SPS.reset(), "7E00D3002C7E", 7, id="SPS reset"),
     ],
 )
 def test_extra_commands(cmd, hex, length):
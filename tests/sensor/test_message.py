@@ -14,7 +14,7 @@ from pms import SensorWarning
     "sensor,hex,error",
     [
         pytest.param(
-            pmsx003, "424d001c0005000d0016", "message length: 10", id="PMSx003 short message"
+            pmsx003, "424d001c0005000d0016", "message length: 10 != 32", id="PMSx003 short message"
         ),
         pytest.param(
             pmsx003,
@@ -35,7 +35,7 @@ from pms import SensorWarning
             id="PMSx003 empty message",
         ),
         pytest.param(
-            pms3003, "424d00140051006A0077", "message length: 10", id="PMS3003 short message"
+            pms3003, "424d00140051006A0077", "message length: 10 != 24", id="PMS3003 short message"
         ),
         pytest.param(
             pms3003,
@@ -55,7 +55,7 @@ from pms import SensorWarning
             "message empty: warming up sensor",
             id="PMS3003 empty message",
         ),
-        pytest.param(sds01x, "AAC0D4041DAB", "message length: 6", id="SDS01x short message"),
+        pytest.param(sds01x, "AAC0D4041DAB", "message length: 6 != 10", id="SDS01x short message"),
         pytest.param(
             sds01x,
             "ABC0D4043A0AA1601DAA",
@@ -123,6 +123,12 @@ from pms import SensorWarning
             "message empty: warming up sensor",
             id="SPS30 empty message",
         ),
+        pytest.param(
+            sps30,
+            "7E0003002800000000000000000000000000000000000000000000000000000000000000000000000000000000D47D7E",
+            "message stuffing: 0003002800000000000000000000000000000000000000000000000000000000000000000000000000000000d47d",
+            id="SPS30 wrong stuffing",
+        ),
         pytest.param(
             mcu680, "5A5A3F0F0835198A0188", "message length: 10", id="MCU680 short message"
         ),
@@ -257,7 +263,7 @@ def test_decode_error(sensor, hex, error):
             sps30.Message,
             sps30.commands.passive_read.answer_header,
             pmsx003.commands.passive_read.answer_length,
-            "wrong payload length 32 != 4||47",
+            "wrong payload length 32 != 47",
             id="SPS30 wrong payload length",
         ),
     ],
@@ -266,3 +272,64 @@ def test_validate_error(message, header, length, error, buffer=b""):
     with pytest.raises(AssertionError) as e:
         message._validate(buffer, header, length)
     assert str(e.value) == error
+
+
+@pytest.mark.parametrize(
+    "sensor,hex,header,checksum",
+    [
+        pytest.param(
+            pmsx003,
+            "424d001c0005000d00160005000d001602fd00fc001d000f00060006970003c5",
+            "424d001c",
+            0x03C5,
+            id="PMSx003",
+        ),
+        pytest.param(sds01x, "AAC0D4043A0AA1601DAB", "AAC0", 0x1D, id="SDS01x"),
+        pytest.param(hpma115s0, "4005040030003156", "400504", 0x56, id="HPMA115S0"),
+        pytest.param(
+            sps30,
+            "7E00030028417D5E0000427D5D0000417D310000417D330000422800004228000042280000422800004228000042280000347E",
+            "7E00030028",
+            0x34,
+            id="SPS30",
+        ),
+        pytest.param(
+            mcu680, "5A5A3F0F0835198A01885430D200032BE1004A1A", "5A5A3F0F", 0x1A, id="MCU680"
+        ),
+    ],
+)
+def test_split(sensor, hex, header, checksum):
+    msg = sensor.Message(bytes.fromhex(hex))
+    assert msg.header == bytes.fromhex(header)
+    assert msg.checksum == checksum
+    assert not hasattr(msg, "__dict__")
+
+    # short messages are split without errors
+    for n in range(len(header) // 2):
+        sensor.Message(bytes.fromhex(hex)[:n])
+
+
+@pytest.mark.parametrize(
+    "sensor,hex",
+    [
+        pytest.param(
+            pmsx003,
+            "424d001c0005000d00160005000d001602fd00fc001d000f00060006970003c5",
+            id="PMSx003",
+        ),
+        pytest.param(pms3003, "424d00140051006A007700350046004F33D20F28003F041A", id="PMS3003"),
+        pytest.param(sds01x, "AAC0D4043A0AA1601DAB", id="SDS01x"),
+        pytest.param(hpma115s0, "4005040030003156", id="HPMA115S0"),
+        pytest.param(
+            sps30,
+            "7E00030028417D5E0000427D5D0000417D310000417D330000422800004228000042280000422800004228000042280000347E",
+            id="SPS30",
+        ),
+        pytest.param(mcu680, "5A5A3F0F0835198A01885430D200032BE1004A1A", id="MCU680"),
+    ],
+)
+def test_encode(sensor, hex):
+    message = bytes.fromhex(hex)
+    msg = sensor.Message(message)
+    records = sensor.Message._unpack(msg.payload)
+    assert sensor.Message.encode(records, sensor.commands.passive_read) == message
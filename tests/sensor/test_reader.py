@@ -0,0 +1,205 @@
+import os
+import pytest
+
+os.environ["LEVEL"] = "DEBUG"
+from pms.sensor import Sensor
+from pms.sensor.compression import Compression
+from pms.sensor.reader import MessageReader, RawData, hexdump
+
+messages = [
+    RawData(1, bytes.fromhex("7E00030000FC7E")),
+    RawData(2, bytes.fromhex("424d001c0005000d")),
+    RawData(3, bytes.fromhex("AAC0D4043A0AA1601DAB")),
+]
+
+
+def test_hexdump():
+    assert messages[0].hexdump() == "00000000: 7e 00 03 00 00 fc 7e  ......."
+    assert messages[1].hexdump(2) == "00000010: 42 4d 00 1c 00 05 00 0d  BM......"
+
+
+@pytest.mark.parametrize("lines", [1, 2, 1024])
+def test_bulk_hexdump(lines):
+    dump = "".join(hexdump(messages, offset=0x10, lines=lines))
+    assert dump.splitlines() == [
+        "00000010: 7e 00 03 00 00 fc 7e  .......",
+        "00000017: 42 4d 00 1c 00 05 00 0d  BM......",
+        "0000001f: aa c0 d4 04 3a 0a a1 60 1d ab  ....:..`..",
+    ]
+    assert len(list(hexdump(messages, lines=lines))) == -(-len(messages) // lines)
+
+
+class FakeSerial:
+    """answer PMSx003 commands, read answers with readinto"""
+
+    answers = {
+        b"\x42\x4D\xE4\x00\x01\x01\x74": "424d001c0005000d00160005000d001602fd00fc001d000f00060006970003c5",
+        b"\x42\x4D\xE1\x00\x00\x01\x70": "424d0004e1000174",
+        b"\x42\x4D\xE2\x00\x00\x01\x71": "424d001c0005000d00160005000d001602fd00fc001d000f00060006970003c5",
+        b"\x42\x4D\xE4\x00\x00\x01\x73": "424d0004e4000177",
+    }
+
+    def __init__(self):
+        self.is_open = False
+        self.input = bytearray()
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def reset_input_buffer(self):
+        self.input.clear()
+
+    def write(self, command: bytes):
+        self.input += bytes.fromhex(self.answers[command])
+
+    def flush(self):
+        pass
+
+    @property
+    def in_waiting(self) -> int:
+        return len(self.input)
+
+    def readinto(self, buffer) -> int:
+        n = min(len(buffer), len(self.input))
+        buffer[:n] = self.input[:n]
+        del self.input[:n]
+        return n
+
+
+@pytest.mark.parametrize("buffer_size", [8, 256], ids=["grow buffer", "reuse buffer"])
+def test_sensor_reader(monkeypatch, buffer_size):
+    from pms.sensor import SensorReader
+
+    monkeypatch.setattr("pms.sensor.reader.Serial", FakeSerial)
+    monkeypatch.setattr("pms.sensor.reader.SensorReader.buffer_size", buffer_size)
+
+    with SensorReader("PMSx003", samples=2) as reader:
+        obs = list(reader())
+        reader.samples = 2
+        raw = list(reader(raw=True))
+
+    assert [(o.pm01, o.pm25, o.pm10) for o in obs] == [(5, 13, 22)] * 2
+    assert [r.data.hex() for r in raw] == [FakeSerial.answers[b"\x42\x4D\xE2\x00\x00\x01\x71"]] * 2
+    assert all(type(r.data) is bytes for r in raw)
+    assert len(reader.transport._buffer) >= 32
+
+
+def test_duty_cycle(monkeypatch):
+    from pms.sensor import SensorReader
+    from pms.sensor.simulator import SimulatedSensor, SimulatedSerial
+
+    monkeypatch.setattr(SensorReader, "warmup", {})
+    monkeypatch.setattr(SensorReader, "warmup_poll", 0.05)
+    monkeypatch.setattr(SensorReader, "min_sleep", 0.1)
+
+    sensor = SimulatedSensor("PMSx003", warmup_time=0.3, seed=0)
+    commands = []
+    answer = sensor.answer
+    monkeypatch.setattr(
+        sensor, "answer", lambda name, cmd=b"": commands.append(name) or answer(name, cmd)
+    )
+
+    reader = SensorReader("PMSx003", interval=2, samples=2, duty_cycle=True)
+    reader.serial = SimulatedSerial(sensor)
+    with reader:
+        obs = list(reader())
+    assert len(obs) == 2
+    assert commands.count("sleep") == 2, "sleep between samples and on exit"
+    assert commands.count("wake") == 2
+    assert reader.lead_time == pytest.approx(0.3, abs=0.1)
+
+    # a stopping reader is not woken up, e.g. Event.wait on a fleet station
+    with reader:
+        commands.clear()
+        reader.wait(2, lambda delay: True)
+        assert commands == ["sleep"]
+
+
+def test_work_period(monkeypatch):
+    from pms.sensor import SensorReader
+    from pms.sensor.simulator import SimulatedSensor, SimulatedSerial
+    from pms.sensor.novafitness.extra_commands import work_period
+
+    sensor = SimulatedSensor("SDS01x", seed=0)
+    write = sensor.write
+
+    def ack_work_period(data: bytes) -> bytes:
+        writes.append(data)
+        if data[:3] == b"\xAA\xB4\x08":
+            return sensor.sensor.Message._encode(b"\xAA\xC5", data[2:8])
+        return write(data)
+
+    writes = []
+    monkeypatch.setattr(sensor, "write", ack_work_period)
+    serial = SimulatedSerial(sensor, timeout=0.1)
+
+    reader = SensorReader("SDS01x", interval=120, samples=1, duty_cycle=True)
+    reader.serial = serial
+    with reader:
+        assert len(list(reader())) == 1
+    assert writes.index(work_period(2).command) < writes.index(work_period(0).command)
+    assert writes[-1] == reader.sensor.Commands.sleep.command
+
+
+def sds01x(time: int) -> str:
+    message = Sensor.SDS01x.Message.encode((time, time, 1), Sensor.SDS01x.Commands.passive_read)
+    return f"{time},SDS01x,{message.hex()}\n"
+
+
+def test_follow(monkeypatch, tmp_path):
+    """new rows, half written rows, rotation and resume from checkpoint"""
+    path, checkpoint = tmp_path / "pypms.csv", tmp_path / "pypms.csv.offset"
+    path.write_text("time,sensor,hex\n" + sds01x(1) + "1,PMSx003,424d\n" + sds01x(2)[:9])
+
+    def append(text):
+        with path.open("a") as f:
+            f.write(text)
+
+    def rotate():
+        path.rename(tmp_path / "pypms.1.csv")
+        path.write_text("time,sensor,hex\n" + sds01x(4))
+
+    updates = [
+        lambda: None,
+        lambda: append(sds01x(2)[9:] + "2,SDS01x,zz\n"),
+        lambda: append(sds01x(3)),
+        rotate,
+    ]
+    monkeypatch.setattr("time.sleep", lambda seconds: updates.pop(0)())
+
+    reader = MessageReader(path, Sensor.SDS01x, 3, follow=True, checkpoint=checkpoint)
+    with reader:
+        assert [obs.time for obs in reader()] == [1, 2, 3]
+    assert updates == [rotate]
+    assert checkpoint.read_text().split()[1] == str(path.stat().st_size)
+
+    # resume after the last row read, then follow the rotated file
+    with MessageReader(path, Sensor.SDS01x, 1, follow=True, checkpoint=checkpoint) as reader:
+        assert [obs.time for obs in reader()] == [4]
+    assert not updates
+
+
+def test_follow_missing(monkeypatch, tmp_path):
+    path = tmp_path / "pypms.csv"
+    monkeypatch.setattr(
+        "time.sleep", lambda seconds: path.write_text("time,sensor,hex\n" + sds01x(5))
+    )
+    with MessageReader(path, Sensor.SDS01x, 1, follow=True) as reader:
+        assert [raw.time for raw in reader(raw=True)] == [5]
+    with pytest.raises(FileNotFoundError):
+        MessageReader(tmp_path / "missing.csv", Sensor.SDS01x).__enter__()
+
+
+@pytest.mark.parametrize("compression", ["gzip", "bz2", "xz"])
+def test_compressed(tmp_path, compression):
+    path = tmp_path / "pypms.csv"
+    with path.open("wb") as raw, Compression(compression).open(raw, "wb") as file:
+        file.write(("time,sensor,hex\n" + sds01x(1) + sds01x(2)).encode())
+
+    with MessageReader(path, Sensor.SDS01x) as reader:
+        assert [obs.time for obs in reader()] == [1, 2]
+    with pytest.raises(ValueError):
+        MessageReader(path, Sensor.SDS01x, follow=True).__enter__()
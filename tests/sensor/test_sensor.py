@@ -78,6 +78,18 @@ def test_commands(sensor, command):
             (42.0, 42.0, 42.0, 42.0, 42.0, 42.0, 42.0, 42.0, 42.0, 42.0),
             id="SPS30 fake data",
         ),
+        pytest.param(
+            "SPS30",
+            "7E00030028417D5E0000427D5D0000417D310000417D330000422800004228000042280000422800004228000042280000347E",
+            (15.875, 63.25, 9.0625, 9.1875, 42.0, 42.0, 42.0, 42.0, 42.0, 42.0),
+            id="SPS30 stuffed data",
+        ),
+        pytest.param(
+            "SPS30",
+            "7E000300287E00030028417D5E0000427D5D0000417D310000417D330000422800004228000042280000422800004228000042280000347E",
+            (15.875, 63.25, 9.0625, 9.1875, 42.0, 42.0, 42.0, 42.0, 42.0, 42.0),
+            id="SPS30 stuffed data at the end of the buffer",
+        ),
         pytest.param(
             "MCU680",
             "5A5A3F0F0835198A01885430D200032BE1004A1A",
@@ -86,8 +98,10 @@ def test_commands(sensor, command):
         ),
     ],
 )
-def test_decode(sensor, hex, msg, secs=1567201793):
-    assert Sensor[sensor].decode(bytes.fromhex(hex), time=secs) == Sensor[sensor].Data(secs, *msg)
+@pytest.mark.parametrize("buffer", [bytes, memoryview], ids=["bytes", "memoryview"])
+def test_decode(sensor, hex, msg, buffer, secs=1567201793):
+    data = buffer(bytes.fromhex(hex))
+    assert Sensor[sensor].decode(data, time=secs) == Sensor[sensor].Data(secs, *msg)
 
 
 @pytest.mark.parametrize(
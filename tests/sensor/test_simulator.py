@@ -0,0 +1,114 @@
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+os.environ["LEVEL"] = "DEBUG"
+from pms import SensorWarmingUp, WrongMessageChecksum, WrongMessageFormat
+from pms.sensor import Sensor, SensorReader
+from pms.sensor.simulator import Fault, PseudoTerminal, SimulatedSensor, SimulatedSerial
+
+captured_data = Path("tests/cli/captured_data/data.csv")
+sensors = [s.name for s in Sensor]
+
+
+def read(sensor: SimulatedSensor) -> bytes:
+    """passive read, or next active mode message"""
+    cmd = sensor.sensor.Commands.passive_read
+    if cmd.command:
+        return sensor.write(cmd.command)
+    return sensor.message()
+
+
+@pytest.mark.parametrize("sensor", sensors)
+def test_message(sensor):
+    simulated = SimulatedSensor(sensor, level=20, noise=0.1, seed=0)
+    for _ in range(10):
+        message = read(simulated)
+        assert len(message) >= simulated.sensor.Commands.passive_read.answer_length
+        obs = simulated.sensor.decode(message, time=1)
+        assert obs.time == 1
+
+
+@pytest.mark.parametrize("sensor", sensors)
+@pytest.mark.parametrize(
+    "fault,error",
+    [
+        pytest.param(Fault.checksum, WrongMessageChecksum, id="checksum"),
+        pytest.param(Fault.truncated, WrongMessageFormat, id="truncated"),
+        pytest.param(Fault.warmup, SensorWarmingUp, id="warmup"),
+    ],
+)
+def test_fault(sensor, fault, error):
+    simulated = SimulatedSensor(sensor, faults={fault: 1}, seed=0)
+    with pytest.raises(error):
+        simulated.sensor.decode(read(simulated), time=1)
+
+
+@pytest.mark.parametrize(
+    "sensor,command,answer",
+    [
+        pytest.param("PMSx003", "passive_mode", "424d0004e1000174", id="PMSx003 passive"),
+        pytest.param("PMSx003", "sleep", "424d0004e4000177", id="PMSx003 sleep"),
+        pytest.param("SDS01x", "sleep", "aac5060100000000" "07ab", id="SDS01x sleep"),
+        pytest.param("HPMA115S0", "passive_mode", "a5a5", id="HPMA115S0 passive"),
+        pytest.param("SPS30", "sleep", "7e00010000fe7e", id="SPS30 sleep"),
+    ],
+)
+def test_answer(sensor, command, answer):
+    simulated = SimulatedSensor(sensor)
+    cmd = simulated.sensor.command(command).command
+    # commands split across writes
+    assert simulated.write(b"\x00" + cmd[:3]) == b""
+    assert simulated.write(cmd[3:]).hex() == answer
+
+
+def test_sleep():
+    simulated = SimulatedSensor("SDS01x")
+    commands = simulated.sensor.Commands
+    assert simulated.active
+    assert simulated.write(commands.sleep.command)
+    assert not simulated.awake
+    assert simulated.write(commands.passive_read.command) == b""
+    assert simulated.due(time.monotonic() + 10) == b""
+    assert simulated.write(commands.wake.command)
+    assert simulated.write(commands.passive_mode.command)
+    assert not simulated.active
+    assert simulated.write(commands.passive_read.command)
+
+
+@pytest.mark.parametrize("speed", [1, 10])
+def test_replay(speed):
+    simulated = SimulatedSensor("PMSx003", capture=captured_data, speed=speed)
+    now = time.monotonic()
+    messages = simulated.due(now)
+    assert len(messages) == 32
+    # captured messages are 10 seconds apart
+    assert simulated.due(now + 5 / speed) == b""
+    messages += simulated.due(now + 10 / speed)
+    assert len(messages) == 2 * 32
+    messages += simulated.due(now + 100 / speed)
+    assert len(messages) == 10 * 32
+    assert simulated.sent == 10
+    assert simulated.due(now + 1000 / speed) == b""
+    assert simulated.write(simulated.sensor.Commands.passive_read.command) == b""
+    simulated.close()
+
+
+@pytest.mark.parametrize("sensor", ["PMSx003", "PMS3003", "SDS01x", "MCU680"])
+def test_simulated_serial(sensor):
+    reader = SensorReader(sensor, samples=3)
+    reader.serial = SimulatedSerial(SimulatedSensor(sensor, period=0.01, seed=0), timeout=1)
+    with reader:
+        obs = list(reader())
+    assert len(obs) == 3
+    assert not reader.serial.sensor.awake or sensor in ["PMS3003", "MCU680"]
+
+
+def test_pseudo_terminal():
+    with PseudoTerminal(SimulatedSensor("PMSx003", latency=0.01, seed=0)) as pty:
+        with SensorReader("PMSx003", pty.port, samples=3) as reader:
+            obs = list(reader())
+    assert len(obs) == 3
+    assert not pty.sensor.awake
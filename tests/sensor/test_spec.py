@@ -0,0 +1,78 @@
+import os
+from dataclasses import dataclass, field
+
+import pytest
+
+os.environ["LEVEL"] = "DEBUG"
+from pms import WrongMessageChecksum, WrongMessageFormat, SensorWarmingUp
+from pms.sensor import base, spec
+from pms.sensor.plantower import pms5003t
+from pms.sensor.novafitness import sds01x
+from pms.sensor.honeywell import hpma115c0
+
+
+class Message(spec.Message):
+    """made up sensor: 2b header, 2 little endian records, 8b checksum and tail"""
+
+    __slots__ = ()
+
+    protocol = spec.Protocol(b"\x5A", 2, (8,), spec.Checksum.sum8, tail=b"\xA5", record="<H")
+    data_records = slice(2)
+
+
+@dataclass(frozen=False)
+class ObsData(spec.ObsData):
+    pm25: float = field(metadata=base.metadata("PM2.5", "ug/m3", "concentration", scale=10))
+    temp: int = field(metadata=base.metadata("temperature", "°C", "degrees"))
+
+
+HEADER = b"\x5A\x01"
+COMMAND = base.Cmd(b"", HEADER, 8)
+
+
+@pytest.mark.parametrize(
+    "hex,error",
+    [
+        pytest.param("5A01FA00160010A5", None, id="valid"),
+        pytest.param("5A02FA00160010A5", WrongMessageFormat, id="header"),
+        pytest.param("5A01FA00160010A6", WrongMessageFormat, id="tail"),
+        pytest.param("5A01FA0016A5", WrongMessageFormat, id="length"),
+        pytest.param("5A01FA00160011A5", WrongMessageChecksum, id="checksum"),
+        pytest.param("5A01000000000000A5", WrongMessageFormat, id="long"),
+        pytest.param("5A0100000000" + "00A5", SensorWarmingUp, id="empty"),
+    ],
+)
+def test_message(hex, error):
+    message = bytes.fromhex(hex)
+    if error is None:
+        assert Message.decode(message, COMMAND) == (250, 22)
+        assert Message.encode((250, 22), COMMAND) == message
+    else:
+        with pytest.raises(error):
+            Message.decode(message, COMMAND)
+
+
+def test_precompiled():
+    """slices on every subclass, and payload structs shared by payload length"""
+    assert Message._payload == slice(2, -2)
+    assert Message._struct(4) is Message._struct(4)
+    assert Message._structs is not sds01x.Message._structs
+
+    # mixed records
+    records = tuple(range(10)) + (-5, 11, 12)
+    payload = pms5003t.Message._pack(records)
+    assert len(payload) == 26
+    assert pms5003t.Message._unpack(payload) == records
+
+
+def test_obsdata():
+    obs = ObsData(1_600_000_000, 250, 22)
+    assert obs.pm25 == 25
+    assert obs.csv_header() == "time, pm25, temp"
+    assert f"{obs:csv}" == "1600000000, 25.0, 22.0"
+    assert f"{obs:pm}".endswith(": PM2.5 25.0, temperature 22.0")
+
+    assert f"{hpma115c0.ObsData(1_600_000_000, 1, 2, 3, 4):pm}".endswith(
+        ": PM1 1.0, PM2.5 2.0, PM4 3.0, PM10 4.0 ug/m3"
+    )
+    assert sds01x.ObsData(0, 9, 12).pm10 == 1.2
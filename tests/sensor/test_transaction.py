@@ -0,0 +1,148 @@
+import os
+import struct
+from typing import Dict, List
+
+import pytest
+
+os.environ["LEVEL"] = "DEBUG"
+from pms import MissingAnswer
+from pms.sensor import Sensor, SensorReader
+from pms.sensor.base import Cmd
+from pms.sensor.novafitness import extra_commands as SDS
+from pms.sensor.simulator import SimulatedSensor, SimulatedSerial
+from pms.sensor.transaction import Transport
+
+
+class ScriptedSerial:
+    """answer each write with the next scripted answer, nothing when the script runs out"""
+
+    def __init__(self, script: Dict[bytes, List[bytes]], noise: bytes = b"") -> None:
+        self.script = script
+        self.input = bytearray(noise)
+        self.writes: List[bytes] = []
+        self.timeout = 0.05
+
+    def write(self, data: bytes) -> int:
+        self.writes.append(data)
+        answers = self.script.get(data, [])
+        if answers:
+            self.input += answers.pop(0)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        self.input.clear()
+
+    @property
+    def in_waiting(self) -> int:
+        return len(self.input)
+
+    def readinto(self, buffer) -> int:
+        n = min(len(buffer), len(self.input))
+        buffer[:n] = self.input[:n]
+        del self.input[:n]
+        return n
+
+
+PMS = Sensor.PMSx003.Commands
+FRAME = bytes.fromhex("424d001c0005000d00160005000d001602fd00fc001d000f00060006970003c5")
+SLEEP_ACK = bytes.fromhex("424d0004e4000177")
+
+
+@pytest.mark.parametrize(
+    "noise",
+    [
+        pytest.param(b"", id="clean"),
+        pytest.param(b"\x00\x42\xff", id="noise"),
+        pytest.param(SLEEP_ACK, id="late answer"),
+    ],
+)
+def test_request(noise):
+    serial = ScriptedSerial({PMS.passive_read.command: [FRAME]}, noise)
+    transport = Transport(serial, Sensor.PMSx003, buffer_size=8)
+    assert transport.request(PMS.passive_read) == FRAME
+    assert serial.in_waiting == 0
+
+
+def test_retry():
+    serial = ScriptedSerial({PMS.passive_read.command: [b"", FRAME]})
+    transport = Transport(serial, Sensor.PMSx003, retries=2, backoff=0.01)
+    assert transport.request(PMS.passive_read) == FRAME
+    assert serial.writes == [PMS.passive_read.command] * 2
+
+    with pytest.raises(MissingAnswer):
+        transport.request(PMS.passive_read, retries=1)
+    assert len(serial.writes) == 4
+
+    # no retries by default
+    with pytest.raises(MissingAnswer):
+        Transport(serial, Sensor.PMSx003).request(PMS.passive_read, timeout=0.01)
+    assert len(serial.writes) == 5
+
+
+def sds_read(device: int) -> Cmd:
+    return Cmd(SDS._msg(0xB4, "04" + "00" * 12, device), b"\xAA\xC0", 10)
+
+
+def sds_answer(device: int, pm25: int) -> bytes:
+    payload = struct.pack("<HH", pm25, pm25 * 2) + device.to_bytes(2, "big")
+    return Sensor.SDS01x.Message._encode(b"\xAA\xC0", payload)
+
+
+def test_pipeline():
+    """answers from a shared bus, out of order and with an answer to another device"""
+    devices = [0xA001, 0xA002, 0xA003]
+    serial = ScriptedSerial({})
+    serial.input += sds_answer(0xB000, 1) + sds_answer(0xA002, 20) + sds_answer(0xA001, 10)
+    transport = Transport(serial, Sensor.SDS01x, retries=0)
+    answers = transport.pipeline([sds_read(device) for device in devices])
+    assert answers == [sds_answer(0xA001, 10), sds_answer(0xA002, 20), None]
+    assert Sensor.SDS01x.decode(answers[0], time=1).pm25 == 1.0
+
+
+def test_zero_copy():
+    """answers are slices of the receive buffer, a full buffer is replaced, not overwritten"""
+    devices = [0xA001, 0xA002, 0xA003]
+    serial = ScriptedSerial({})
+    serial.input += b"".join(sds_answer(device, 10) for device in devices)
+    transport = Transport(serial, Sensor.SDS01x, retries=0, buffer_size=16)
+    answers = transport.pipeline([sds_read(device) for device in devices])
+    assert all(type(answer) is memoryview for answer in answers)
+    assert answers == [sds_answer(device, 10) for device in devices]
+
+    # the next transaction reuses the buffer
+    buffer = transport._buffer
+    serial.input += sds_answer(0xA001, 20)
+    assert transport.request(sds_read(0xA001)) == sds_answer(0xA001, 20)
+    assert transport._buffer is buffer
+
+
+def test_acknowledgement():
+    """command code echoed on the acknowledgement"""
+    sleep, period = Sensor.SDS01x.Commands.sleep, SDS.work_period(5)
+    ack = Sensor.SDS01x.Message._encode(b"\xAA\xC5", period.command[2:8])
+    serial = ScriptedSerial({period.command: [ack]})
+    transport = Transport(serial, Sensor.SDS01x, retries=0)
+    with pytest.raises(MissingAnswer):
+        transport.request(sleep)
+    assert transport.request(period) == ack
+
+
+def test_stuffed_frame():
+    """SPS30 answers are longer than answer_length when byte-stuffed"""
+    cmd = Sensor.SPS30.Commands.passive_read
+    frame = Sensor.SPS30.Message.encode((15.875,) * 10, cmd)  # 0x417E0000
+    assert len(frame) > cmd.answer_length
+    transport = Transport(ScriptedSerial({cmd.command: [frame]}), Sensor.SPS30)
+    assert transport.request(cmd) == frame
+
+
+@pytest.mark.parametrize("sensor", [s.name for s in Sensor])
+def test_reader_setup(sensor):
+    """every sensor is recognized, including those with acknowledgements to the setup"""
+    reader = SensorReader(sensor, samples=2)
+    reader.serial = SimulatedSerial(SimulatedSensor(sensor, period=0.01, seed=0))
+    with reader:
+        assert len(list(reader())) == 2
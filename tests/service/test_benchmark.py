@@ -0,0 +1,43 @@
+import os
+import threading
+
+import pytest
+
+os.environ["LEVEL"] = "DEBUG"
+from pms.service.benchmark import Report, bench_bridge, bench_mqtt, percentiles
+
+
+def test_percentiles():
+    data = [n / 100 for n in range(100)]
+    assert percentiles(data, 50, 90, 99) == (0.5, 0.9, 0.99)
+    assert percentiles([], 50) == (0.0,)
+
+
+def test_report():
+    report = Report("mqtt", 100, 2.0, (0.001, 0.002, 0.003), 40.0)
+    assert report.rate == 50
+    assert str(report) == (
+        "mqtt: 100 messages in 2.00 s (50 msg/s), "
+        "latency p50/p90/p99 1.0/2.0/3.0 ms, peak RSS 40.0 MB"
+    )
+
+
+@pytest.mark.parametrize("sensor,fields", [("PMSx003", 3), ("SDS01x", 2)])
+def test_bench_mqtt(sensor, fields):
+    pytest.importorskip("paho.mqtt")
+    report = bench_mqtt(sensor, 20, timeout=10, trace_memory=True)
+    # observations, metadata on connect and $online
+    assert report.messages == 20 * fields + 4 * fields + 1
+    assert report.seconds > 0
+    assert 0 < report.latency[0] <= report.latency[1] <= report.latency[2]
+    assert report.peak_traced > 0
+
+
+def test_bench_bridge():
+    pytest.importorskip("paho.mqtt")
+    pytest.importorskip("influxdb")
+    report = bench_bridge(20, rate=200, timeout=10)
+    assert not any(thread.name == "bridge" for thread in threading.enumerate())
+    assert report.messages == 20
+    assert report.seconds >= 19 / 200
+    assert 0 < report.latency[0] <= report.latency[1] <= report.latency[2]
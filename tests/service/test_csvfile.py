@@ -0,0 +1,135 @@
+import os
+from datetime import datetime
+
+import pytest
+
+os.environ["LEVEL"] = "DEBUG"
+from pms.sensor.plantower import pmsx003
+from pms.sensor.reader import RawData
+from pms.sensor.compression import Compression
+from pms.service.csvfile import CSVFile, Rotation
+
+secs = int(datetime(2020, 9, 27, 12).timestamp())
+
+
+def observations(n: int, step: int = 60):
+    return [pmsx003.ObsData(secs + t * step, *range(t, t + 12)) for t in range(n)]
+
+
+def expected(obs):
+    return "".join(f"{o:csv}\n" for o in obs)
+
+
+def test_formatter():
+    for obs in observations(3):
+        assert obs.csv_formatter()(obs) == f"{obs:csv}"
+    assert pmsx003.ObsData.csv_header() == f"{obs:header}"
+
+
+def test_flush(tmp_path):
+    path = tmp_path / "test.csv"
+    obs = observations(5)
+    with CSVFile(path, flush_every=3) as csv:
+        for o in obs[:2]:
+            csv(o)
+        assert path.read_text() == ""
+        csv(obs[2])
+        assert path.read_text() == f"{obs[0]:header}\n" + expected(obs[:3])
+        for o in obs[3:]:
+            csv(o)
+    assert path.read_text() == f"{obs[0]:header}\n" + expected(obs)
+
+    # append without header, overwrite with header
+    with CSVFile(path, fsync_every=1) as csv:
+        csv(obs[0])
+    assert path.read_text() == f"{obs[0]:header}\n" + expected(obs + obs[:1])
+    with CSVFile(path, overwrite=True) as csv:
+        csv(obs[0])
+    assert path.read_text() == f"{obs[0]:header}\n" + expected(obs[:1])
+
+
+def test_capture(tmp_path):
+    path = tmp_path / "test.csv"
+    raw = [RawData(secs + t, bytes([t, 0xAB])) for t in range(3)]
+    with CSVFile(path, capture="PMSx003") as csv:
+        for r in raw:
+            csv(r)
+    assert path.read_text().splitlines() == [
+        "time,sensor,hex",
+        f"{secs},PMSx003,00ab",
+        f"{secs+1},PMSx003,01ab",
+        f"{secs+2},PMSx003,02ab",
+    ]
+
+
+@pytest.mark.parametrize("dir", [True, False], ids=["directory", "file"])
+def test_rotate_daily(tmp_path, dir):
+    path = tmp_path if dir else tmp_path / "test.csv"
+    obs = observations(4, step=8 * 3600)  # 12:00, 20:00, 04:00(+1), 12:00(+1)
+    with CSVFile(path, rotate=Rotation.daily) as csv:
+        for o in obs:
+            csv(o)
+
+    name = "pypms.csv" if dir else "test.csv"
+    day1, day2 = (tmp_path / f"{o.date:%F}_{name}" for o in obs[::2])
+    assert day1.read_text() == f"{obs[0]:header}\n" + expected(obs[:2])
+    assert day2.read_text() == f"{obs[0]:header}\n" + expected(obs[2:])
+    assert sorted(tmp_path.iterdir()) == [day1, day2]
+
+
+def test_rotate_size(tmp_path):
+    path = tmp_path / "test.csv"
+    obs = observations(5)
+    header = f"{obs[0]:header}\n"
+    max_bytes = len(header) + len(expected(obs[:2]))
+    with CSVFile(path, rotate=Rotation.size, max_bytes=max_bytes, flush_every=10) as csv:
+        for o in obs:
+            csv(o)
+
+    assert (tmp_path / "test.1.csv").read_text() == header + expected(obs[:2])
+    assert (tmp_path / "test.2.csv").read_text() == header + expected(obs[2:4])
+    assert path.read_text() == header + expected(obs[4:])
+
+
+@pytest.mark.parametrize("compression", [c for c in Compression if c != Compression.none])
+def test_compression(tmp_path, compression):
+    if compression in [Compression.zstd, Compression.lz4]:
+        pytest.importorskip({"zstd": "zstandard", "lz4": "lz4"}[compression.value])
+
+    def read(path):
+        with path.open("rb") as raw:
+            assert Compression.detect(raw) == compression
+            with compression.open(raw, "rb") as file:
+                return file.read().decode()
+
+    path = tmp_path / "test.csv"
+    obs = observations(5)
+    header = f"{obs[0]:header}\n"
+    max_bytes = len(header) + len(expected(obs[:2]))
+    with CSVFile(path, rotate=Rotation.size, max_bytes=max_bytes, compression=compression) as csv:
+        for o in obs[:3]:
+            csv(o)
+
+    # append to the compressed file, as a new compressed stream
+    with CSVFile(path, rotate=Rotation.size, max_bytes=max_bytes, compression=compression) as csv:
+        for o in obs[3:]:
+            csv(o)
+
+    names = ["test.1.csv", "test.2.csv", "test.csv"]
+    assert sorted(p.name for p in tmp_path.iterdir()) == [n + compression.suffix for n in names]
+    for name, rows in zip(names, [obs[:2], obs[2:4], obs[4:]]):
+        assert read(tmp_path / f"{name}{compression.suffix}") == header + expected(rows)
+
+
+def test_flags(tmp_path):
+    from pms.pipeline.qc import QualityControl
+
+    path = tmp_path / "test.csv"
+    qc = QualityControl("PMSx003", ranges={"pm25": [0, 2]})
+    obs = [qc(o) for o in observations(4)]
+    with CSVFile(path, flags=True) as csv:
+        for o in obs:
+            csv(o)
+    assert path.read_text().splitlines() == [f"{obs[0]:header}, flags"] + [
+        f"{o:csv}, {'pm25:range' if o.pm25 > 2 else ''}" for o in obs
+    ]
@@ -0,0 +1,120 @@
+import os
+import pickle
+import threading
+import pytest
+
+os.environ["LEVEL"] = "DEBUG"
+from pms.sensor.novafitness import sds01x
+from pms.service.fanout import FanOut, Overflow, SinkWorker
+
+
+def observations(n: int, secs: int = 1_567_201_793):
+    return [sds01x.ObsData(secs + t, t * 10, t * 20) for t in range(n)]
+
+
+def test_fanout():
+    a, b = [], []
+    with FanOut(SinkWorker("a", a.append), SinkWorker("b", b.append, maxsize=1)) as fanout:
+        fanout.feed(observations(20))
+    assert a == b == observations(20)
+
+
+def test_sink_error():
+    def sink(obs):
+        raise RuntimeError("sink failure")
+
+    ok = []
+    with FanOut(SinkWorker("bad", sink), SinkWorker("ok", ok.append)) as fanout:
+        fanout.feed(observations(5))
+    assert ok == observations(5)
+
+
+@pytest.mark.parametrize(
+    "overflow,expected",
+    [
+        pytest.param(Overflow.drop, [0, 7, 8, 9], id="drop oldest"),
+        pytest.param(Overflow.spill, list(range(10)), id="spill to disk"),
+    ],
+)
+def test_overflow(overflow, expected, tmp_path):
+    """block the sink on the first observation, while the queue overflows"""
+    release = threading.Event()
+    data = []
+
+    def sink(obs):
+        release.wait()
+        data.append(obs)
+
+    worker = SinkWorker("slow", sink, maxsize=3, overflow=overflow, spill_dir=tmp_path)
+    obs = observations(10)
+    worker.start()
+    worker.put(obs[0])
+    while not worker.queue.empty():  # wait until the worker is stuck on obs[0]
+        pass
+    for o in obs[1:]:
+        worker.put(o)
+    release.set()
+    worker.close()
+
+    assert data == [obs[n] for n in expected]
+    assert worker.dropped == 10 - len(expected)
+    assert not list(tmp_path.iterdir())
+
+
+def test_spill_rotation(tmp_path):
+    """spill files rotate as they grow, and are read back a queue size at a time"""
+    worker = SinkWorker("slow", print, maxsize=2, overflow=Overflow.spill, spill_dir=tmp_path)
+    worker.segment_size = 1  # a spill file per observation
+    obs = observations(7)
+    for o in obs:
+        worker.put(o)
+    assert worker.spilled == 5 and len(list(tmp_path.iterdir())) == 5
+
+    assert worker._unspill() == obs[2:4]
+    assert worker.spilled == 3 and len(list(tmp_path.iterdir())) == 3
+    assert worker._unspill() == obs[4:6]
+    assert worker._unspill() == obs[6:]
+    assert worker._unspill() == []
+    assert not list(tmp_path.iterdir())
+    worker.close()
+    assert not list(tmp_path.iterdir())
+
+
+def test_spill_unlocked(monkeypatch, tmp_path):
+    """new observations spill while the worker reads the spill back"""
+    worker = SinkWorker("slow", print, maxsize=1, overflow=Overflow.spill, spill_dir=tmp_path)
+    obs = observations(4)
+    for o in obs[:3]:
+        worker.put(o)
+    load = pickle.load
+
+    def put_and_load(f):
+        monkeypatch.undo()
+        put = threading.Thread(target=worker.put, args=(obs[3],))
+        put.start()
+        put.join(1)
+        assert not put.is_alive(), "put waits for the spill read back"
+        return load(f)
+
+    monkeypatch.setattr(pickle, "load", put_and_load)
+    assert worker._unspill() == obs[1:2]
+    assert worker._unspill() == obs[2:3]
+    assert worker._unspill() == obs[3:]
+    assert worker.spilled == 0
+    worker.close()
+    assert not list(tmp_path.iterdir())
+
+
+def test_hung_sink(monkeypatch):
+    """closing does not wait forever for a hung sink"""
+    monkeypatch.setattr(SinkWorker, "close_timeout", 0.1)
+    hang = threading.Event()
+    ok = []
+    hung = SinkWorker("hung", lambda obs: hang.wait(), maxsize=1)
+    with FanOut(hung, SinkWorker("ok", ok.append)) as fanout:
+        fanout.feed(observations(2))
+    assert hung.is_alive()
+    assert ok == observations(2)
+    hang.set()
+    hung.close(1)
+    assert not hung.is_alive()
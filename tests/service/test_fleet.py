@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import pytest
+
+os.environ["LEVEL"] = "DEBUG"
+from pms.sensor import SensorReader
+from pms.sensor.simulator import Fault, PseudoTerminal, SimulatedSensor
+from pms.service.fleet import Fleet, Station, check, load
+
+
+@pytest.fixture
+def ptys():
+    with PseudoTerminal(SimulatedSensor("PMSx003", seed=0)) as a, PseudoTerminal(
+        SimulatedSensor("SDS01x", seed=1)
+    ) as b:
+        yield a, b
+
+
+def config(a: str, b: str, tmp_path, **sinks):
+    return {
+        "sensors": {
+            "a": {
+                "model": "PMSx003",
+                "port": a,
+                "interval": 0,
+                "sinks": dict(csv={"type": "csv", "path": str(tmp_path / "a.csv")}, **sinks),
+            },
+            "b": {
+                "model": "SDS01x",
+                "port": b,
+                "interval": 0,
+                "sinks": {"csv": {"type": "csv", "path": str(tmp_path / "b.csv")}},
+            },
+        }
+    }
+
+
+def wait_for(path, lines: int = 3, timeout: float = 5) -> None:
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if path.exists() and len(path.read_text().splitlines()) >= lines:
+            return
+        time.sleep(0.05)
+    raise TimeoutError(f"{path} has less than {lines} lines")  # pragma: no cover
+
+
+def test_reload(ptys, tmp_path):
+    a, b = ptys
+    with Fleet() as fleet:
+        fleet.apply(config(a.port, b.port, tmp_path))
+        assert fleet.running
+        wait_for(tmp_path / "a.csv")
+        wait_for(tmp_path / "b.csv")
+        station_a, station_b = fleet.stations["a"], fleet.stations["b"]
+        thread_a, thread_b = station_a.thread, station_b.thread
+        csv_b = station_b.sinks["csv"]
+
+        # add a sink to sensor a and samples to sensor b
+        new = config(a.port, b.port, tmp_path, extra={"type": "csv", "path": str(tmp_path / "x")})
+        new["sensors"]["b"]["samples"] = 1000
+        fleet.apply(new)
+        assert station_a.thread is thread_a, "serial session unchanged"
+        assert station_b.thread is not thread_b, "reader restarted"
+        assert station_b.sinks["csv"] is csv_b, "sink unchanged"
+        wait_for(tmp_path / "x")
+
+        # remove sensor b
+        del new["sensors"]["b"]
+        fleet.apply(new)
+        assert list(fleet.stations) == ["a"]
+        assert not thread_b.is_alive()
+        assert not b.sensor.awake, "sensor sleeps"
+
+    assert not thread_a.is_alive()
+    assert not a.sensor.awake
+
+
+def test_pipeline(ptys, tmp_path):
+    a, b = ptys
+    path = tmp_path / "calibration.json"
+    path.write_text(json.dumps([{"sensor": "PMSx003", "pm25": [0, 0]}]))
+    with Fleet() as fleet:
+        fleet.apply(config(a.port, b.port, tmp_path))
+        wait_for(tmp_path / "a.csv")
+        station = fleet.stations["a"]
+        thread = station.thread
+
+        new = config(a.port, b.port, tmp_path)
+        new["sensors"]["a"]["pipeline"] = [{"stage": "calibration", "path": str(path)}]
+        fleet.apply(new)
+        assert station.thread is thread
+        assert len(station.pipeline.stages) == 1
+        simulated = SimulatedSensor("PMSx003", seed=0)
+        obs = simulated.sensor.decode(simulated.message(), time=0)
+        assert station.pipeline.process(obs).pm25 == 0
+        assert fleet.stations["b"].humidity == []
+
+        # humidity from the co-located sensor b
+        new = config(a.port, b.port, tmp_path)
+        new["sensors"]["a"]["pipeline"] = [
+            {"stage": "calibration", "path": str(path), "humidity": "b"}
+        ]
+        fleet.apply(new)
+        assert fleet.stations["b"].humidity == station.pipeline.stages
+
+
+@pytest.mark.parametrize(
+    "sensor",
+    [
+        pytest.param(
+            {"pipeline": [{"stage": "calibration", "path": "/missing/calibration.json"}]},
+            id="stage",
+        ),
+        pytest.param({"sinks": {"x": {"type": "csv", "path": "/missing/x.csv"}}}, id="sink"),
+    ],
+)
+def test_reload_error(ptys, tmp_path, sensor):
+    """keep the running config when a stage or sink fails to start, and retry on reload"""
+    a, b = ptys
+    with Fleet() as fleet:
+        old = config(a.port, b.port, tmp_path)
+        fleet.apply(old)
+        station = fleet.stations["a"]
+        thread, sinks = station.thread, station.sinks
+
+        new = config(a.port, b.port, tmp_path)
+        new["sensors"]["a"].update(sensor, samples=1000)  # restart the reader
+        with pytest.raises(OSError):
+            fleet.apply(new)
+        assert station.config == old["sensors"]["a"]
+        assert station.thread is thread and station.running
+        assert station.sinks == sinks
+        wait_for(tmp_path / "a.csv")
+
+        with pytest.raises(OSError):
+            fleet.apply(new)
+
+
+def supervise(fleet, until, timeout: float = 10):
+    end = time.monotonic() + timeout
+    while not until():
+        assert time.monotonic() < end, "timeout"
+        fleet.supervise()
+        time.sleep(0.05)
+
+
+def test_restart(monkeypatch, ptys, tmp_path):
+    """failed readers restart with backoff, while the other sensors keep going"""
+    monkeypatch.setattr(Station, "backoff", (0.05, 0.1))
+    a, b = ptys
+    with Fleet() as fleet:
+        fleet.apply(config(str(tmp_path / "ttyMissing"), b.port, tmp_path))
+        station = fleet.stations["a"]
+        supervise(fleet, lambda: station.failures >= 3)
+        assert fleet.running
+        wait_for(tmp_path / "b.csv")
+
+        # the port shows up
+        (tmp_path / "ttyMissing").symlink_to(a.port)
+        supervise(fleet, lambda: station.failures == 0 and station.running)
+        wait_for(tmp_path / "a.csv")
+
+
+def test_stall(monkeypatch, tmp_path):
+    """readers without observations are aborted and restarted"""
+    monkeypatch.setattr(Station, "stall", 0.2)
+    monkeypatch.setattr(Station, "backoff", (0.05, 0.1))
+    monkeypatch.setattr(SensorReader, "warmup_poll", 0.05)
+    with PseudoTerminal(SimulatedSensor("SDS01x", faults={Fault.warmup: 1.0})) as pty:
+        with Fleet() as fleet:
+            fleet.apply({"sensors": {"a": {"model": "SDS01x", "port": pty.port, "interval": 0}}})
+            station = fleet.stations["a"]
+            thread = station.thread
+            supervise(fleet, lambda: station.thread is not thread and station.running)
+            assert station.failures == 1
+
+
+def test_stop_stuck(monkeypatch):
+    """stopping a stuck reader aborts it after the grace period, not after the stall"""
+    monkeypatch.setattr(Station, "grace", 0.2)
+    monkeypatch.setattr(SensorReader, "warmup_poll", 0.05)
+    with PseudoTerminal(SimulatedSensor("SDS01x", faults={Fault.warmup: 1.0})) as pty:
+        with Fleet() as fleet:
+            fleet.apply({"sensors": {"a": {"model": "SDS01x", "port": pty.port, "interval": 0}}})
+            station = fleet.stations["a"]
+            start = time.monotonic()
+            station.stop()
+            assert time.monotonic() - start < 2
+            assert station.thread is None and station.restart_at is None
+
+
+@pytest.mark.parametrize(
+    "sensor,error",
+    [
+        pytest.param({"model": "PMS1234"}, "a: unknown sensor model PMS1234", id="model"),
+        pytest.param({"baud": 9600}, "a: unknown options baud", id="option"),
+        pytest.param(
+            {"pipeline": [{"stage": "median"}]}, "a: unknown pipeline stage median", id="stage"
+        ),
+        pytest.param({"sinks": {"x": {"type": "ftp"}}}, "a/x: unknown sink type ftp", id="sink"),
+        pytest.param(
+            {"pipeline": [{"stage": "calibration", "humidity": "b"}]},
+            "a: unknown humidity sensor b",
+            id="humidity",
+        ),
+    ],
+)
+def test_check(sensor, error):
+    with pytest.raises(ValueError) as e:
+        check({"sensors": {"a": sensor}})
+    assert str(e.value) == error
+
+
+def test_load(tmp_path):
+    path = tmp_path / "fleet.json"
+    path.write_text(json.dumps({"sensors": {"a": {"model": "SDS01x"}}}))
+    assert load(path) == {"sensors": {"a": {"model": "SDS01x"}}}
+
+    path.write_text(json.dumps({"sinks": {}}))
+    with pytest.raises(ValueError):
+        load(path)
@@ -0,0 +1,110 @@
+import os
+import json
+import socket
+import time
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import pytest
+
+os.environ["LEVEL"] = "DEBUG"
+from pms.sensor.novafitness import sds01x
+from pms.service.http import Recent, Server, shared
+
+
+def get(server: Server, path: str):
+    with urlopen(f"http://127.0.0.1:{server.port}{path}", timeout=5) as answer:
+        return json.load(answer)
+
+
+@pytest.fixture
+def server():
+    with Server("127.0.0.1", 0, size=3) as server:
+        for t in range(4):
+            server.publish("a", sds01x.ObsData(60 * t, 10 * t, 20 * t))
+        yield server
+
+
+def test_latest(server):
+    assert get(server, "/sensors") == {
+        "a": {"time": 180, "units": {"pm25": "ug/m3", "pm10": "ug/m3"}}
+    }
+    assert get(server, "/sensors/a") == {"time": 180, "pm25": 3.0, "pm10": 6.0}
+
+
+def test_flags(server):
+    from pms.pipeline.qc import QualityControl
+
+    obs = QualityControl("SDS01x", ranges={"pm25": [0, 1]})(sds01x.ObsData(240, 40, 80))
+    server.publish("a", obs)
+    assert get(server, "/sensors/a") == {
+        "time": 240,
+        "pm25": 4.0,
+        "pm10": 8.0,
+        "flags": ["pm25:range"],
+    }
+    assert get(server, "/sensors/a/window?seconds=60")["pm25"]["max"] == 4.0
+
+
+@pytest.mark.parametrize(
+    "seconds,pm25",
+    [
+        pytest.param(60, dict(count=1, mean=3.0, min=3.0, max=3.0), id="latest"),
+        pytest.param(300, dict(count=3, mean=2.0, min=1.0, max=3.0), id="buffer"),
+    ],
+)
+def test_window(server, seconds, pm25):
+    assert get(server, f"/sensors/a/window?seconds={seconds}")["pm25"] == pm25
+
+
+@pytest.mark.parametrize(
+    "path,status",
+    [
+        pytest.param("/sensors/b", 404, id="sensor"),
+        pytest.param("/sensors/a/median", 404, id="endpoint"),
+        pytest.param("/sensors/a/window?seconds=x", 400, id="query"),
+        pytest.param("/sensors/a/window?seconds=0", 400, id="zero"),
+        pytest.param("/sensors/a/window?seconds=-5", 400, id="negative"),
+        pytest.param("/sensors/a/window?seconds=nan", 400, id="nan"),
+        pytest.param("/sensors/a/window?seconds=inf", 400, id="inf"),
+    ],
+)
+def test_errors(server, path, status):
+    with pytest.raises(HTTPError) as e:
+        get(server, path)
+    e.value.close()
+    assert e.value.code == status
+
+
+def test_empty_window():
+    recent = Recent(3)
+    recent.observations.append(sds01x.ObsData(240, 40, 80))
+    assert recent.window(0) == {}
+    assert recent.window(1)["pm25"]["count"] == 1
+
+
+def test_stream(server):
+    with socket.create_connection(("127.0.0.1", server.port), timeout=5) as client:
+        client.sendall(b"GET /sensors/a/stream HTTP/1.1\r\nHost: test\r\n\r\n")
+        stream = client.makefile("rb")
+        assert stream.readline().startswith(b"HTTP/1.1 200")
+        while stream.readline().strip():
+            pass  # headers
+
+        # wait for the client on the server
+        end = time.monotonic() + 5
+        while not server._streams and time.monotonic() < end:
+            time.sleep(0.01)
+        server.publish("b", sds01x.ObsData(240, 0, 0))  # other sensor, not sent
+        server.publish("a", sds01x.ObsData(240, 40, 80))
+        assert stream.readline() == b"event: a\n"
+        assert json.loads(stream.readline()[len("data: ") :]) == dict(time=240, pm25=4, pm10=8)
+        assert stream.readline() == b"\n"
+
+
+def test_shared():
+    with shared("127.0.0.1", 0) as a, shared("127.0.0.1", 0) as b:
+        assert a is b
+        a.sink("x")(sds01x.ObsData(0, 10, 20))
+        assert get(b, "/sensors/x")["pm25"] == 1
+    assert a._thread is None
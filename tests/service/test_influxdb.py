@@ -0,0 +1,158 @@
+import os
+import pytest
+
+os.environ["LEVEL"] = "DEBUG"
+from pms.service import influxdb
+
+
+def test_points():
+    written = []
+    points = influxdb.Points(lambda **point: written.append(point))
+    points(time=1, tags={"location": "a"}, data={"pm25": 10})
+    points(time=1, tags={"location": "a"}, data={"pm10": 20})
+    points(time=1, tags={"location": "b"}, data={"pm25": 11})
+    assert written == []
+
+    points(time=1, tags={"location": "a"}, data={"pm25": 12})  # repeated field
+    points(time=2, tags={"location": "a"}, data={"pm25": 13})  # later time
+    points.flush()
+    assert written == [
+        dict(time=1, tags={"location": "a"}, data={"pm25": 10, "pm10": 20}),
+        dict(time=1, tags={"location": "a"}, data={"pm25": 12}),
+        dict(time=1, tags={"location": "b"}, data={"pm25": 11}),  # older than the latest field
+        dict(time=2, tags={"location": "a"}, data={"pm25": 13}),
+    ]
+
+
+def test_points_order():
+    """points are written by time, also when fields arrive out of order"""
+    written = []
+    points = influxdb.Points(lambda **point: written.append((point["time"], point["tags"])))
+    points(time=5, tags={"location": "a"}, data={"pm25": 1})
+    points(time=3, tags={"location": "b"}, data={"pm25": 2})  # older, a waits
+    points(time=3, tags={"location": "a"}, data={"pm25": 3})  # older, a@5 written
+    assert written == [(5, {"location": "a"})]
+    points(time=4, tags={"location": "c"}, data={"pm25": 4})
+    assert written[1:] == [(3, {"location": "a"}), (3, {"location": "b"})]
+    points(time=6, tags={"location": "c"}, data={"pm25": 5})
+    assert written[3:] == [(4, {"location": "c"})]
+    assert list(points.pending) == [(("location", "c"),)]
+    assert len(points._times) == 1  # only the pending point, nothing left behind
+
+
+def bridge(monkeypatch, messages, **options):
+    """run the bridge over MQTT messages, and return the points written"""
+    from pms.service import cli
+
+    written = []
+    monkeypatch.setattr(cli, "client_pub", lambda **kwargs: lambda **point: written.append(point))
+
+    def client_sub(*, on_sensordata, **kwargs):
+        for data in messages:
+            on_sensordata(data)
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(cli, "client_sub", client_sub)
+    options.update(mqtt_topic="homie/+/+/+", mqtt_host="mqtt", mqtt_port=1883)
+    options.update(mqtt_user="", mqtt_pass="", db_host="influxdb", db_port=8086)
+    options.update(db_user="root", db_pass="root", db_name="homie")
+    with pytest.raises(KeyboardInterrupt):
+        cli.bridge(**options)
+    return written
+
+
+def test_bridge_flush(monkeypatch):
+    """the bridge writes the points still waiting for fields on shutdown"""
+    from pms.service.mqtt import Data
+
+    messages = [Data(1, "a", "pm25", 10), Data(1, "a", "pm10", 20)]
+    written = bridge(monkeypatch, messages, db_schema=influxdb.Schema.point, dedup=0)
+    assert written == [dict(time=1, tags={"location": "a"}, data={"pm25": 10, "pm10": 20})]
+
+
+@pytest.mark.parametrize("dedup", [0, 16], ids=["no-dedup", "dedup"])
+def test_bridge_gaps(monkeypatch, dedup):
+    """gaps are reported with and without dedup"""
+    from pms.pipeline.dedup import Gaps
+    from pms.service import cli
+    from pms.service.mqtt import Data
+
+    gaps = Gaps()
+    monkeypatch.setattr(cli, "Gaps", lambda: gaps)
+    messages = [Data(time, "a", "pm25", 10) for time in [60, 120, 180, 180, 480]]
+    written = bridge(monkeypatch, messages, db_schema=influxdb.Schema.field, dedup=dedup)
+    assert len(written) == (4 if dedup else 5)
+    assert [str(gap) for gap in gaps.gaps] == ["a/pm25 gap: 4 missing from 180 to 480"]
+
+
+@pytest.mark.parametrize(
+    "schema,lines",
+    [
+        pytest.param(
+            "field",
+            ["pm25,location=test value=10.0 60", "pm10,location=test value=20.0 60"],
+            id="field",
+        ),
+        pytest.param("point", ["observation,location=test pm10=20.0,pm25=10.0 60"], id="point"),
+    ],
+)
+def test_schema(schema, lines):
+    pytest.importorskip("influxdb")
+    from pms.sensor.novafitness import sds01x
+    from pms.service.standin import InfluxDBStub
+
+    with InfluxDBStub() as db:
+        publish = influxdb.publisher(
+            host=db.host,
+            port=db.port,
+            username="root",
+            password="root",
+            db_name="homie",
+            tags={"location": "test"},
+            schema=schema,
+        )
+        publish(sds01x.ObsData(60, 100, 200))
+        assert db.wait(len(lines))
+    assert [line for _, line in db.points] == lines
+
+
+@pytest.mark.parametrize(
+    "schema,lines",
+    [
+        pytest.param(
+            "field",
+            [
+                "pm25,location=test value=10.0 60",
+                "pm10,location=test value=20.0 60",
+                'flags,location=test value="pm25:range" 60',
+            ],
+            id="field",
+        ),
+        pytest.param(
+            "point",
+            ['observation,location=test flags="pm25:range",pm10=20.0,pm25=10.0 60'],
+            id="point",
+        ),
+    ],
+)
+def test_flags(schema, lines):
+    """QC flags are a string field, not a tag, so they do not add series"""
+    pytest.importorskip("influxdb")
+    from pms.pipeline.qc import QualityControl
+    from pms.sensor.novafitness import sds01x
+    from pms.service.standin import InfluxDBStub
+
+    obs = QualityControl("SDS01x", ranges={"pm25": [0, 1]})(sds01x.ObsData(60, 100, 200))
+    with InfluxDBStub() as db:
+        publish = influxdb.publisher(
+            host=db.host,
+            port=db.port,
+            username="root",
+            password="root",
+            db_name="homie",
+            tags={"location": "test"},
+            schema=schema,
+        )
+        publish(obs)
+        assert db.wait(len(lines))
+    assert [line for _, line in db.points] == lines
@@ -49,3 +49,94 @@ def test_decode_error(topic, payload, error, secs=1_567_201_793):
     with pytest.raises(Exception) as e:
         mqtt.Data.decode(topic, payload, time=secs)
     assert str(e.value) == error
+
+
+def test_topics():
+    assert mqtt.topics("SDS01x") == (
+        ("pm25", "pm25/concentration"),
+        ("pm10", "pm10/concentration"),
+    )
+    assert mqtt.homie("SDS01x")["pm25/$properties"] == "sensor,unit,concentration"
+
+
+@pytest.mark.parametrize(
+    "deadband,published",
+    [
+        pytest.param(None, [(10, 20), (10, 20.5), (11, 25)], id="every value"),
+        pytest.param(1.0, [(10, 20), (None, None), (None, 25)], id="all fields"),
+        pytest.param(dict(pm10=1.0), [(10, 20), (10, None), (11, 25)], id="by field"),
+    ],
+)
+def test_deadband(monkeypatch, deadband, published):
+    from pms.sensor.novafitness import sds01x
+
+    sent = []
+    monkeypatch.setattr("pms.service.mqtt.client_pub", lambda **kwargs: sent.append)
+    publish = mqtt.publisher(
+        topic="homie/test",
+        host="",
+        port=0,
+        username="",
+        password="",
+        sensor="SDS01x",
+        deadband=deadband,
+    )
+    for n, (pm25, pm10) in enumerate([(10, 20), (10, 20.5), (11, 25)]):
+        publish(sds01x.ObsData(n, pm25 * 10, pm10 * 10))
+    assert [(data.get("pm25/concentration"), data.get("pm10/concentration")) for data in sent] == [
+        values for values in published if values != (None, None)
+    ]
+
+
+def test_reconnect():
+    pytest.importorskip("paho.mqtt")
+    from pms.service.standin import MQTTBroker
+    from pms.sensor.novafitness import sds01x
+
+    with MQTTBroker(record=True) as broker:
+        publish = mqtt.publisher(
+            topic="homie/test",
+            host=broker.host,
+            port=broker.port,
+            username="",
+            password="",
+            sensor="SDS01x",
+        )
+        assert broker.wait(9)  # $online and metadata
+        publish(sds01x.ObsData(0, 100, 200))
+        assert broker.wait(11)
+    topics = {msg.topic for msg in broker.messages}
+    assert "homie/test/pm25/unit" in topics and "homie/test/pm25/concentration" in topics
+
+    # metadata again, on a new broker on the same address
+    with MQTTBroker(broker.host, broker.port, record=True) as broker:
+        assert broker.wait(1, topic="homie/test/pm10/unit", timeout=10)
+        assert broker.topics["homie/test/$online"] == 1
+
+
+@pytest.mark.parametrize(
+    "topic,route",
+    [
+        pytest.param("homie/test/pm10/concentration", ("test", "pm10"), id="data"),
+        pytest.param("homie/test/pm10/$type", None, id="system topic"),
+        pytest.param("homie/test/$online", None, id="short system topic"),
+        pytest.param("$SYS/broker/load/bytes", None, id="broker topic"),
+        pytest.param("homie/test/pm10", None, id="short topic"),
+        pytest.param("homie/test/pm10/concentration/x", None, id="long topic"),
+        pytest.param("other/test/pm10/concentration", None, id="other root"),
+        pytest.param("sensors/test/pm10/concentration", ("test", "pm10"), id="second filter"),
+        pytest.param("homie//pm10/concentration", ("", "pm10"), id="empty level"),
+    ],
+)
+def test_router(topic, route):
+    router = mqtt.Router("homie/+/+/+", "sensors/#")
+    assert router(topic) == route
+    assert router(topic) == route  # cached
+    assert router.dropped == (0 if route else 2)
+
+
+def test_router_cache():
+    router = mqtt.Router("homie/+/+/+", size=2)
+    for location in ["a", "b", "a", "c"]:
+        assert router(f"homie/{location}/pm10/concentration") == (location, "pm10")
+    assert list(router.routes) == [f"homie/{location}/pm10/concentration" for location in "ac"]
@@ -0,0 +1,130 @@
+import os
+import json
+import socket
+from urllib.request import Request, urlopen
+
+import pytest
+
+os.environ["LEVEL"] = "DEBUG"
+from pms.service import standin
+from pms.service.standin import InfluxDBStub, MQTTBroker, packet, string
+
+
+class Client:
+    """bare bones MQTT client"""
+
+    def __init__(self, broker: MQTTBroker, client_id: str, will: str = "") -> None:
+        self.sock = socket.create_connection((broker.host, broker.port), timeout=5)
+        flags, payload = 0x02, string(client_id)
+        if will:
+            flags |= 0x04 | 0x20
+            payload += string(will) + string("false")
+        self.send(standin.CONNECT, string("MQTT") + bytes([4, flags, 0, 60]) + payload)
+        assert self.read() == (standin.CONNACK, b"\x00\x00")
+
+    def __enter__(self) -> "Client":
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback) -> None:
+        self.sock.close()
+
+    def send(self, kind: int, body: bytes = b"", flags: int = 0) -> None:
+        self.sock.sendall(packet(kind, body, flags))
+
+    def read(self):
+        header, size = self.sock.recv(1)[0], self.sock.recv(1)[0]
+        body = b""
+        while len(body) < size:
+            body += self.sock.recv(size - len(body))
+        return header >> 4, body
+
+    def publish(self, topic: str, payload: str, qos: int = 0, retain: bool = False) -> None:
+        body = string(topic) + (b"\x00\x01" if qos else b"") + payload.encode()
+        self.send(standin.PUBLISH, body, qos << 1 | retain)
+        if qos == 1:
+            assert self.read() == (standin.PUBACK, b"\x00\x01")
+
+    def subscribe(self, *filters: str) -> None:
+        body = b"\x00\x02" + b"".join(string(f) + b"\x01" for f in filters)
+        self.send(standin.SUBSCRIBE, body, 0x02)
+        assert self.read() == (standin.SUBACK, b"\x00\x02" + bytes(len(filters)))
+
+    def message(self):
+        kind, body = self.read()
+        assert kind == standin.PUBLISH
+        size = int.from_bytes(body[:2], "big")
+        return body[2 : 2 + size].decode(), body[2 + size :].decode()
+
+
+@pytest.mark.parametrize(
+    "topic_filter,topic,match",
+    [
+        pytest.param("homie/+/+/+", "homie/test/pm25/concentration", True, id="+"),
+        pytest.param("homie/#", "homie/test/pm25/concentration", True, id="#"),
+        pytest.param("homie/#", "homie", True, id="# parent"),
+        pytest.param("homie/+/+/+", "homie/test/pm25", False, id="short"),
+        pytest.param("homie/+", "homie/test/pm25", False, id="long"),
+        pytest.param("#", "$SYS/uptime", False, id="system"),
+        pytest.param("$SYS/#", "$SYS/uptime", True, id="explicit system"),
+    ],
+)
+def test_matches(topic_filter, topic, match):
+    assert standin.matches(topic_filter, topic) == match
+
+
+def test_broker():
+    with MQTTBroker(record=True) as broker:
+        with Client(broker, "pub", will="homie/test/$online") as pub:
+            pub.publish("homie/test/pm25/concentration", "10", qos=1, retain=True)
+            pub.publish("homie/test/pm10/concentration", "20")
+
+            with Client(broker, "sub") as sub:
+                sub.subscribe("homie/+/+/+", "homie/test/pm01/#")
+                assert broker.wait(subscribers=1)
+                # retained messages on subscription
+                assert sub.message() == ("homie/test/pm25/concentration", "10")
+
+                pub.publish("homie/test/pm01/concentration", "5", qos=1)
+                assert sub.message() == ("homie/test/pm01/concentration", "5")
+
+                sub.send(standin.PINGREQ)
+                assert sub.read() == (standin.PINGRESP, b"")
+
+                # will message, published when the connection drops
+                pub.sock.close()
+                assert broker.wait(topic="homie/test/$online", published=1)
+                sub.subscribe("homie/test/$online")
+                assert sub.message() == ("homie/test/$online", "false")
+
+                sub.send(standin.DISCONNECT)
+                assert broker.wait(published=4)
+
+    assert [msg.topic for msg in broker.messages] == [
+        "homie/test/pm25/concentration",
+        "homie/test/pm10/concentration",
+        "homie/test/pm01/concentration",
+        "homie/test/$online",
+    ]
+    assert broker.topics["homie/test/pm25/concentration"] == 1
+
+
+def test_influxdb_stub():
+    with InfluxDBStub() as db:
+        url = f"http://{db.host}:{db.port}"
+
+        with urlopen(f"{url}/ping") as r:
+            assert r.status == 204
+
+        with urlopen(Request(f"{url}/query", b'q=CREATE+DATABASE+"homie"', method="POST")) as r:
+            assert json.load(r) == {"results": [{"statement_id": 0}]}
+        with urlopen(f"{url}/query?q=SHOW+DATABASES") as r:
+            series = json.load(r)["results"][0]["series"][0]
+            assert series["values"] == [["homie"]]
+
+        lines = "pm25,location=test value=10 1567201793\npm10,location=test value=20 1567201793"
+        with urlopen(Request(f"{url}/write?db=homie", lines.encode(), method="POST")) as r:
+            assert r.status == 204
+        assert db.wait(2)
+
+    assert [line for _, line in db.points] == lines.splitlines()
+    assert db.writes == 1